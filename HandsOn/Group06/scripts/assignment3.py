@@ -1,20 +1,30 @@
 """
 GTFS Madrid Dataset - Data Cleaning for RDF Transformation
 
-Prepares CSV files for RDF transformation by:
+Prepares the processed GTFS tables for RDF transformation by:
 1. Removing auto-increment indices
 2. Trimming all string columns
 3. Converting dates to ISO 8601 format (YYYYMMDD → YYYY-MM-DD)
-4. Creating local_areas.csv placeholder
+4. Creating local_areas placeholder
+
+With --normalized, routes/trips/stops/stop_times are cleaned separately
+(for the normalized RML mappings) instead of the merged df_final.
 
 Outputs:
-- Full datasets in data/processed/ with -updated.csv suffix
+- Full datasets in data/processed/ with -updated.parquet suffix
 - 500-row samples in csv/ for repository
 """
 
+import argparse
 from pathlib import Path
 
 import pandas as pd
+import pyarrow.parquet as pq
+
+from preprocessing import TIME_COLUMNS, format_gtfs_times, write_parquet_chunks
+
+CHUNK_SIZE = 1_000_000
+NORMALIZED_TABLES = ["routes", "trips", "stops", "stop_times"]
 
 
 def remove_auto_increment_index(df):
@@ -34,6 +44,23 @@ def trim_string_columns(df):
     """Trim whitespace from all string columns."""
     for col in df.select_dtypes(include=["object"]).columns:
         df[col] = df[col].str.strip()
+    for col in df.select_dtypes(include=["category"]).columns:
+        # Trim the categories, not every row
+        stripped = df[col].cat.categories.astype(str).str.strip()
+        if stripped.is_unique:
+            df[col] = df[col].cat.rename_categories(stripped)
+        else:
+            df[col] = df[col].astype(str).str.strip().astype("category")
+    return df
+
+
+def format_time_columns(df):
+    """HH:MM:SS strings (wrapped, for xsd:time) for the RML mapping, keeping
+    the unwrapped seconds in <name>_seconds columns."""
+    for column in TIME_COLUMNS:
+        if column in df.columns:
+            df[column.replace("_time", "_seconds")] = df[column]
+            df[column] = format_gtfs_times(df[column])
     return df
 
 
@@ -42,26 +69,51 @@ def convert_gtfs_date_to_iso(date_series):
     return pd.to_datetime(date_series, format="%Y%m%d").dt.strftime("%Y-%m-%d")
 
 
-def process_merged_dataset(input_dir, output_dir):
-    """Process the main merged GTFS dataset."""
-    df = pd.read_csv(input_dir / "df_final.csv", low_memory=False)
+def clean_table(input_file, output_file):
+    """Clean a (large) table one row group at a time; returns the row count."""
+    source = pq.ParquetFile(input_file)
 
-    # Remove auto-increment index if present
-    df = remove_auto_increment_index(df)
+    def chunks():
+        for batch in source.iter_batches(batch_size=CHUNK_SIZE):
+            df = batch.to_pandas()
 
-    # Trim all string columns
-    df = trim_string_columns(df)
+            # Remove auto-increment index if present
+            df = remove_auto_increment_index(df)
 
-    # Save
-    output_file = output_dir / "df_final-updated.csv"
-    df.to_csv(output_file, index=False)
+            # Trim all string columns
+            df = trim_string_columns(df)
+
+            # Times as xsd:time strings
+            yield format_time_columns(df)
+
+    return write_parquet_chunks(chunks(), output_file)
 
-    return df
+
+def process_merged_dataset(input_dir, output_dir):
+    """
+    Process the main merged GTFS dataset.
+
+    Returns the id columns of the output (enough for the summary).
+    """
+    output_file = output_dir / "df_final-updated.parquet"
+    clean_table(input_dir / "df_final.parquet", output_file)
+    return pd.read_parquet(output_file, columns=["route_id", "stop_id", "trip_id", "service_id"])
+
+
+def process_normalized_tables(input_dir, output_dir):
+    """
+    Process routes, trips, stops and stop_times separately, for the
+    normalized RML mappings (no merged dataset). Returns {table: rows}.
+    """
+    return {
+        name: clean_table(input_dir / f"{name}.parquet", output_dir / f"{name}-updated.parquet")
+        for name in NORMALIZED_TABLES
+    }
 
 
 def process_calendar(input_dir, output_dir):
-    """Process calendar.csv - convert dates to ISO 8601."""
-    df = pd.read_csv(input_dir / "calendar.csv")
+    """Process calendar.parquet - convert dates to ISO 8601."""
+    df = pd.read_parquet(input_dir / "calendar.parquet")
 
     # Trim strings
     df = trim_string_columns(df)
@@ -71,13 +123,13 @@ def process_calendar(input_dir, output_dir):
     df["end_date"] = convert_gtfs_date_to_iso(df["end_date"])
 
     # Save
-    df.to_csv(output_dir / "calendar-updated.csv", index=False)
+    df.to_parquet(output_dir / "calendar-updated.parquet", index=False)
     return df
 
 
 def process_calendar_dates(input_dir, output_dir):
-    """Process calendar_dates.csv - convert dates to ISO 8601."""
-    df = pd.read_csv(input_dir / "calendar_dates.csv")
+    """Process calendar_dates.parquet - convert dates to ISO 8601."""
+    df = pd.read_parquet(input_dir / "calendar_dates.parquet")
 
     # Trim strings
     df = trim_string_columns(df)
@@ -86,28 +138,28 @@ def process_calendar_dates(input_dir, output_dir):
     df["date"] = convert_gtfs_date_to_iso(df["date"])
 
     # Save
-    df.to_csv(output_dir / "calendar_dates-updated.csv", index=False)
+    df.to_parquet(output_dir / "calendar_dates-updated.parquet", index=False)
     return df
 
 
 def process_shapes(input_dir, output_dir):
-    """Process shapes.csv."""
-    df = pd.read_csv(input_dir / "shapes.csv")
+    """Process shapes.parquet."""
+    df = pd.read_parquet(input_dir / "shapes.parquet")
 
     # Trim strings
     df = trim_string_columns(df)
 
     # Save
-    df.to_csv(output_dir / "shapes-updated.csv", index=False)
+    df.to_parquet(output_dir / "shapes-updated.parquet", index=False)
     return df
 
 
 def create_local_areas_template(input_dir, output_dir):
     """
-    Create local_areas-updated.csv with placeholder columns.
+    Create local_areas-updated.parquet with placeholder columns.
     Will be filled by linking.py with Wikidata information.
     """
-    stops_df = pd.read_csv(input_dir / "stops.csv", usecols=["stop_id"])
+    stops_df = pd.read_parquet(input_dir / "stops.parquet", columns=["stop_id"])
     unique_stop_ids = (
         stops_df["stop_id"]
         .dropna()
@@ -125,31 +177,42 @@ def create_local_areas_template(input_dir, output_dir):
         }
     )
 
-    df_areas.to_csv(output_dir / "local_areas-updated.csv", index=False)
+    df_areas.to_parquet(output_dir / "local_areas-updated.parquet", index=False)
     return df_areas
 
 
 def create_sample_files(output_dir, csv_dir):
-    """Create 500-row sample files for repository."""
+    """Create 500-row sample files (CSV) for repository."""
     csv_dir.mkdir(exist_ok=True)
 
     files_to_sample = [
-        "df_final-updated.csv",
-        "calendar-updated.csv",
-        "calendar_dates-updated.csv",
-        "shapes-updated.csv",
-        "local_areas-updated.csv",
+        "df_final-updated",
+        *[f"{name}-updated" for name in NORMALIZED_TABLES],
+        "calendar-updated",
+        "calendar_dates-updated",
+        "shapes-updated",
+        "local_areas-updated",
     ]
 
-    for filename in files_to_sample:
-        input_file = output_dir / filename
+    for name in files_to_sample:
+        input_file = output_dir / f"{name}.parquet"
         if input_file.exists():
-            df = pd.read_csv(input_file)
-            df.head(500).to_csv(csv_dir / filename, index=False)
+            # Only the first rows are read
+            batch = next(pq.ParquetFile(input_file).iter_batches(batch_size=500), None)
+            if batch is not None:
+                batch.to_pandas().to_csv(csv_dir / f"{name}.csv", index=False)
 
 
 def main():
     """Main execution"""
+    parser = argparse.ArgumentParser(description="GTFS Madrid data cleaning")
+    parser.add_argument(
+        "--normalized",
+        action="store_true",
+        help="clean the normalized tables instead of df_final (see preprocessing.py --normalized)",
+    )
+    args = parser.parse_args()
+
     print("\n" + "=" * 70)
     print("DATA CLEANING & PREPARATION")
     print("=" * 70)
@@ -161,19 +224,24 @@ def main():
     csv_dir = base_dir / "csv"
 
     # Process all datasets
-    print("\n[1/6] Processing df_final.csv...")
-    df_merged = process_merged_dataset(input_dir, output_dir)
-    print(f"✓ Cleaned {len(df_merged):,} rows")
-
-    print("\n[2/6] Processing calendar.csv...")
+    if args.normalized:
+        print("\n[1/6] Processing routes, trips, stops and stop_times...")
+        table_rows = process_normalized_tables(input_dir, output_dir)
+        print(f"✓ Cleaned {', '.join(f'{name}: {rows:,}' for name, rows in table_rows.items())} rows")
+    else:
+        print("\n[1/6] Processing df_final.parquet...")
+        df_merged = process_merged_dataset(input_dir, output_dir)
+        print(f"✓ Cleaned {len(df_merged):,} rows")
+
+    print("\n[2/6] Processing calendar.parquet...")
     df_calendar = process_calendar(input_dir, output_dir)
     print(f"✓ Converted dates: {len(df_calendar):,} rows")
 
-    print("\n[3/6] Processing calendar_dates.csv...")
+    print("\n[3/6] Processing calendar_dates.parquet...")
     df_calendar_dates = process_calendar_dates(input_dir, output_dir)
     print(f"✓ Converted dates: {len(df_calendar_dates):,} rows")
 
-    print("\n[4/6] Processing shapes.csv...")
+    print("\n[4/6] Processing shapes.parquet...")
     df_shapes = process_shapes(input_dir, output_dir)
     print(f"✓ Cleaned {len(df_shapes):,} rows")
 
@@ -189,11 +257,17 @@ def main():
     print("\n" + "=" * 70)
     print("SUMMARY")
     print("=" * 70)
-    print(f"Routes:       {df_merged['route_id'].nunique():>10,}")
-    print(f"Stops:        {df_merged['stop_id'].nunique():>10,}")
-    print(f"Trips:        {df_merged['trip_id'].nunique():>10,}")
-    print(f"Stop-times:   {len(df_merged):>10,}")
-    print(f"Services:     {df_merged['service_id'].nunique():>10,}")
+    if args.normalized:
+        print(f"Routes:       {table_rows['routes']:>10,}")
+        print(f"Stops:        {table_rows['stops']:>10,}")
+        print(f"Trips:        {table_rows['trips']:>10,}")
+        print(f"Stop-times:   {table_rows['stop_times']:>10,}")
+    else:
+        print(f"Routes:       {df_merged['route_id'].nunique():>10,}")
+        print(f"Stops:        {df_merged['stop_id'].nunique():>10,}")
+        print(f"Trips:        {df_merged['trip_id'].nunique():>10,}")
+        print(f"Stop-times:   {len(df_merged):>10,}")
+        print(f"Services:     {df_merged['service_id'].nunique():>10,}")
     print("\n✓ Ready for linking.py")
     print("=" * 70)
 
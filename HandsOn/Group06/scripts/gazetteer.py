@@ -0,0 +1,232 @@
+"""
+Offline reverse geocoding of the bus stops with a local Wikidata gazetteer.
+
+linking.py used to ask Wikidata for the nearest item with coordinates (P625)
+within 10 km of every stop (one wikibase:around query each). The same
+answer can be computed locally: export the items of the area once (a few
+wikibase:box queries, one per tile) to a CSV gazetteer, then match all
+stops in one vectorized nearest-neighbour pass.
+
+The gazetteer is indexed on a regular grid over an equirectangular
+projection (km): items are sorted by cell and every cell is a slice
+[offsets[c], offsets[c + 1]) of that order. A stop is resolved by searching
+the (2k + 1)^2 cells around it, k = 1, 2, 4, ..., until its nearest
+candidate is within k cells (then nothing outside can be closer) or the
+search covers the 10 km radius.
+
+Export (once; linking.py --gazetteer then runs offline):
+    python scripts/gazetteer.py [--bbox W,S,E,N] [--output data/raw/wikidata_gazetteer.csv]
+"""
+
+import argparse
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from wikidata_linker import WIKIDATA_ENDPOINT, SPARQLWrapperBackend, TokenBucket
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+STOPS_INPUT = BASE_DIR / "data" / "processed" / "stops.parquet"
+GAZETTEER_FILE = BASE_DIR / "data" / "raw" / "wikidata_gazetteer.csv"
+
+EARTH_RADIUS_KM = 6371.0088
+CELL_KM = 0.5
+MAX_DISTANCE_KM = 10.0
+TILE_DEGREES = 0.1
+MARGIN_DEGREES = 0.1  # ~10 km around the stops
+
+BOX_QUERY = """
+SELECT ?item ?itemLabel ?coord WHERE {{
+  SERVICE wikibase:box {{
+    ?item wdt:P625 ?coord .
+    bd:serviceParam wikibase:cornerWest "Point({west} {south})"^^geo:wktLiteral .
+    bd:serviceParam wikibase:cornerEast "Point({east} {north})"^^geo:wktLiteral .
+  }}
+  SERVICE wikibase:label {{
+    bd:serviceParam wikibase:language "es,en" .
+  }}
+}}
+"""
+
+POINT = re.compile(r"Point\(([-+\d.eE]+) ([-+\d.eE]+)\)")
+
+
+class Gazetteer:
+    """Nearest gazetteer item of a set of coordinates (grid index)."""
+
+    def __init__(self, items, labels, lats, lons, cell_km=CELL_KM):
+        self.items = np.asarray(items, dtype=object)
+        self.labels = np.asarray(labels, dtype=object)
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        self.cell_km = cell_km
+        self.cos_lat = np.cos(np.radians(lats.mean())) if len(lats) else 1.0
+        self.x, self.y = self.project(lats, lons)
+
+        if len(self.x):
+            self.x0, self.y0 = self.x.min(), self.y.min()
+            cx, cy = self._cells(self.x, self.y)
+            self.nx, self.ny = int(cx.max()) + 1, int(cy.max()) + 1
+            cells = cx * self.ny + cy
+        else:
+            self.x0 = self.y0 = 0.0
+            self.nx = self.ny = 1
+            cells = np.zeros(0, dtype=np.int64)
+        self.order = np.argsort(cells, kind="stable")
+        self.offsets = np.r_[0, np.cumsum(np.bincount(cells, minlength=self.nx * self.ny))]
+
+    def __len__(self):
+        return len(self.items)
+
+    @classmethod
+    def from_csv(cls, path, cell_km=CELL_KM):
+        """Gazetteer CSV with item, label, lat, lon columns."""
+        df = pd.read_csv(path, dtype={"item": str, "label": str}).dropna(subset=["item", "lat", "lon"])
+        return cls(df["item"], df["label"].fillna(""), df["lat"], df["lon"], cell_km)
+
+    def project(self, lats, lons):
+        """Equirectangular projection (km), accurate at city scale."""
+        x = np.radians(np.asarray(lons, dtype=np.float64)) * EARTH_RADIUS_KM * self.cos_lat
+        y = np.radians(np.asarray(lats, dtype=np.float64)) * EARTH_RADIUS_KM
+        return x, y
+
+    def _cells(self, x, y):
+        cx = np.floor((x - self.x0) / self.cell_km).astype(np.int64)
+        cy = np.floor((y - self.y0) / self.cell_km).astype(np.int64)
+        return cx, cy
+
+    def _search(self, qx, qy, k):
+        """Nearest item in the (2k + 1)^2 cells around each point: (index, km)."""
+        n = len(qx)
+        best = np.full(n, -1, dtype=np.int64)
+        best_km = np.full(n, np.inf)
+
+        steps = np.arange(-k, k + 1)
+        cx, cy = self._cells(qx, qy)
+        ncx = (cx[:, None] + np.repeat(steps, len(steps))[None, :]).ravel()
+        ncy = (cy[:, None] + np.tile(steps, len(steps))[None, :]).ravel()
+        valid = (ncx >= 0) & (ncx < self.nx) & (ncy >= 0) & (ncy < self.ny)
+        cells = np.where(valid, ncx * self.ny + ncy, 0)
+        starts = self.offsets[cells]
+        counts = np.where(valid, self.offsets[cells + 1] - starts, 0)
+        if not counts.sum():
+            return best, best_km
+
+        # Flatten the candidate slices: owner point and item of each candidate
+        owner = np.repeat(np.arange(len(cells)) // len(steps) ** 2, counts)
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        candidates = self.order[np.repeat(starts, counts) + within]
+        km = np.hypot(self.x[candidates] - qx[owner], self.y[candidates] - qy[owner])
+
+        # Closest candidate per point
+        order = np.lexsort((km, owner))
+        owner, candidates, km = owner[order], candidates[order], km[order]
+        first = np.r_[True, owner[1:] != owner[:-1]]
+        best[owner[first]] = candidates[first]
+        best_km[owner[first]] = km[first]
+        return best, best_km
+
+    def nearest(self, lats, lons, max_km=MAX_DISTANCE_KM):
+        """Index of the nearest item within max_km of every point (-1: none) and its distance."""
+        qx, qy = self.project(lats, lons)
+        best = np.full(len(qx), -1, dtype=np.int64)
+        best_km = np.full(len(qx), np.inf)
+        pending = np.flatnonzero(np.isfinite(qx) & np.isfinite(qy))
+        k = 1
+        while len(pending) and len(self):
+            idx, km = self._search(qx[pending], qy[pending], k)
+            best[pending], best_km[pending] = idx, km
+            reach = k * self.cell_km
+            if reach >= max_km:
+                break
+            pending = pending[km > reach]
+            k *= 2
+        best[best_km > max_km] = -1
+        return best, np.where(best >= 0, best_km, np.nan)
+
+    def reverse_geocode(self, lats, lons, max_km=MAX_DISTANCE_KM):
+        """(area_name, area_code, wikidata_uri) arrays; empty strings where nothing is near."""
+        idx, _ = self.nearest(lats, lons, max_km)
+        found = idx >= 0
+        names = np.full(len(idx), "", dtype=object)
+        uris = np.full(len(idx), "", dtype=object)
+        names[found] = self.labels[idx[found]]
+        uris[found] = self.items[idx[found]]
+        codes = np.array([uri.rsplit("/", 1)[-1] for uri in uris], dtype=object)
+        return names, codes, uris
+
+
+def tiles(west, south, east, north, size=TILE_DEGREES):
+    """(west, south, east, north) tiles covering the box."""
+    for w in np.arange(west, east, size):
+        for s in np.arange(south, north, size):
+            yield round(w, 6), round(s, 6), round(min(w + size, east), 6), round(min(s + size, north), 6)
+
+
+def export_gazetteer(backend, bbox, output_file, rate=1.0, retries=2, timeout=60):
+    """
+    Items with coordinates inside bbox (one wikibase:box query per tile)
+    written to output_file; returns (items, failed tiles).
+    """
+    bucket = TokenBucket(rate)
+    rows, failed = [], 0
+    for west, south, east, north in tiles(*bbox):
+        query = BOX_QUERY.format(west=west, south=south, east=east, north=north)
+        for attempt in range(retries + 1):
+            bucket.acquire()
+            try:
+                bindings = backend.select(query, timeout)
+                break
+            except Exception as e:
+                print(f"⚠️  Tile {west},{south}: {type(e).__name__}: {e}")
+        else:
+            failed += 1
+            continue
+        for b in bindings:
+            match = POINT.search(b["coord"]["value"])
+            if match:
+                lon, lat = map(float, match.groups())
+                rows.append((b["item"]["value"], b.get("itemLabel", {}).get("value", ""), lat, lon))
+
+    df = pd.DataFrame(rows, columns=["item", "label", "lat", "lon"]).drop_duplicates()
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    df.to_csv(output_file, index=False)
+    return len(df), failed
+
+
+def stops_bbox(margin=MARGIN_DEGREES):
+    """Bounding box of the stops, widened by margin degrees."""
+    stops = pd.read_parquet(STOPS_INPUT, columns=["stop_lat", "stop_lon"]).dropna()
+    return (
+        float(stops["stop_lon"].min()) - margin,
+        float(stops["stop_lat"].min()) - margin,
+        float(stops["stop_lon"].max()) + margin,
+        float(stops["stop_lat"].max()) + margin,
+    )
+
+
+def main():
+    """Export the Wikidata gazetteer of the stops area."""
+    parser = argparse.ArgumentParser(description="Export a Wikidata gazetteer for offline linking")
+    parser.add_argument("--bbox", help="W,S,E,N (default: the stops plus ~10 km)")
+    parser.add_argument("--output", type=Path, default=GAZETTEER_FILE)
+    parser.add_argument("--endpoint", default=WIKIDATA_ENDPOINT, help="SPARQL endpoint URL")
+    args = parser.parse_args()
+
+    print("\n" + "=" * 70)
+    print("WIKIDATA GAZETTEER EXPORT")
+    print("=" * 70)
+
+    bbox = tuple(map(float, args.bbox.split(","))) if args.bbox else stops_bbox()
+    print(f"\n[1/1] Querying items in {bbox}...")
+    items, failed = export_gazetteer(SPARQLWrapperBackend(args.endpoint), bbox, args.output)
+    print(f"✓ Wrote {items:,} items to {args.output}")
+    if failed:
+        print(f"⚠️  {failed} tiles failed; run again for a complete gazetteer")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
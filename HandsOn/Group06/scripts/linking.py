@@ -1,22 +1,35 @@
 """
 Wikidata Linking Script - Assignment 4 & 5
 
-Enriches local_areas-updated.csv with Wikidata information:
+Enriches local_areas-updated.parquet with Wikidata information:
 - Assignment 4: Fills area_name and area_code (Q-number) using coordinates
-- Assignment 5: Creates local_areas-with-links.csv with owl:sameAs links
+- Assignment 5: Creates local_areas-with-links.parquet with owl:sameAs links
+
+Answers are checkpointed in data/processed/wikidata_checkpoint.jsonl: an
+interrupted run can simply be started again, and re-runs only query the
+stops that are new or failed (see wikidata_linker.py). With --gazetteer
+the stops are linked offline against a local export (see gazetteer.py).
 
 Usage:
-    python scripts/linking.py
+    python scripts/linking.py [--workers 4] [--rate 5] [--grid 25] [--endpoint URL]
+    python scripts/linking.py --gazetteer data/raw/wikidata_gazetteer.csv
 """
 
+import argparse
 import os
-import socket
-import time
 from pathlib import Path
 
 import certifi
 import pandas as pd
-from SPARQLWrapper import JSON, SPARQLExceptions, SPARQLWrapper
+
+from gazetteer import Gazetteer
+from wikidata_linker import (
+    WIKIDATA_ENDPOINT,
+    SPARQLWrapperBackend,
+    WikidataLinker,
+    coord_key,
+    snap_to_grid,
+)
 
 os.environ["SSL_CERT_FILE"] = certifi.where()
 
@@ -25,70 +38,30 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data" / "processed"
 CSV_DIR = BASE_DIR / "csv"
 
-DF_FINAL_INPUT = DATA_DIR / "df_final-updated.csv"
-LOCAL_AREAS_INPUT = DATA_DIR / "local_areas-updated.csv"
-LOCAL_AREAS_OUTPUT = DATA_DIR / "local_areas-updated.csv"
-LOCAL_AREAS_WITH_LINKS_OUTPUT = DATA_DIR / "local_areas-with-links.csv"
+DF_FINAL_INPUT = DATA_DIR / "df_final-updated.parquet"
+STOPS_INPUT = DATA_DIR / "stops-updated.parquet"
+STOP_TIMES_INPUT = DATA_DIR / "stop_times-updated.parquet"
+LOCAL_AREAS_INPUT = DATA_DIR / "local_areas-updated.parquet"
+LOCAL_AREAS_OUTPUT = DATA_DIR / "local_areas-updated.parquet"
+LOCAL_AREAS_WITH_LINKS_OUTPUT = DATA_DIR / "local_areas-with-links.parquet"
 LOCAL_AREAS_SAMPLE = CSV_DIR / "local_areas-updated.csv"
 LOCAL_AREAS_WITH_LINKS_SAMPLE = CSV_DIR / "local_areas-with-links.csv"
+CHECKPOINT_FILE = DATA_DIR / "wikidata_checkpoint.jsonl"
 
 SAMPLE_SIZE = 500
+GRID_METERS = 25.0  # stops closer than this share the Wikidata lookup
 
-# Initialize Wikidata SPARQL endpoint
-sparql = SPARQLWrapper("https://query.wikidata.org/sparql")
-sparql.setReturnFormat(JSON)
-
-
-def get_wikidata_info(lat, lon, retries=2, timeout=15):
-    """
-    Query Wikidata for the nearest geographic entity to given coordinates.
 
-    Returns:
-        tuple: (area_name, area_code, wikidata_uri) or (None, None, None)
+def load_stop_columns(columns):
     """
-    query = f"""
-    SELECT ?item ?itemLabel ?distance WHERE {{
-      SERVICE wikibase:around {{
-        ?item wdt:P625 ?coord .
-        bd:serviceParam wikibase:center "Point({lon} {lat})"^^geo:wktLiteral .
-        bd:serviceParam wikibase:radius "10" .
-        bd:serviceParam wikibase:distance ?distance .
-      }}
-      SERVICE wikibase:label {{ 
-        bd:serviceParam wikibase:language "es,en" .
-      }}
-    }}
-    ORDER BY ?distance
-    LIMIT 1
+    Stop columns of df_final-updated, or of the normalized tables when the
+    pipeline ran with --normalized (stops served by stop_times only).
     """
-
-    sparql.setQuery(query)
-
-    for attempt in range(retries + 1):
-        try:
-            sparql.setTimeout(timeout)
-            results = sparql.query().convert()
-            bindings = results["results"]["bindings"]
-
-            if bindings:
-                item_uri = bindings[0]["item"]["value"]
-                item_label = bindings[0].get("itemLabel", {}).get("value", "")
-                q_code = item_uri.split("/")[-1]
-                return item_label, q_code, item_uri
-            else:
-                return None, None, None
-
-        except (SPARQLExceptions.EndPointNotFound, socket.timeout):
-            if attempt == retries:
-                return None, None, None
-            time.sleep(1)
-
-        except Exception:
-            if attempt == retries:
-                return None, None, None
-            time.sleep(1)
-
-    return None, None, None
+    if DF_FINAL_INPUT.exists():
+        return pd.read_parquet(DF_FINAL_INPUT, columns=columns)
+    served = pd.read_parquet(STOP_TIMES_INPUT, columns=["stop_id"])["stop_id"].astype(str).unique()
+    stops = pd.read_parquet(STOPS_INPUT, columns=columns)
+    return stops[stops["stop_id"].astype(str).isin(served)]
 
 
 def cleanup_datasets():
@@ -97,9 +70,9 @@ def cleanup_datasets():
     Updates both full datasets and sample files.
     """
     # Load datasets
-    df_final = pd.read_csv(DF_FINAL_INPUT, low_memory=False)
-    df_areas = pd.read_csv(LOCAL_AREAS_OUTPUT)
-    df_areas_with_links = pd.read_csv(LOCAL_AREAS_WITH_LINKS_OUTPUT)
+    df_final = load_stop_columns(["stop_id"])
+    df_areas = pd.read_parquet(LOCAL_AREAS_OUTPUT)
+    df_areas_with_links = pd.read_parquet(LOCAL_AREAS_WITH_LINKS_OUTPUT)
 
     # Get valid stop_ids
     valid_stop_ids = set(df_final["stop_id"].astype(str).unique())
@@ -122,8 +95,8 @@ def cleanup_datasets():
         df_areas_with_links_cleaned = df_areas_with_links[~rows_to_remove].copy()
 
         # Save cleaned datasets
-        df_areas_cleaned.to_csv(LOCAL_AREAS_OUTPUT, index=False)
-        df_areas_with_links_cleaned.to_csv(LOCAL_AREAS_WITH_LINKS_OUTPUT, index=False)
+        df_areas_cleaned.to_parquet(LOCAL_AREAS_OUTPUT, index=False)
+        df_areas_with_links_cleaned.to_parquet(LOCAL_AREAS_WITH_LINKS_OUTPUT, index=False)
 
         # Update sample files
         df_areas_cleaned.head(SAMPLE_SIZE).to_csv(LOCAL_AREAS_SAMPLE, index=False)
@@ -138,89 +111,98 @@ def cleanup_datasets():
 
 def main():
     """Main linking process for Assignment 4 & 5."""
+    parser = argparse.ArgumentParser(description="Wikidata linking of the bus stops")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent queries (WDQS allows 5)")
+    parser.add_argument("--rate", type=float, default=5.0, help="queries per second")
+    parser.add_argument("--endpoint", default=WIKIDATA_ENDPOINT, help="SPARQL endpoint URL")
+    parser.add_argument(
+        "--grid",
+        type=float,
+        default=GRID_METERS,
+        help="snap stops to a grid of this size (m) and query once per cell; 0 = exact coordinates",
+    )
+    parser.add_argument("--checkpoint", type=Path, default=CHECKPOINT_FILE)
+    parser.add_argument(
+        "--gazetteer",
+        type=Path,
+        help="link offline against a gazetteer CSV (see gazetteer.py) instead of querying Wikidata",
+    )
+    args = parser.parse_args()
+
     print("\n" + "=" * 70)
     print("WIKIDATA LINKING")
     print("=" * 70)
-    print("\nThis will take approximately 1 hour to complete.")
-    print("Querying Wikidata for 7,852 bus stops...")
 
     # Load datasets
     print("\n[1/4] Loading datasets...")
-    df_final = pd.read_csv(DF_FINAL_INPUT, low_memory=False)
-    df_areas = pd.read_csv(LOCAL_AREAS_INPUT)
+    df_final = load_stop_columns(["stop_id", "stop_lat", "stop_lon"])
+    df_areas = pd.read_parquet(LOCAL_AREAS_INPUT)
     print(f"✓ Loaded {len(df_areas):,} stops")
 
     # Build coordinate lookup
     print("\n[2/4] Building coordinate lookup...")
-    coord_lookup = {}
-    unique_stops = df_final[["stop_id", "stop_lat", "stop_lon"]].drop_duplicates(
-        subset=["stop_id"]
+    unique_stops = (
+        df_final[["stop_id", "stop_lat", "stop_lon"]]
+        .dropna()
+        .drop_duplicates(subset=["stop_id"])
+    )
+    lats, lons = snap_to_grid(unique_stops["stop_lat"], unique_stops["stop_lon"], args.grid)
+    keys = [coord_key(lat, lon) for lat, lon in zip(lats.tolist(), lons.tolist())]
+    stop_keys = dict(zip(unique_stops["stop_id"].astype(str), keys))
+    coords = dict(zip(keys, zip(lats.tolist(), lons.tolist())))
+    print(f"✓ Created lookup for {len(stop_keys):,} coordinates")
+    print(
+        f"✓ {len(coords):,} distinct {args.grid:g} m cells to look up "
+        f"(dedup ratio {len(stop_keys) / max(len(coords), 1):.2f}x, "
+        f"{len(stop_keys) - len(coords):,} queries saved)"
     )
-    for _, row in unique_stops.iterrows():
-        if pd.notna(row["stop_lat"]) and pd.notna(row["stop_lon"]):
-            coord_lookup[str(row["stop_id"])] = (
-                float(row["stop_lat"]),
-                float(row["stop_lon"]),
-            )
-    print(f"✓ Created lookup for {len(coord_lookup):,} coordinates")
-
-    # Query Wikidata
-    print("\n[3/4] Querying Wikidata...")
-    area_names = []
-    area_codes = []
-    wikidata_links = []
-
-    processed = 0
-    found = 0
-
-    for idx, row in df_areas.iterrows():
-        stop_id = str(row["stop_id"])
-
-        if stop_id not in coord_lookup:
-            area_names.append("")
-            area_codes.append("")
-            wikidata_links.append("")
-            processed += 1
-            continue
-
-        lat, lon = coord_lookup[stop_id]
-        area_name, area_code, wikidata_uri = get_wikidata_info(lat, lon)
-
-        if area_name:
-            area_names.append(area_name)
-            area_codes.append(area_code)
-            wikidata_links.append(wikidata_uri)
-            found += 1
-        else:
-            area_names.append("")
-            area_codes.append("")
-            wikidata_links.append("")
-
-        processed += 1
-
-        # Progress update every 500 stops
-        if processed % 500 == 0:
-            print(
-                f"  Progress: {processed}/{len(df_areas)} ({processed / len(df_areas) * 100:.1f}%)"
-            )
-
-        # Respect Wikidata usage policy
-        time.sleep(0.25)
 
+    if args.gazetteer:
+        # Offline: nearest gazetteer item of every stop in one pass
+        print("\n[3/4] Reverse geocoding with the gazetteer...")
+        gazetteer = Gazetteer.from_csv(args.gazetteer)
+        located = df_areas[["stop_id"]].astype(str).merge(
+            unique_stops.astype({"stop_id": str}), on="stop_id", how="left"
+        )
+        area_names, area_codes, wikidata_links = gazetteer.reverse_geocode(
+            located["stop_lat"], located["stop_lon"]
+        )
+        print(f"✓ Matched against {len(gazetteer):,} gazetteer items")
+    else:
+        # Query Wikidata (only what the checkpoint does not answer yet)
+        print("\n[3/4] Querying Wikidata...")
+        linker = WikidataLinker(
+            SPARQLWrapperBackend(args.endpoint),
+            args.checkpoint,
+            workers=args.workers,
+            rate=args.rate,
+        )
+        stats = linker.link(coords)
+        print(f"✓ {stats['cached']:,} from checkpoint, {stats['queried']:,} queried")
+        if stats["failed"]:
+            print(f"⚠️  {stats['failed']:,} queries failed; run again to retry them")
+
+        answers = [linker.answer(stop_keys.get(str(stop_id))) for stop_id in df_areas["stop_id"]]
+        area_names = [name for name, _, _ in answers]
+        area_codes = [code for _, code, _ in answers]
+        wikidata_links = [uri for _, _, uri in answers]
+
+    processed = len(df_areas)
+    found = sum(1 for name in area_names if name)
     print(f"✓ Completed {processed:,} stops ({found:,} matched)")
 
     # Update datasets
     print("\n[4/4] Saving datasets...")
 
-    # Assignment 4: local_areas-updated.csv
+    # Assignment 4: local_areas-updated.parquet
     df_areas["area_name"] = area_names
     df_areas["area_code"] = area_codes
-    df_areas.to_csv(LOCAL_AREAS_OUTPUT, index=False)
+    df_areas.to_parquet(LOCAL_AREAS_OUTPUT, index=False)
 
-    # Assignment 5: local_areas-with-links.csv
+    # Assignment 5: local_areas-with-links.parquet
     df_areas_with_links = df_areas.copy()
     df_areas_with_links["wikidata_link"] = wikidata_links
-    df_areas_with_links.to_csv(LOCAL_AREAS_WITH_LINKS_OUTPUT, index=False)
+    df_areas_with_links.to_parquet(LOCAL_AREAS_WITH_LINKS_OUTPUT, index=False)
 
     # Create samples
     df_areas.head(SAMPLE_SIZE).to_csv(LOCAL_AREAS_SAMPLE, index=False)
@@ -243,10 +225,10 @@ def main():
     print("SUMMARY")
     print("=" * 70)
     print(f"Total processed: {processed:,}")
-    print(f"Wikidata matched: {found:,} ({found / processed * 100:.1f}%)")
+    print(f"Wikidata matched: {found:,} ({found / max(processed, 1) * 100:.1f}%)")
     print(f"\nFiles created:")
-    print(f"  - local_areas-updated.csv (Assignment 4)")
-    print(f"  - local_areas-with-links.csv (Assignment 5)")
+    print(f"  - local_areas-updated.parquet (Assignment 4)")
+    print(f"  - local_areas-with-links.parquet (Assignment 5)")
     print("\n✓ Ready for RDF transformation")
     print("=" * 70)
 
@@ -2,71 +2,230 @@
 GTFS Madrid Dataset Preprocessing Script
 
 Prepares the Madrid CRTM GTFS dataset for RDF transformation:
-1. Converts .txt files to .csv
-2. Normalizes GTFS extended times (e.g., 24:05:00 → 00:05:00)
-3. Creates merged dataset with service_id for schedule filtering
+1. Ingests the .txt files into typed Parquet, in chunks
+2. Parses GTFS times to seconds since the service day start (>24h kept)
+3. Creates merged dataset with service_id for schedule filtering, streaming
+   stop_times against the trip/stop tables (skipped with --normalized)
 4. Processes calendar data for date filtering
 
-Output: data/processed/ directory with clean CSV files
+Output: data/processed/ directory with Parquet files
 """
 
+import argparse
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
-
-
-def normalize_gtfs_time(value):
-    """Ensure GTFS extended times (>=24h) wrap into a single-day clock."""
-    if pd.isna(value):
-        return value
-
-    text = str(value).strip()
-    if not text:
-        return text
-
-    parts = text.split(":")
-    if len(parts) < 2:
-        return text
-
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# Explicit GTFS dtypes: ids and repeated names as categoricals, sequences as
+# int32, coordinates as float32; other columns are read as strings
+CATEGORY_COLUMNS = {
+    "agency_id", "route_id", "service_id", "trip_id", "stop_id", "shape_id",
+    "block_id", "zone_id", "parent_station", "fare_id", "route_short_name",
+    "route_long_name", "trip_headsign", "stop_name",
+}
+GTFS_DTYPES = {
+    "stop_sequence": "Int32",
+    "shape_pt_sequence": "Int32",
+    "stop_lat": "float32",
+    "stop_lon": "float32",
+    "shape_pt_lat": "float32",
+    "shape_pt_lon": "float32",
+    "shape_dist_traveled": "float32",
+    "direction_id": "Int8",
+    "route_type": "Int16",
+    "location_type": "Int8",
+    "wheelchair_boarding": "Int8",
+    "wheelchair_accessible": "Int8",
+    "bikes_allowed": "Int8",
+    "pickup_type": "Int8",
+    "drop_off_type": "Int8",
+    "timepoint": "Int8",
+    "exception_type": "Int8",
+    **{day: "Int8" for day in ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")},
+}
+TIME_COLUMNS = ["arrival_time", "departure_time"]
+CHUNK_SIZE = 1_000_000
+
+# Columns of the merged dataset (df_final)
+ESSENTIAL_COLUMNS = [
+    "trip_id",
+    "route_id",
+    "service_id",
+    "trip_headsign",
+    "direction_id",
+    "shape_id",
+    "route_short_name",
+    "route_long_name",
+    "route_type",
+    "stop_id",
+    "stop_name",
+    "stop_lat",
+    "stop_lon",
+    "arrival_time",
+    "departure_time",
+    "stop_sequence",
+    "wheelchair_boarding",
+]
+
+SECONDS_PER_DAY = 24 * 3600
+MISSING_TIME = -1
+GTFS_TIME_PATTERN = r"^\s*(\d+):(\d{1,2})(?::(\d{1,2}))?\s*$"
+
+
+def parse_gtfs_times(series):
+    """
+    Parse GTFS times to int32 seconds since the start of the service day.
+
+    Extended times (>= 24:00:00, trips running past midnight) are kept, e.g.
+    "25:10:00" -> 90600. Missing or invalid values become MISSING_TIME.
+    Values in the usual "HH:MM:SS" form are decoded from their bytes in
+    bulk; only the other ones ("5:30:00", "100:00:00", ...) go through a
+    regular expression.
+    """
+    # 9 bytes: a non-empty 9th byte means the value is longer than HH:MM:SS
     try:
-        hours = int(parts[0])
-        minutes = int(parts[1])
-        seconds = int(parts[2]) if len(parts) > 2 else 0
-    except ValueError:
-        return text
-
-    if hours < 24:
-        return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+        raw = series.to_numpy(dtype=object).astype("S9")
+    except UnicodeEncodeError:
+        raw = np.zeros(len(series), dtype="S9")  # non-ASCII text: parse everything below
+    chars = raw.view(np.uint8).reshape(-1, 9)
+    digits = chars[:, [0, 1, 3, 4, 6, 7]].astype(np.int32) - ord("0")
+    fixed = (
+        (chars[:, 2] == ord(":"))
+        & (chars[:, 5] == ord(":"))
+        & (chars[:, 8] == 0)
+        & ((digits >= 0) & (digits <= 9)).all(axis=1)
+    )
 
-    normalized_hours = hours % 24
-    return f"{normalized_hours:02d}:{minutes:02d}:{seconds:02d}"
+    seconds = np.full(len(series), MISSING_TIME, dtype=np.int32)
+    d = digits[fixed]
+    seconds[fixed] = (d[:, 0] * 10 + d[:, 1]) * 3600 + (d[:, 2] * 10 + d[:, 3]) * 60 + d[:, 4] * 10 + d[:, 5]
+
+    other = ~fixed
+    if other.any():
+        parts = series[other].astype("string").str.extract(GTFS_TIME_PATTERN)
+        h, m, sec = (pd.to_numeric(parts[i], errors="coerce") for i in range(3))
+        values = (h * 3600 + m * 60 + sec.fillna(0)).fillna(MISSING_TIME)
+        seconds[other] = values.to_numpy(dtype=np.int32)
+    return seconds
+
+
+def format_gtfs_times(seconds, wrap=True):
+    """
+    Format seconds since the start of the service day as HH:MM:SS strings.
+
+    With wrap=True, extended times wrap into a single-day clock (90600 ->
+    "01:10:00"), as xsd:time requires. Missing values become None.
+    """
+    seconds = np.asarray(seconds)
+    missing = seconds < 0
+    value = np.where(missing, 0, seconds)
+    hours = value // 3600 % 24 if wrap else value // 3600
+    fields = np.stack([hours // 10 % 10, hours % 10, value // 600 % 6, value // 60 % 10,
+                       value % 60 // 10, value % 10], axis=1).astype(np.uint8) + ord("0")
+    chars = np.full((len(value), 8), ord(":"), dtype=np.uint8)
+    chars[:, [0, 1, 3, 4, 6, 7]] = fields
+    text = chars.view("S8").ravel().astype("U8").astype(object)
+    if not wrap:
+        # Hours beyond two digits do not fit the fixed-width encoding
+        for i in np.flatnonzero(hours > 99):
+            text[i] = f"{hours[i]:02d}:{value[i] // 60 % 60:02d}:{value[i] % 60:02d}"
+    text[missing] = None
+    return text
 
 
 def normalize_time_columns(df, columns):
-    """Normalize GTFS time columns and return change counts."""
+    """
+    Replace GTFS time columns by int32 seconds since the start of the
+    service day (see parse_gtfs_times) and return, per column, the number
+    of extended (>= 24h) times.
+    """
     stats = {}
     for column in columns:
-        original = df[column].copy()
-        normalized = df[column].apply(normalize_gtfs_time)
-        changes = (original.fillna("__nan__") != normalized.fillna("__nan__")).sum()
-        df[column] = normalized
-        stats[column] = int(changes)
+        seconds = parse_gtfs_times(df[column])
+        df[column] = seconds
+        stats[column] = int((seconds >= SECONDS_PER_DAY).sum())
     return stats
 
 
-def convert_txt_to_csv(source_dir, output_dir, gtfs_files):
-    """Convert GTFS .txt files to .csv format."""
+def gtfs_dtypes(columns):
+    """Explicit read_csv dtypes for the columns of a GTFS file."""
+    return {
+        column: GTFS_DTYPES.get(column, "category" if column in CATEGORY_COLUMNS else str)
+        for column in columns
+    }
+
+
+def arrow_schema(table):
+    """Schema of table with every dictionary column as dictionary<int32, string>,
+    so chunks with different category sets can share one Parquet file."""
+    fields = [
+        pa.field(field.name, pa.dictionary(pa.int32(), pa.string()))
+        if pa.types.is_dictionary(field.type)
+        else field
+        for field in table.schema
+    ]
+    return pa.schema(fields, metadata=table.schema.metadata)
+
+
+def write_parquet_chunks(chunks, output_file):
+    """Write DataFrame chunks to one Parquet file (one row group per chunk)."""
+    writer = None
+    schema = None
+    records = 0
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                schema = arrow_schema(table)
+                writer = pq.ParquetWriter(output_file, schema)
+            writer.write_table(table.cast(schema))
+            records += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return records
+
+
+def ingest_gtfs_file(source_file, output_file, chunk_size=CHUNK_SIZE):
+    """
+    Stream a GTFS .txt file into Parquet with explicit dtypes.
+
+    Times are stored as int32 seconds (see parse_gtfs_times). Only one
+    chunk is in memory at a time, whatever the size of the file.
+    """
+    columns = pd.read_csv(source_file, nrows=0).columns
+    dtypes = gtfs_dtypes(columns)
+    time_columns = [column for column in TIME_COLUMNS if column in columns]
+    extended = 0
+
+    def chunks():
+        nonlocal extended
+        reader = pd.read_csv(source_file, dtype=dtypes, chunksize=chunk_size)
+        for chunk in reader:
+            extended += sum(normalize_time_columns(chunk, time_columns).values())
+            yield chunk
+
+    records = write_parquet_chunks(chunks(), output_file)
+    if records == 0:
+        pd.read_csv(source_file, dtype=dtypes).to_parquet(output_file, index=False)
+    return {"records": records, "columns": len(columns), "extended_times": extended}
+
+
+def ingest_gtfs(source_dir, output_dir, gtfs_files):
+    """Ingest GTFS .txt files into typed Parquet files (<name>.parquet)."""
     output_dir.mkdir(exist_ok=True)
     stats = {}
 
     for file_name in gtfs_files:
         source_file = source_dir / f"{file_name}.txt"
-        output_file = output_dir / f"{file_name}.csv"
+        output_file = output_dir / f"{file_name}.parquet"
 
         try:
-            df = pd.read_csv(source_file)
-            df.to_csv(output_file, index=False)
-            stats[file_name] = {"records": len(df), "columns": len(df.columns)}
+            stats[file_name] = ingest_gtfs_file(source_file, output_file)
         except Exception as e:
             stats[file_name] = {"records": 0, "columns": 0, "error": str(e)}
 
@@ -74,81 +233,132 @@ def convert_txt_to_csv(source_dir, output_dir, gtfs_files):
 
 
 def verify_data_integrity(output_dir):
-    """Verify referential integrity of GTFS data and normalize times."""
-    routes = pd.read_csv(output_dir / "routes.csv")
-    trips = pd.read_csv(output_dir / "trips.csv")
-    stops = pd.read_csv(output_dir / "stops.csv")
-    stop_times = pd.read_csv(output_dir / "stop_times.csv")
+    """
+    Verify referential integrity of GTFS data and count extended times.
+
+    stop_times is checked one row group at a time; only the dimension
+    tables are loaded.
+    """
+    routes = pd.read_parquet(output_dir / "routes.parquet")
+    trips = pd.read_parquet(output_dir / "trips.parquet")
+    stops = pd.read_parquet(output_dir / "stops.parquet")
 
     # Check referential integrity
     trips_valid = trips["route_id"].isin(routes["route_id"]).sum()
-    stop_times_trips_valid = stop_times["trip_id"].isin(trips["trip_id"]).sum()
-    stop_times_stops_valid = stop_times["stop_id"].isin(stops["stop_id"]).sum()
+    trip_ids = pd.Index(trips["trip_id"].astype(str).unique())
+    stop_ids = pd.Index(stops["stop_id"].astype(str).unique())
+
+    stop_times_count = 0
+    stop_times_trips_valid = 0
+    stop_times_stops_valid = 0
+    time_fix_stats = dict.fromkeys(TIME_COLUMNS, 0)
+    source = pq.ParquetFile(output_dir / "stop_times.parquet")
+    for batch in source.iter_batches(batch_size=CHUNK_SIZE, columns=["trip_id", "stop_id"] + TIME_COLUMNS):
+        chunk = batch.to_pandas()
+        stop_times_count += len(chunk)
+        stop_times_trips_valid += int((positions(trip_ids, chunk["trip_id"]) >= 0).sum())
+        stop_times_stops_valid += int((positions(stop_ids, chunk["stop_id"]) >= 0).sum())
+        # Times were parsed to seconds at ingest
+        for column in TIME_COLUMNS:
+            time_fix_stats[column] += int((chunk[column] >= SECONDS_PER_DAY).sum())
 
     all_valid = (
         trips_valid == len(trips)
-        and stop_times_trips_valid == len(stop_times)
-        and stop_times_stops_valid == len(stop_times)
+        and stop_times_trips_valid == stop_times_count
+        and stop_times_stops_valid == stop_times_count
     )
 
     if not all_valid:
         print("⚠️  WARNING: Integrity issues detected")
 
-    # Normalize times
-    time_fix_stats = normalize_time_columns(
-        stop_times, ["arrival_time", "departure_time"]
-    )
-
-    return routes, trips, stops, stop_times, time_fix_stats
-
-
-def create_merged_dataset(routes, trips, stops, stop_times, output_dir):
-    """Create merged dataset: routes → trips → stop_times → stops."""
-    # Merge all tables
-    df = trips.merge(routes, on="route_id", how="left")
-    df = df.merge(stop_times, on="trip_id", how="left")
-    df = df.merge(stops, on="stop_id", how="left")
-
-    # Keep essential columns
-    essential_cols = [
-        "trip_id",
-        "route_id",
-        "service_id",
-        "trip_headsign",
-        "direction_id",
-        "shape_id",
-        "route_short_name",
-        "route_long_name",
-        "route_type",
-        "stop_id",
-        "stop_name",
-        "stop_lat",
-        "stop_lon",
-        "arrival_time",
-        "departure_time",
-        "stop_sequence",
-        "wheelchair_boarding",
-    ]
-
-    available_cols = [col for col in essential_cols if col in df.columns]
-    df_final = df[available_cols].copy()
-
-    # Save
-    output_file = output_dir / "df_final.csv"
-    df_final.to_csv(output_file, index=False)
-
-    return df_final
+    return routes, trips, stops, time_fix_stats
+
+
+def positions(index, values):
+    """Position of every value in a unique index (-1 if absent). Categorical
+    values are looked up once per category, not once per row."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        category_pos = index.get_indexer(values.cat.categories.astype(str))
+        codes = values.cat.codes.to_numpy()
+        return np.where(codes >= 0, category_pos[codes], -1)
+    return index.get_indexer(values.astype(str))
+
+
+def create_merged_dataset(routes, trips, stops, output_dir):
+    """
+    Create merged dataset: routes → trips → stop_times → stops.
+
+    Only the dimension tables (trips + routes, stops) are held in memory.
+    stop_times is streamed one row group at a time: every chunk is joined to
+    them by position lookups and written as one row group of
+    df_final.parquet, so memory does not grow with the number of stop times.
+    Returns the id columns of the output (enough for the summary).
+    """
+    trip_table = trips.drop_duplicates("trip_id").merge(routes.drop_duplicates("route_id"), on="route_id", how="left")
+    stop_table = stops.drop_duplicates("stop_id").reset_index(drop=True)
+    trip_ids = pd.Index(trip_table["trip_id"].astype(str))
+    stop_ids = pd.Index(stop_table["stop_id"].astype(str))
+
+    source = pq.ParquetFile(output_dir / "stop_times.parquet")
+    stop_time_cols = [col for col in ESSENTIAL_COLUMNS if col in source.schema_arrow.names]
+    trip_cols = [col for col in ESSENTIAL_COLUMNS if col in trip_table.columns and col not in stop_time_cols]
+    stop_cols = [col for col in ESSENTIAL_COLUMNS if col in stop_table.columns and col not in stop_time_cols]
+    available_cols = [col for col in ESSENTIAL_COLUMNS if col in stop_time_cols + trip_cols + stop_cols]
+    trip_table = trip_table[trip_cols].reset_index(drop=True)
+    stop_table = stop_table[stop_cols]
+    trips_used = np.zeros(len(trip_table), dtype=bool)
+
+    def chunks():
+        for batch in source.iter_batches(batch_size=CHUNK_SIZE, columns=stop_time_cols):
+            stop_times = batch.to_pandas()
+
+            # Inner on trips (as the left join from trips), left on stops
+            trip_pos = positions(trip_ids, stop_times["trip_id"])
+            keep = trip_pos >= 0
+            stop_times, trip_pos = stop_times[keep].reset_index(drop=True), trip_pos[keep]
+            trips_used[trip_pos] = True
+            stop_pos = positions(stop_ids, stop_times["stop_id"])
+
+            yield pd.concat(
+                [stop_times, trip_table.take(trip_pos).reset_index(drop=True), stop_table.reindex(stop_pos).reset_index(drop=True)],
+                axis=1,
+            )[available_cols]
+
+        # Trips without stop times keep one row without stop data
+        unused = np.flatnonzero(~trips_used)
+        if len(unused):
+            empty = source.schema_arrow.empty_table().select(stop_time_cols).to_pandas().reindex(range(len(unused)))
+            empty["trip_id"] = trip_ids[unused]
+            for column in TIME_COLUMNS:
+                if column in empty.columns:
+                    empty[column] = np.int32(MISSING_TIME)
+            yield pd.concat(
+                [empty, trip_table.take(unused).reset_index(drop=True), stop_table.reindex(np.full(len(unused), -1)).reset_index(drop=True)],
+                axis=1,
+            )[available_cols]
+
+    output_file = output_dir / "df_final.parquet"
+    write_parquet_chunks(chunks(), output_file)
+    return pd.read_parquet(output_file, columns=["route_id", "trip_id", "stop_id", "service_id"])
 
 
 def process_calendar_data(output_dir):
     """Load and verify calendar data."""
-    calendar = pd.read_csv(output_dir / "calendar.csv")
-    calendar_dates = pd.read_csv(output_dir / "calendar_dates.csv")
+    calendar = pd.read_parquet(output_dir / "calendar.parquet")
+    calendar_dates = pd.read_parquet(output_dir / "calendar_dates.parquet")
     return calendar, calendar_dates
 
 
 def main():
     """Main execution"""
+    parser = argparse.ArgumentParser(description="GTFS Madrid preprocessing")
+    parser.add_argument(
+        "--normalized",
+        action="store_true",
+        help="skip the merged df_final table (RDF is generated from the normalized tables)",
+    )
+    args = parser.parse_args()
+
     print("\n" + "=" * 70)
     print("GTFS PREPROCESSING")
     print("=" * 70)
@@ -170,24 +380,44 @@ def main():
         "shapes",
     ]
 
-    # Step 1: Convert .txt to .csv
-    print("\n[1/4] Converting .txt to .csv...")
-    stats = convert_txt_to_csv(source_dir, output_dir, gtfs_files)
-    print(f"✓ Converted {len([s for s in stats.values() if 'error' not in s])} files")
+    # Step 1: Ingest .txt into typed Parquet
+    print("\n[1/4] Ingesting .txt into Parquet...")
+    stats = ingest_gtfs(source_dir, output_dir, gtfs_files)
+    print(f"✓ Ingested {len([s for s in stats.values() if 'error' not in s])} files")
+    for file_name, file_stats in stats.items():
+        if "error" in file_stats:
+            print(f"⚠️  {file_name}: {file_stats['error']}")
 
-    # Step 2: Verify integrity and normalize times
+    # Step 2: Verify integrity and count extended times
     print("\n[2/4] Verifying data integrity...")
-    routes, trips, stops, stop_times, time_fix_stats = verify_data_integrity(output_dir)
+    routes, trips, stops, time_fix_stats = verify_data_integrity(output_dir)
     print("✓ Integrity check complete")
 
-    total_fixes = sum(time_fix_stats.values())
-    if total_fixes:
-        print(f"✓ Normalized {total_fixes:,} extended-time values")
-
-    # Step 3: Create merged dataset
-    print("\n[3/4] Creating merged dataset...")
-    df_final = create_merged_dataset(routes, trips, stops, stop_times, output_dir)
-    print(f"✓ Created df_final.csv: {len(df_final):,} rows")
+    total_extended = sum(time_fix_stats.values())
+    if total_extended:
+        print(f"✓ Kept {total_extended:,} extended-time values (>24h) as seconds")
+
+    # Step 3: Create merged dataset (unless RDF is generated from the normalized tables)
+    if args.normalized:
+        print("\n[3/4] Skipping merged dataset (--normalized)")
+        summary = {
+            "Routes": len(routes),
+            "Trips": len(trips),
+            "Stops": len(stops),
+            "Stop-times": pq.ParquetFile(output_dir / "stop_times.parquet").metadata.num_rows,
+            "Services": trips["service_id"].nunique(),
+        }
+    else:
+        print("\n[3/4] Creating merged dataset...")
+        df_final = create_merged_dataset(routes, trips, stops, output_dir)
+        print(f"✓ Created df_final.parquet: {len(df_final):,} rows")
+        summary = {
+            "Routes": df_final["route_id"].nunique(),
+            "Trips": df_final["trip_id"].nunique(),
+            "Stops": df_final["stop_id"].nunique(),
+            "Stop-times": len(df_final),
+            "Services": df_final["service_id"].nunique(),
+        }
 
     # Step 4: Process calendar data
     print("\n[4/4] Processing calendar data...")
@@ -197,17 +427,13 @@ def main():
     )
 
     # Summary
-    shapes = pd.read_csv(output_dir / "shapes.csv")
+    summary["Shape points"] = pq.ParquetFile(output_dir / "shapes.parquet").metadata.num_rows
     print("\n" + "=" * 70)
     print("SUMMARY")
     print("=" * 70)
-    print(f"Routes:       {df_final['route_id'].nunique():>10,}")
-    print(f"Trips:        {df_final['trip_id'].nunique():>10,}")
-    print(f"Stops:        {df_final['stop_id'].nunique():>10,}")
-    print(f"Stop-times:   {len(df_final):>10,}")
-    print(f"Services:     {df_final['service_id'].nunique():>10,}")
-    print(f"Shape points: {len(shapes):>10,}")
-    print("\n✓ Ready for assignment3.py")
+    for label, value in summary.items():
+        print(f"{label + ':':<14}{value:>10,}")
+    print(f"\n✓ Ready for assignment3.py{' --normalized' if args.normalized else ''}")
     print("=" * 70)
 
 
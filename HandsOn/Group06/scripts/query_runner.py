@@ -6,47 +6,225 @@ contained in the SPARQL files under `rdf/`. By default it works with the
 small sample datasets so we can iterate quickly, but the `--rdf` flag can
 point to any other file (TTL/NT/etc.).
 
+With --bench every query is run --warmup times untimed and then --repeat
+times; the median/p95 timings, result counts and peak memory (one extra
+run under tracemalloc) are written to JSON. --compare diffs two such runs
+(or a baseline and the current run) and exits with status 1 when a query
+got slower than --threshold or its result count changed, so it can serve
+as a performance gate for data and engine changes.
+
+With --jobs N the graph is loaded once and the queries run concurrently
+in N forked worker processes that share it copy-on-write; results are
+still printed in query order, each with its own timing.
+
 Usage examples:
     python3 query_runner.py
     python3 query_runner.py --links
     python3 query_runner.py --rdf path/to/data.ttl --sparql path/to/queries.sparql
+    python3 query_runner.py --jobs 4
+    python3 query_runner.py --bench --output before.json
+    python3 query_runner.py --bench --compare before.json
+    python3 query_runner.py --compare before.json after.json
 """
 
 import argparse
+import gc
+import json
+import math
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
 import time
+import tracemalloc
 from pathlib import Path
 
+import rdflib
 from rdflib import Graph
 
+# Slowdowns smaller than this are timer noise, whatever the ratio
+MIN_REGRESSION_S = 0.005
+
+
+def execute(graph, query):
+    """Run a query and materialize its rows; returns (rows, seconds)."""
+    start = time.perf_counter()
+    rows = list(graph.query(query))
+    return rows, time.perf_counter() - start
+
 
 def run_query(graph, query_dict, query_num):
-    """Execute a SPARQL query using rdflib.Graph.query."""
+    """Execute a SPARQL query using rdflib.Graph.query; returns its outcome."""
+    try:
+        rows, elapsed = execute(graph, query_dict["query"])
+    except Exception as exc:
+        return {"query": query_num, "error": str(exc)}
+
+    preview = [", ".join(str(value) for value in row) for row in rows[:5]]
+    return {"query": query_num, "elapsed": elapsed, "results": len(rows), "preview": preview}
+
+
+def print_outcome(query_dict, outcome):
+    """Print the header, timing and a five-row preview of a query."""
     comment = query_dict["comment"] or "SPARQL query"
-    query = query_dict["query"]
 
     print(f"\n{'=' * 70}")
-    print(f"QUERY {query_num}: {comment}")
+    print(f"QUERY {outcome['query']}: {comment}")
     print(f"{'=' * 70}")
 
-    start = time.time()
+    if "error" in outcome:
+        print(f"✗ Query failed: {outcome['error']}")
+        return
+
+    print(f"✓ Completed in {outcome['elapsed']:.2f}s · {outcome['results']:,} result(s)")
+    for idx, formatted in enumerate(outcome["preview"], 1):
+        print(f"  {idx}. {formatted}")
+
+
+# Graph of the forked workers: set before the pool starts, so every worker
+# shares the loaded graph copy-on-write instead of parsing it again
+_GRAPH = None
+
+
+def _call(task):
+    func, args = task
+    return func(_GRAPH, *args)
+
+
+def map_queries(graph, func, tasks, jobs=1):
+    """
+    func(graph, *task) for every task, yielded in task order. With jobs > 1
+    the calls run in a pool of forked worker processes; where fork is not
+    available (Windows) they run sequentially.
+    """
+    if jobs <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        for task in tasks:
+            yield func(graph, *task)
+        return
+
+    global _GRAPH
+    _GRAPH = graph
+    # Keep the graph out of the collector's reach: its scans would touch
+    # (and so copy) every page of the shared graph in each worker
+    gc.freeze()
+    try:
+        with multiprocessing.get_context("fork").Pool(jobs) as pool:
+            yield from pool.imap(_call, [(func, task) for task in tasks])
+    finally:
+        gc.unfreeze()
+        _GRAPH = None
+
+
+def percentile(values, q):
+    """Nearest-rank percentile (q in 0-100) of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
 
+def bench_query(graph, query_dict, query_num, warmup=1, repeat=5):
+    """Benchmark one query: warmup runs, timed repetitions, then one traced run."""
+    result = {"query": query_num, "comment": query_dict["comment"] or "SPARQL query"}
     try:
-        results = graph.query(query)
+        for _ in range(warmup):
+            execute(graph, query_dict["query"])
+        times = []
+        for _ in range(repeat):
+            rows, elapsed = execute(graph, query_dict["query"])
+            times.append(elapsed)
+
+        # Peak memory in its own run: tracemalloc slows execution down
+        tracemalloc.start()
+        try:
+            execute(graph, query_dict["query"])
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
     except Exception as exc:
-        print(f"✗ Query failed: {exc}")
-        return
+        result["error"] = str(exc)
+        return result
+
+    result.update(
+        {
+            "results": len(rows),
+            "median_s": statistics.median(times),
+            "p95_s": percentile(times, 95),
+            "min_s": min(times),
+            "times_s": times,
+            "peak_memory_bytes": peak,
+        }
+    )
+    return result
 
-    rows = list(results)
-    elapsed = time.time() - start
-    print(f"✓ Completed in {elapsed:.2f}s · {len(rows):,} result(s)")
 
-    if not rows:
+def print_bench(result):
+    label = f"Q{result['query']:<3}"
+    if "error" in result:
+        print(f"  {label} ✗ {result['error']}")
         return
+    print(
+        f"  {label} median {result['median_s'] * 1000:9.2f} ms · "
+        f"p95 {result['p95_s'] * 1000:9.2f} ms · {result['results']:>8,} result(s) · "
+        f"peak {result['peak_memory_bytes'] / 2**20:7.1f} MiB"
+    )
 
-    preview = rows[: min(5, len(rows))]
-    for idx, row in enumerate(preview, 1):
-        formatted = ", ".join(str(value) for value in row)
-        print(f"  {idx}. {formatted}")
+
+def compare_runs(baseline, current, threshold):
+    """
+    Print the per-query diff of two benchmark runs; returns the number of
+    regressions (median slower by more than threshold, result count changed
+    or a new failure). Runs with different --jobs are not compared: their
+    queries did not compete for the CPU in the same way.
+    """
+    jobs = baseline.get("jobs", 1), current.get("jobs", 1)
+    if jobs[0] != jobs[1]:
+        sys.exit(f"✗ Not comparable: baseline ran with --jobs {jobs[0]}, current with --jobs {jobs[1]}")
+
+    old = {(q["query"], q["comment"]): q for q in baseline["queries"]}
+    regressions = 0
+    print(f"\n{'=' * 70}")
+    print(f"COMPARISON (threshold +{threshold:.0%})")
+    print("=" * 70)
+    for field in ("rdf", "triples"):
+        if baseline.get(field) != current.get(field):
+            print(f"⚠️  Different dataset: {field} {baseline.get(field)} → {current.get(field)}")
+    if jobs[0] > 1:
+        print(f"⚠️  Both runs used --jobs {jobs[0]}: timings include CPU contention between queries")
+    for query in current["queries"]:
+        key = (query["query"], query["comment"])
+        before = old.get(key)
+        label = f"Q{query['query']:<3}"
+        if before is None:
+            print(f"  {label} new query")
+            continue
+        if "error" in query:
+            regressions += "error" not in before
+            print(f"  {label} ✗ failed: {query['error']}")
+            continue
+        if "error" in before:
+            print(f"  {label} ✓ fixed (failed in baseline)")
+            continue
+
+        ratio = query["median_s"] / before["median_s"] if before["median_s"] else 1.0
+        slower = ratio > 1 + threshold and query["median_s"] - before["median_s"] > MIN_REGRESSION_S
+        count_changed = query["results"] != before["results"]
+        marker = "⚠️ " if slower or count_changed else "✓"
+        line = (
+            f"  {label} {marker} {before['median_s'] * 1000:9.2f} → "
+            f"{query['median_s'] * 1000:9.2f} ms ({ratio - 1:+.0%})"
+        )
+        if count_changed:
+            line += f" · results {before['results']:,} → {query['results']:,}"
+        print(line)
+        regressions += slower or count_changed
+
+    print(f"\n{regressions} regression(s)")
+    return regressions
+
+
+def load_bench(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
 
 
 def parse_queries(sparql_file):
@@ -127,8 +305,51 @@ def main():
         type=Path,
         help="Path to the SPARQL file to execute (overrides defaults)",
     )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Run the queries in this many forked worker processes sharing the graph (0 = all cores)",
+    )
+    parser.add_argument(
+        "--bench",
+        action="store_true",
+        help="Benchmark the queries (warmup, repetitions, median/p95, peak memory) and write JSON",
+    )
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed runs per query (--bench)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per query (--bench)")
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="Benchmark JSON file (default: data/bench/<queries>.json)",
+    )
+    parser.add_argument(
+        "--compare",
+        type=Path,
+        nargs="+",
+        metavar="JSON",
+        help="BASELINE [CURRENT]: diff two benchmark runs, or the baseline and this --bench run",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Relative median slowdown reported as a regression (default 0.2 = +20%%)",
+    )
     args = parser.parse_args()
 
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    if args.warmup < 0:
+        parser.error("--warmup cannot be negative")
+    if args.compare and len(args.compare) > 2:
+        parser.error("--compare takes a baseline and at most one current run")
+    if args.compare and len(args.compare) == 2:
+        regressions = compare_runs(load_bench(args.compare[0]), load_bench(args.compare[1]), args.threshold)
+        sys.exit(1 if regressions else 0)
+    if args.compare and not args.bench:
+        parser.error("--compare with a single file needs --bench")
+
     base_dir = Path(__file__).parent.parent
     rdf_dir = base_dir / "rdf"
 
@@ -146,6 +367,14 @@ def main():
     if not sparql_file.exists():
         raise FileNotFoundError(f"SPARQL file not found: {sparql_file}")
 
+    output = args.output or base_dir / "data" / "bench" / f"{sparql_file.stem}.json"
+    baseline = None
+    if args.compare:
+        # Read the baseline before this run can overwrite it
+        if args.compare[0].resolve() == output.resolve():
+            parser.error(f"--compare baseline {args.compare[0]} is the benchmark output; pass another --output")
+        baseline = load_bench(args.compare[0])
+
     print("\n" + "=" * 70)
     print("RDF Data Validator - Madrid Bus Network")
     print(f"Mode: {'WITH Wikidata Links' if args.links else 'Base Dataset'}")
@@ -167,11 +396,47 @@ def main():
     queries = parse_queries(sparql_file)
     print(f"\nExecuting {len(queries)} query(ies) from {sparql_file.name}")
 
-    for idx, query_dict in enumerate(queries, 1):
-        run_query(graph, query_dict, idx)
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+    jobs = min(jobs, len(queries)) if queries else 1
+    if jobs > 1:
+        print(f"Running on {jobs} worker process(es)")
+
+    start = time.perf_counter()
+    if args.bench:
+        print(f"Benchmark: {args.warmup} warmup + {args.repeat} timed run(s) per query\n")
+        tasks = [(query_dict, idx, args.warmup, args.repeat) for idx, query_dict in enumerate(queries, 1)]
+        results = []
+        for result in map_queries(graph, bench_query, tasks, jobs):
+            print_bench(result)
+            results.append(result)
+        report = {
+            "rdf": str(rdf_file),
+            "sparql": str(sparql_file),
+            "triples": len(graph),
+            "warmup": args.warmup,
+            "repeat": args.repeat,
+            "python": platform.python_version(),
+            "rdflib": rdflib.__version__,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "jobs": jobs,
+            "queries": results,
+        }
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✓ Benchmark written to {output}")
+
+        if args.compare:
+            regressions = compare_runs(baseline, report, args.threshold)
+            sys.exit(1 if regressions else 0)
+        return
+
+    tasks = [(query_dict, idx) for idx, query_dict in enumerate(queries, 1)]
+    for query_dict, outcome in zip(queries, map_queries(graph, run_query, tasks, jobs)):
+        print_outcome(query_dict, outcome)
 
     print(f"\n{'=' * 70}")
-    print("Completed all queries.")
+    print(f"Completed all queries in {time.perf_counter() - start:.2f}s.")
     print("=" * 70)
 
 
@@ -0,0 +1,248 @@
+"""
+Resumable, rate-limited Wikidata linker for linking.py.
+
+Every answer is appended to a JSON-lines checkpoint as soon as it arrives
+({"key", "lat", "lon", "status", "name", "code", "uri"}), so an
+interrupted run resumes where it stopped: answered coordinates ("ok", or
+"none" when Wikidata has nothing nearby) are served from the checkpoint
+and only new or failed ones ("error") are queried again.
+
+Queries run on a bounded pool of worker threads that share a token bucket
+(the Wikidata Query Service allows 5 concurrent queries per client and
+answers 429 with a Retry-After when overloaded, which pauses the bucket).
+
+Nearby stops (both sides of a road, platforms of an interchange) get the
+same answer, so linking.py snaps the coordinates to a grid first and only
+looks up one representative per cell: its centre (snap_to_grid).
+
+The HTTP side is pluggable: a backend is any object with
+select(query, timeout) -> list of SPARQL JSON bindings. SPARQLWrapperBackend
+talks to any SPARQL 1.1 endpoint, so tests can point it at a local fake
+service (or pass an in-process backend).
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.error import HTTPError
+
+import numpy as np
+
+WIKIDATA_ENDPOINT = "https://query.wikidata.org/sparql"
+USER_AGENT = "madrid-bus-linking/1.0 (GTFS Madrid Linked Data; Group06)"
+METERS_PER_DEGREE = 111_320.0
+
+AROUND_QUERY = """
+SELECT ?item ?itemLabel ?distance WHERE {{
+  SERVICE wikibase:around {{
+    ?item wdt:P625 ?coord .
+    bd:serviceParam wikibase:center "Point({lon} {lat})"^^geo:wktLiteral .
+    bd:serviceParam wikibase:radius "10" .
+    bd:serviceParam wikibase:distance ?distance .
+  }}
+  SERVICE wikibase:label {{
+    bd:serviceParam wikibase:language "es,en" .
+  }}
+}}
+ORDER BY ?distance
+LIMIT 1
+"""
+
+
+class RateLimited(Exception):
+    """The endpoint asked us to slow down (HTTP 429)."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"rate limited, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class SPARQLWrapperBackend:
+    """SPARQL 1.1 endpoint over SPARQLWrapper (one client per thread)."""
+
+    def __init__(self, endpoint=WIKIDATA_ENDPOINT, agent=USER_AGENT):
+        self.endpoint = endpoint
+        self.agent = agent
+        self._local = threading.local()
+
+    def _client(self):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            from SPARQLWrapper import JSON, SPARQLWrapper
+
+            client = self._local.client = SPARQLWrapper(self.endpoint, agent=self.agent)
+            client.setReturnFormat(JSON)
+        return client
+
+    def select(self, query, timeout):
+        client = self._client()
+        client.setQuery(query)
+        client.setTimeout(timeout)
+        try:
+            return client.query().convert()["results"]["bindings"]
+        except HTTPError as e:
+            if e.code == 429:
+                raise RateLimited(float(e.headers.get("Retry-After") or 60)) from e
+            raise
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` acquisitions per second, bursts of `capacity`."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hand out no tokens for the next `seconds` (all workers wait)."""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+def coord_key(lat, lon):
+    """Checkpoint key of a coordinate pair."""
+    return f"{lat:.6f},{lon:.6f}"
+
+
+def snap_to_grid(lats, lons, grid_m):
+    """
+    Centres of the ~grid_m x grid_m cells of the coordinates (arrays).
+
+    Rows are grid_m tall; the cell width in degrees follows the latitude of
+    the row, so cells are square on the ground and only depend on grid_m
+    (checkpoint keys stay stable). grid_m <= 0 keeps the exact coordinates.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    if grid_m <= 0:
+        return lats, lons
+    dlat = grid_m / METERS_PER_DEGREE
+    centre_lats = (np.floor(lats / dlat) + 0.5) * dlat
+    dlon = dlat / np.cos(np.radians(centre_lats))
+    centre_lons = (np.floor(lons / dlon) + 0.5) * dlon
+    return centre_lats, centre_lons
+
+
+def parse_answer(bindings):
+    """(status, name, code, uri) of the nearest item in the bindings."""
+    if not bindings:
+        return "none", "", "", ""
+    uri = bindings[0]["item"]["value"]
+    name = bindings[0].get("itemLabel", {}).get("value", "")
+    return "ok", name, uri.rsplit("/", 1)[-1], uri
+
+
+class WikidataLinker:
+    """Nearest Wikidata item per coordinate, with a persistent checkpoint."""
+
+    def __init__(self, backend, checkpoint, workers=4, rate=5.0, retries=2, timeout=15):
+        self.backend = backend
+        self.checkpoint = checkpoint
+        self.workers = workers
+        self.bucket = TokenBucket(rate)
+        self.retries = retries
+        self.timeout = timeout
+        self.answers = self._load()
+
+    def _load(self):
+        """Latest entry per key (later lines win; a torn last line is ignored)."""
+        answers = {}
+        if self.checkpoint.exists():
+            with open(self.checkpoint, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    answers[entry["key"]] = entry
+        return answers
+
+    def pending(self, coords):
+        """Keys of coords that are not answered yet (new or failed)."""
+        return [
+            key for key in coords
+            if self.answers.get(key, {}).get("status") not in ("ok", "none")
+        ]
+
+    def lookup(self, key, lat, lon):
+        """Query one coordinate, retrying with backoff; returns its checkpoint entry."""
+        query = AROUND_QUERY.format(lat=lat, lon=lon)
+        entry = {"key": key, "lat": lat, "lon": lon}
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            try:
+                status, name, code, uri = parse_answer(self.backend.select(query, self.timeout))
+                return {**entry, "status": status, "name": name, "code": code, "uri": uri}
+            except RateLimited as e:
+                self.bucket.pause(e.retry_after)
+                error = str(e)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                if attempt < self.retries:
+                    time.sleep(2 ** attempt)
+        return {**entry, "status": "error", "name": "", "code": "", "uri": "", "error": error}
+
+    def link(self, coords, progress_every=500):
+        """
+        Answer every key of coords ({key: (lat, lon)}), querying only the
+        pending ones. Returns {"cached", "queried", "failed"} counts.
+        """
+        todo = self.pending(coords)
+        stats = {"cached": len(coords) - len(todo), "queried": 0, "failed": 0}
+        if not todo:
+            return stats
+
+        self.checkpoint.parent.mkdir(parents=True, exist_ok=True)
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            with open(self.checkpoint, "a", encoding="utf-8") as out:
+                futures = [pool.submit(self.lookup, key, *coords[key]) for key in todo]
+                for future in as_completed(futures):
+                    entry = future.result()
+                    self.answers[entry["key"]] = entry
+                    out.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                    out.flush()
+                    stats["queried"] += 1
+                    stats["failed"] += entry["status"] == "error"
+                    if stats["queried"] % progress_every == 0:
+                        print(f"  Progress: {stats['queried']}/{len(todo)} ({stats['queried'] / len(todo) * 100:.1f}%)")
+        finally:
+            # On Ctrl-C drop the queued lookups; the checkpoint keeps what is done
+            pool.shutdown(wait=True, cancel_futures=True)
+        self.compact()
+        return stats
+
+    def compact(self):
+        """Rewrite the checkpoint with one line per key."""
+        tmp = self.checkpoint.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as out:
+            for entry in self.answers.values():
+                out.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        tmp.replace(self.checkpoint)
+
+    def answer(self, key):
+        """(name, code, uri) for key; empty strings when unknown or failed."""
+        entry = self.answers.get(key)
+        if entry is None or entry["status"] != "ok":
+            return "", "", ""
+        return entry["name"], entry["code"], entry["uri"]
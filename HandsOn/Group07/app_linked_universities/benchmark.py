@@ -0,0 +1,288 @@
+"""
+benchmark.py
+Load test / latency benchmark for the Linked Universities Data Explorer API.
+
+Replays a weighted mix of realistic requests (searches, filters, /instances
+for every class, the map and raw SPARQL) and reports, per endpoint:
+count, errors, throughput and p50/p95/p99 latency.
+
+By default the Flask app is imported and driven in-process through its test
+client (no server needed). With --url the same mix is sent over HTTP to a
+running backend (python app.py or serve.py), optionally with several
+concurrent clients.
+
+Results can be saved as JSON and compared with a previous run to catch
+regressions between commits.
+
+Run:
+    python benchmark.py --requests 100 --output bench.json
+    python benchmark.py --url http://localhost:5000 --concurrency 4 --output bench.json
+    python benchmark.py --requests 100 --compare bench-main.json --threshold 0.2
+"""
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# -----------------------------------------------------------
+# Request mix: (endpoint name, method, path, params or JSON body, weight)
+# -----------------------------------------------------------
+
+SPARQL_UNIVERSITIES = """
+PREFIX lude: <http://spanishuniversities.data.es/lude/ontology#>
+PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+
+SELECT ?uni ?label
+WHERE {
+    ?uni a lude:University ;
+         rdfs:label ?label .
+}
+ORDER BY ?label
+"""
+
+CLASSES = ["University", "Municipality", "Province", "Degree",
+           "AutonomousCommunity", "AcademicLevel", "KnowledgeArea"]
+
+MIX = [
+    ("search/degrees", "GET", "/search/degrees", {"q": "matemáticas"}, 4),
+    ("search/degrees", "GET", "/search/degrees", {"q": "ingeniería", "ac": "aragon"}, 2),
+    ("search/universities", "GET", "/search/universities", {"q": "universidad"}, 4),
+    ("search/universities", "GET", "/search/universities", {"q": "madrid"}, 2),
+    ("filter/degrees", "GET", "/filter/degrees", {"ac": "aragon"}, 3),
+    ("filter/degrees", "GET", "/filter/degrees", {"ac": "murcia", "area": "ciencias"}, 2),
+    ("filter/degrees", "GET", "/filter/degrees", {"university": "oviedo", "level": "grado"}, 1),
+    ("map/universities", "GET", "/map/universities", None, 4),
+    ("sparql", "POST", "/sparql", {"query": SPARQL_UNIVERSITIES}, 2),
+] + [
+    (f"instances/{cls}", "GET", "/instances", {"class": cls}, 1) for cls in CLASSES
+]
+
+
+def build_plan(n, seed):
+    """Weighted random sample of the mix, reproducible with the same seed."""
+    rng = random.Random(seed)
+    weights = [item[-1] for item in MIX]
+    return rng.choices(MIX, weights=weights, k=n)
+
+
+# -----------------------------------------------------------
+# Clients
+# -----------------------------------------------------------
+
+def in_process_client():
+    """Import app.py and return send(method, path, payload) -> (status, body)."""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as lude
+
+    client = lude.app.test_client()
+
+    def send(method, path, payload):
+        if method == "POST":
+            resp = client.post(path, json=payload)
+        else:
+            resp = client.get(path, query_string=payload)
+        return resp.status_code, resp.get_data()
+
+    return send
+
+
+def http_client(base):
+    import requests
+
+    session = requests.Session()
+
+    def send(method, path, payload):
+        if method == "POST":
+            resp = session.post(base + path, json=payload)
+        else:
+            resp = session.get(base + path, params=payload)
+        return resp.status_code, resp.content
+
+    return send
+
+
+def timed(send, item):
+    name, method, path, payload, _ = item
+    start = time.perf_counter()
+    try:
+        status, body = send(method, path, payload)
+    except Exception:
+        return name, time.perf_counter() - start, False
+    elapsed = time.perf_counter() - start
+    # The API reports query errors as {"error": ...} with status 200
+    ok = status < 400 and b'"error"' not in body[:200]
+    return name, elapsed, ok
+
+
+# -----------------------------------------------------------
+# Statistics
+# -----------------------------------------------------------
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(samples, wall):
+    per_endpoint = {}
+    for name, latency, ok in samples:
+        per_endpoint.setdefault(name, []).append((latency, ok))
+
+    def stats(entries):
+        lat = sorted(l for l, _ in entries)
+        return {
+            "count": len(entries),
+            "errors": sum(1 for _, ok in entries if not ok),
+            # Requests of this kind completed per second of the measured run
+            "throughput_rps": round(len(entries) / wall, 3) if wall else None,
+            "mean_ms": round(1000 * sum(lat) / len(lat), 3),
+            "p50_ms": round(1000 * percentile(lat, 50), 3),
+            "p95_ms": round(1000 * percentile(lat, 95), 3),
+            "p99_ms": round(1000 * percentile(lat, 99), 3),
+        }
+
+    endpoints = {name: stats(entries) for name, entries in sorted(per_endpoint.items())}
+    return {"total": stats([(l, ok) for _, l, ok in samples]), "endpoints": endpoints}
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except Exception:
+        return None
+
+
+# -----------------------------------------------------------
+# Comparison
+# -----------------------------------------------------------
+
+def mismatches(baseline, current):
+    """Reasons why two reports cannot be compared (empty when they can)."""
+    reasons = []
+    for key in ("mode", "concurrency"):
+        if baseline.get(key) != current.get(key):
+            reasons.append(f"{key} {baseline.get(key)} vs {current.get(key)}")
+    if set(baseline["endpoints"]) != set(current["endpoints"]):
+        reasons.append("different endpoints requested (check --requests and --seed)")
+    return reasons
+
+
+def compare(baseline, current, threshold):
+    """
+    Return (rows, regressions). A regression is a p50 or p95 that grew
+    by more than `threshold` (0.2 = 20%) compared with the baseline, or
+    an endpoint that failed more often. Raises ValueError when the runs
+    were not made under the same conditions.
+    """
+    reasons = mismatches(baseline, current)
+    if reasons:
+        raise ValueError("; ".join(reasons))
+    rows, regressions = [], []
+    for name, cur in current["endpoints"].items():
+        base = baseline["endpoints"][name]
+        if cur["errors"] != base["errors"]:
+            worse = cur["errors"] > base["errors"]
+            rows.append((name, "errors", base["errors"], cur["errors"], None, worse))
+            if worse:
+                regressions.append((name, "errors", cur["errors"] - base["errors"]))
+        for metric in ("p50_ms", "p95_ms"):
+            change = (cur[metric] - base[metric]) / base[metric] if base[metric] else 0.0
+            rows.append((name, metric, base[metric], cur[metric], change, change > threshold))
+            if change > threshold:
+                regressions.append((name, metric, change))
+    return rows, regressions
+
+
+# -----------------------------------------------------------
+# Main
+# -----------------------------------------------------------
+
+def print_report(report):
+    print(f"\n{'endpoint':28} {'n':>5} {'err':>4} {'rps':>8} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    rows = list(report["endpoints"].items()) + [("TOTAL", report["total"])]
+    for name, s in rows:
+        print(f"{name:28} {s['count']:>5} {s['errors']:>4} {s['throughput_rps']:>8} "
+              f"{s['p50_ms']:>10} {s['p95_ms']:>10} {s['p99_ms']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the LUDE REST API")
+    parser.add_argument("--url", help="benchmark a running server over HTTP instead of in-process")
+    parser.add_argument("--requests", type=int, default=100, help="number of measured requests")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests sent first")
+    parser.add_argument("--concurrency", type=int, default=1, help="parallel clients (HTTP mode only)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="baseline JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative p50/p95 increase reported as a regression")
+    args = parser.parse_args()
+
+    # Read the baseline first: --output may be the same file
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    if args.url:
+        send = http_client(args.url.rstrip("/"))
+        concurrency = args.concurrency
+    else:
+        send = in_process_client()
+        concurrency = 1      # the test client drives one app instance
+
+    plan = build_plan(args.warmup + args.requests, args.seed)
+    for item in plan[:args.warmup]:
+        timed(send, item)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(lambda item: timed(send, item), plan[args.warmup:]))
+    wall = time.perf_counter() - start
+
+    report = {
+        "commit": git_commit(),
+        "mode": "http" if args.url else "in-process",
+        "url": args.url,
+        "requests": args.requests,
+        "concurrency": concurrency,
+        "seed": args.seed,
+        "wall_seconds": round(wall, 3),
+        **summarize(samples, wall),
+    }
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved report to {args.output}")
+
+    if baseline is not None:
+        try:
+            rows, regressions = compare(baseline, report, args.threshold)
+        except ValueError as e:
+            sys.exit(f"\nCannot compare with {args.compare}: {e}")
+        print(f"\n=== COMPARE with {args.compare} (commit {baseline.get('commit')}) ===")
+        for name, metric, old, new, change, regressed in rows:
+            flag = "  <-- REGRESSION" if regressed else ""
+            delta = f"{new - old:+d}" if change is None else f"{change:+.1%}"
+            print(f"{name:28} {metric:7} {old:>10} -> {new:>10} ({delta}){flag}")
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) (latency above +{args.threshold:.0%} or more errors)")
+            sys.exit(1)
+        print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
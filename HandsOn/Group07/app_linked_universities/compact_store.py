@@ -0,0 +1,288 @@
+#############################################################
+# Linked Universities Data Explorer — Compact read-only store
+# Immutable RDFlib store backed by flat NumPy arrays
+#############################################################
+#
+# The default RDFlib Memory store keeps every triple as Python
+# tuples inside nested dicts. After a fork, simply *reading* those
+# objects bumps their reference counts, so every worker slowly
+# copies the whole graph into private memory.
+#
+# This store keeps the dataset in a handful of contiguous buffers
+# instead:
+#   - a sorted term dictionary (one UTF-8 blob + offsets)
+#   - three sorted int64 key arrays (SPO, POS, OSP)
+# Nothing inside those buffers is a Python object, so forked
+# workers only ever read the pages and they stay shared.
+#
+# Terms are decoded on demand into fresh RDFlib nodes, with a small
+# per-process LRU cache in front of the decoder.
+#############################################################
+
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+from rdflib import BNode, Graph, Literal, URIRef
+from rdflib.store import Store
+
+
+#############################################################
+# Term encoding
+#############################################################
+
+SEP = "\x00"
+ID_BITS = 21                      # up to ~2M distinct terms
+ID_MASK = (1 << ID_BITS) - 1
+MAX_TERMS = 1 << ID_BITS
+
+SNAPSHOT_ARRAYS = ("blob", "offsets", "spo", "pos", "osp")
+
+
+def encode_term(term):
+    """
+    Encode an RDFlib node as a plain string.
+    Literals keep their language tag and datatype so equality
+    matches the Memory store.
+    """
+    if isinstance(term, Literal):
+        return SEP.join(("L", str(term), term.language or "", term.datatype or ""))
+    if isinstance(term, BNode):
+        return "B" + SEP + str(term)
+    return "U" + SEP + str(term)
+
+
+def decode_term(text):
+    """Inverse of encode_term()."""
+    parts = text.split(SEP)
+    if parts[0] == "L":
+        return Literal(parts[1], lang=parts[2] or None,
+                       datatype=URIRef(parts[3]) if parts[3] else None)
+    if parts[0] == "B":
+        return BNode(parts[1])
+    return URIRef(parts[1])
+
+
+def pack(a, b, c):
+    """Pack three term ids into one sortable int64 key."""
+    return (a << (2 * ID_BITS)) | (b << ID_BITS) | c
+
+
+#############################################################
+# Store
+#############################################################
+
+class CompactStore(Store):
+    """
+    Read-only RDFlib store over sorted integer arrays.
+    Build it with CompactStore.from_graph() or CompactStore.load().
+    """
+
+    context_aware = False
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = False
+
+    def __init__(self, blob, offsets, spo, pos, osp, namespaces=()):
+        super().__init__()
+        self.blob = blob
+        self.offsets = offsets
+        self.spo = spo
+        self.pos = pos
+        self.osp = osp
+        self.n_terms = len(offsets) - 1
+        self._namespaces = dict(namespaces)
+        # Per-process caches: these live in each worker's private memory
+        self._term = lru_cache(maxsize=65536)(self._decode)
+        self._id = lru_cache(maxsize=65536)(self._lookup)
+
+    #########################################################
+    # Construction / snapshots
+    #########################################################
+
+    @classmethod
+    def from_graph(cls, graph):
+        """Build a compact store from any RDFlib graph."""
+        encoded = sorted({encode_term(t) for triple in graph for t in triple})
+        if len(encoded) >= MAX_TERMS:
+            raise ValueError(f"Too many distinct terms for CompactStore: {len(encoded)}")
+
+        ids = {text: i for i, text in enumerate(encoded)}
+        raw = [text.encode("utf-8") for text in encoded]
+        offsets = np.zeros(len(raw) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(r) for r in raw])
+        blob = np.frombuffer(b"".join(raw), dtype=np.uint8)
+
+        rows = np.array(
+            [[ids[encode_term(t)] for t in triple] for triple in graph],
+            dtype=np.int64,
+        ).reshape(-1, 3)
+        s, p, o = rows[:, 0], rows[:, 1], rows[:, 2]
+
+        return cls(
+            blob, offsets,
+            np.sort(pack(s, p, o)),
+            np.sort(pack(p, o, s)),
+            np.sort(pack(o, s, p)),
+            namespaces=[(prefix, str(ns)) for prefix, ns in graph.namespaces()],
+        )
+
+    def save(self, directory):
+        """Write the arrays as .npy files so they can be memory-mapped later."""
+        os.makedirs(directory, exist_ok=True)
+        for name in SNAPSHOT_ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(directory, "namespaces.json"), "w", encoding="utf-8") as f:
+            json.dump(self._namespaces, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Open a snapshot written by save().
+        Arrays are memory-mapped, so every process sharing the snapshot
+        shares the same page-cache pages.
+        """
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+            for name in SNAPSHOT_ARRAYS
+        }
+        with open(os.path.join(directory, "namespaces.json"), encoding="utf-8") as f:
+            namespaces = json.load(f)
+        return cls(namespaces=namespaces.items(), **arrays)
+
+    #########################################################
+    # Term dictionary
+    #########################################################
+
+    def _text(self, i):
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.blob[start:end].tobytes().decode("utf-8")
+
+    def _decode(self, i):
+        return decode_term(self._text(i))
+
+    def _lookup(self, text):
+        """Binary search the sorted term dictionary; None if absent."""
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            found = self._text(mid)
+            if found < text:
+                lo = mid + 1
+            elif found > text:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def term_id(self, term):
+        return self._id(encode_term(term))
+
+    #########################################################
+    # Store API
+    #########################################################
+
+    def _scan(self, keys, prefix, width):
+        """Slice of a sorted key array whose first `width` ids equal `prefix`."""
+        shift = (3 - width) * ID_BITS
+        lo = np.searchsorted(keys, prefix << shift, side="left")
+        hi = np.searchsorted(keys, (prefix + 1) << shift, side="left")
+        return keys[lo:hi]
+
+    def triples(self, triple_pattern, context=None):
+        s, p, o = triple_pattern
+        ids = []
+        for term in (s, p, o):
+            if term is None:
+                ids.append(None)
+                continue
+            i = self.term_id(term)
+            if i is None:
+                return
+            ids.append(i)
+        si, pi, oi = ids
+
+        # Pick the permutation whose prefix covers the bound positions
+        if si is not None and pi is not None and oi is not None:
+            keys, order = self._scan(self.spo, pack(si, pi, oi), 3), "spo"
+        elif si is not None and pi is not None:
+            keys, order = self._scan(self.spo, (si << ID_BITS) | pi, 2), "spo"
+        elif si is not None and oi is not None:
+            keys, order = self._scan(self.osp, (oi << ID_BITS) | si, 2), "osp"
+        elif pi is not None and oi is not None:
+            keys, order = self._scan(self.pos, (pi << ID_BITS) | oi, 2), "pos"
+        elif si is not None:
+            keys, order = self._scan(self.spo, si, 1), "spo"
+        elif pi is not None:
+            keys, order = self._scan(self.pos, pi, 1), "pos"
+        elif oi is not None:
+            keys, order = self._scan(self.osp, oi, 1), "osp"
+        else:
+            keys, order = self.spo, "spo"
+
+        a = (keys >> (2 * ID_BITS)).tolist()
+        b = ((keys >> ID_BITS) & ID_MASK).tolist()
+        c = (keys & ID_MASK).tolist()
+        columns = dict(zip(order, (a, b, c)))
+
+        term = self._term
+        for x, y, z in zip(columns["s"], columns["p"], columns["o"]):
+            yield (term(x), term(y), term(z)), iter(())
+
+    def __len__(self, context=None):
+        return len(self.spo)
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    def add(self, triple, context, quoted=False):
+        raise TypeError("CompactStore is read-only")
+
+    def addN(self, quads):  # noqa: N802
+        raise TypeError("CompactStore is read-only")
+
+    def remove(self, triple, context=None):
+        raise TypeError("CompactStore is read-only")
+
+    # Namespace bindings are tiny and per-process, so they stay mutable
+    def bind(self, prefix, namespace, override=True):
+        if override or prefix not in self._namespaces:
+            self._namespaces[prefix] = str(namespace)
+
+    def namespace(self, prefix):
+        ns = self._namespaces.get(prefix)
+        return URIRef(ns) if ns is not None else None
+
+    def prefix(self, namespace):
+        for prefix, ns in self._namespaces.items():
+            if ns == str(namespace):
+                return prefix
+        return None
+
+    def namespaces(self):
+        for prefix, ns in self._namespaces.items():
+            yield prefix, URIRef(ns)
+
+
+#############################################################
+# Helpers
+#############################################################
+
+def load_compact_graph(data_file, snapshot_dir=None):
+    """
+    Return a read-only Graph over a CompactStore.
+    If snapshot_dir holds a snapshot newer than data_file it is
+    memory-mapped; otherwise data_file is parsed and, when
+    snapshot_dir is given, a fresh snapshot is written there.
+    """
+    marker = os.path.join(snapshot_dir, "spo.npy") if snapshot_dir else None
+    if marker and os.path.exists(marker) and os.path.getmtime(marker) >= os.path.getmtime(data_file):
+        store = CompactStore.load(snapshot_dir)
+    else:
+        source = Graph()
+        source.parse(data_file, format="turtle")
+        store = CompactStore.from_graph(source)
+        if snapshot_dir:
+            store.save(snapshot_dir)
+    return Graph(store=store, bind_namespaces="none")
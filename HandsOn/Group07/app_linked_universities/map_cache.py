@@ -0,0 +1,184 @@
+#############################################################
+# Linked Universities Data Explorer — Map cache
+# Precomputed GeoJSON and regional aggregates
+#############################################################
+#
+# The map data never changes while the app is running, so it is
+# computed once at load time instead of on every map load:
+#   - the legacy /map/universities rows
+#   - a GeoJSON FeatureCollection with one point per university
+#   - per-community and per-province aggregates
+#     (university count, degree count, centroid)
+#
+# Every payload is serialized once and stored as bytes with an
+# ETag, so requests are answered straight from memory and clients
+# that already have the data get a 304.
+#############################################################
+
+import hashlib
+import json
+
+from rdflib import Namespace, RDF, RDFS
+
+
+LUDE = Namespace("http://spanishuniversities.data.es/lude/ontology#")
+GEO = Namespace("http://www.w3.org/2003/01/geo/wgs84_pos#")
+
+# Zoom levels (Leaflet) at which the map switches detail level
+MIN_ZOOM, MAX_ZOOM = 0, 18  # range of the map's tile layers
+COMMUNITY_MAX_ZOOM = 5      # <= 5: one point per autonomous community
+PROVINCE_MAX_ZOOM = 7       # 6-7: one point per province, >= 8: universities
+
+LEVELS = ("community", "province", "university")
+
+
+class CachedPayload:
+    """Serialized JSON body plus its ETag."""
+
+    def __init__(self, data):
+        self.body = json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+        self.etag = hashlib.sha1(self.body).hexdigest()
+
+
+def _label(g, node):
+    """Smallest label of a node, so the choice is stable across runs."""
+    labels = sorted(str(l) for l in g.objects(node, RDFS.label))
+    return labels[0] if labels else None
+
+
+def _float(literal):
+    try:
+        return float(literal)
+    except (TypeError, ValueError):
+        return None
+
+
+def _centroid(points):
+    """Mean [long, lat] of a list of [long, lat] pairs."""
+    if not points:
+        return None
+    return [round(sum(p[0] for p in points) / len(points), 6),
+            round(sum(p[1] for p in points) / len(points), 6)]
+
+
+class MapCache:
+    """All map payloads for one graph, computed once."""
+
+    def __init__(self, legacy_rows, universities, region_degrees):
+        """
+        universities: one dict per university (see from_graph)
+        region_degrees: {"community": {name: n}, "province": {name: n}}
+        with the number of distinct degrees offered in each region
+        """
+        self.universities = universities
+        self.legacy = CachedPayload({"results": legacy_rows, "count": len(legacy_rows)})
+        self.points = CachedPayload(self._collection([
+            self._feature(u["long"], u["lat"], {k: v for k, v in u.items() if k not in ("long", "lat")})
+            for u in universities
+        ]))
+
+        self.aggregates = {
+            "community": self._aggregate("autonomousCommunity", region_degrees["community"]),
+            "province": self._aggregate("province", region_degrees["province"]),
+        }
+        self.aggregate_json = {
+            level: CachedPayload({"by": level, "results": rows, "count": len(rows)})
+            for level, rows in self.aggregates.items()
+        }
+        self.aggregate_geojson = {
+            level: CachedPayload(self._collection([
+                self._feature(row["centroid"][0], row["centroid"][1],
+                              {k: v for k, v in row.items() if k != "centroid"})
+                for row in rows
+            ], level=level))
+            for level, rows in self.aggregates.items()
+        }
+
+    #########################################################
+    # Building
+    #########################################################
+
+    @classmethod
+    def from_graph(cls, g, legacy_query, run_query):
+        """
+        legacy_query is the original /map/universities SPARQL, run once
+        through run_query (app.execute_query) to keep its exact output.
+        """
+        legacy = run_query(legacy_query)
+        rows = sorted(legacy.get("results", []),
+                      key=lambda r: (r.get("name") or "", r.get("university") or ""))
+
+        universities = []
+        region_degrees = {"community": {}, "province": {}}
+        for uni in sorted(g.subjects(RDF.type, LUDE.University)):
+            lat = next((_float(v) for v in g.objects(uni, GEO.lat)), None)
+            long = next((_float(v) for v in g.objects(uni, GEO.long)), None)
+            if lat is None or long is None:
+                continue
+
+            province = community = None
+            for addr in g.objects(uni, LUDE.hasAddress):
+                for mun in g.objects(addr, LUDE.locatedInMunicipality):
+                    for prov in g.objects(mun, LUDE.partOfProvince):
+                        province = _label(g, prov)
+                        community = next((_label(g, ac) for ac in
+                                          g.objects(prov, LUDE.partOfAutonomousCommunity)), None)
+
+            degrees = set(g.objects(uni, LUDE.offers))
+            # A degree offered by two universities of a region counts once there
+            region_degrees["community"].setdefault(community, set()).update(degrees)
+            region_degrees["province"].setdefault(province, set()).update(degrees)
+            universities.append({
+                "university": str(uni),
+                "name": _label(g, uni),
+                "lat": lat,
+                "long": long,
+                "province": province,
+                "autonomousCommunity": community,
+                "degrees": len(degrees),
+            })
+
+        region_degrees = {level: {name: len(d) for name, d in regions.items()}
+                          for level, regions in region_degrees.items()}
+        return cls(rows, universities, region_degrees)
+
+    def _aggregate(self, key, degrees):
+        groups = {}
+        for u in self.universities:
+            groups.setdefault(u[key], []).append(u)
+        return [
+            {
+                "name": name,
+                "universities": len(members),
+                "degrees": degrees.get(name, 0),
+                "centroid": _centroid([[m["long"], m["lat"]] for m in members]),
+            }
+            for name, members in sorted(groups.items(), key=lambda item: item[0] or "")
+        ]
+
+    @staticmethod
+    def _feature(long, lat, properties):
+        return {"type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [long, lat]},
+                "properties": properties}
+
+    @staticmethod
+    def _collection(features, level="university"):
+        return {"type": "FeatureCollection", "level": level, "features": features}
+
+    #########################################################
+    # Lookup
+    #########################################################
+
+    def for_zoom(self, zoom=None, level=None):
+        """GeoJSON payload for a map zoom level (or an explicit level)."""
+        if level is None:
+            if zoom is None or zoom > PROVINCE_MAX_ZOOM:
+                level = "university"
+            elif zoom > COMMUNITY_MAX_ZOOM:
+                level = "province"
+            else:
+                level = "community"
+        if level == "university":
+            return self.points
+        return self.aggregate_geojson[level]
@@ -0,0 +1,170 @@
+#############################################################
+# Linked Universities Data Explorer — Query profiler
+# SPARQL algebra tree annotated with time and row counts
+#############################################################
+#
+# RDFlib evaluates a query by walking its algebra tree
+# (Project -> OrderBy -> LeftJoin -> BGP ...) with evalPart().
+# While a profile is active, a custom evaluation hook wraps the
+# iterator returned for every node and records:
+#   - calls:   how many times the node was evaluated
+#              (the right side of an OPTIONAL runs once per left row)
+#   - rows:    solutions produced, summed over all calls
+#   - time_ms: time spent pulling those rows (children included)
+#   - self_ms: time_ms minus the time spent in the children
+#
+# The hook is registered once at import and stays registered
+# (adding or removing it while another thread is evaluating a query
+# would change CUSTOM_EVALS under RDFlib's iteration). It steps aside
+# unless a profile is running, and only the thread that started the
+# profile is measured.
+#############################################################
+
+import threading
+import time
+from collections.abc import Mapping
+
+from rdflib.plugins.sparql import CUSTOM_EVALS, prepareQuery
+from rdflib.plugins.sparql import evaluate
+from rdflib.plugins.sparql.parserutils import CompValue
+from rdflib.term import Node
+
+
+HOOK_NAME = "lude_profiler"
+
+# Nodes that return a result dict instead of a stream of solutions
+QUERY_FORMS = {"SelectQuery", "AskQuery", "ConstructQuery", "DescribeQuery"}
+
+_local = threading.local()
+
+
+def _profiled_eval(ctx, part):
+    """CUSTOM_EVALS hook: time the default evaluation of `part`."""
+    profiler = getattr(_local, "profiler", None)
+    if profiler is None or part.name in QUERY_FORMS:
+        raise NotImplementedError
+    if getattr(_local, "skip", None) is part:
+        # Second pass for the same node: let RDFlib evaluate it
+        _local.skip = None
+        raise NotImplementedError
+
+    _local.skip = part
+    stat = profiler.stats.setdefault(id(part), [0, 0, 0.0, 0.0])
+    stat[0] += 1
+    # Some operators (ORDER BY, Project, non-lazy joins) do work right
+    # away instead of on iteration, so the call itself is timed too
+    result = profiler.timed_call(stat, evaluate.evalPart, ctx, part)
+    if isinstance(result, Mapping):
+        return result
+    return profiler.wrap(stat, result)
+
+
+CUSTOM_EVALS[HOOK_NAME] = _profiled_eval
+
+
+class QueryProfiler:
+    """
+    Context manager that profiles one query on one graph.
+
+        profiler = QueryProfiler(g, sparql)
+        with profiler:
+            rows = list(g.query(profiler.query))
+        profiler.report()
+    """
+
+    def __init__(self, graph, sparql):
+        self.graph = graph
+        self.query = prepareQuery(sparql, initNs=dict(graph.namespaces()))
+        self.stats = {}      # id(part) -> [calls, rows, time, child_time]
+        self.stack = []
+        self.total = 0.0
+
+    def __enter__(self):
+        _local.profiler = self
+        _local.skip = None
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.total = time.perf_counter() - self._start
+        _local.profiler = None
+        return False
+
+    def timed_call(self, stat, func, *args):
+        """Call func(*args), charging the elapsed time to `stat` and its parent."""
+        self.stack.append(stat)
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stack.pop()
+            stat[2] += elapsed
+            if self.stack:
+                self.stack[-1][3] += elapsed
+
+    def wrap(self, stat, iterable):
+        iterator = iter(iterable)
+        while True:
+            try:
+                row = self.timed_call(stat, next, iterator)
+            except StopIteration:
+                return
+            stat[1] += 1
+            yield row
+
+    #########################################################
+    # Report
+    #########################################################
+
+    def report(self):
+        return {"total_ms": round(1000 * self.total, 3),
+                "plan": self._node(self.query.algebra)}
+
+    def _node(self, part):
+        calls, rows, spent, child = self.stats.get(id(part), [0, 0, 0.0, 0.0])
+        node = {"op": part.name}
+        nsm = self.graph.namespace_manager
+
+        if part.name == "BGP":
+            node["triples"] = [" ".join(_text(t, nsm) for t in triple) for triple in part.triples]
+        elif part.name in ("Filter", "LeftJoin") and part.expr is not None \
+                and getattr(part.expr, "name", None) != "TrueFilter":
+            node["expr"] = _text(part.expr, nsm)
+        elif part.name == "Extend":
+            node["var"] = _text(part.var, nsm)
+        elif part.name in ("Project", "SelectQuery"):
+            node["vars"] = [_text(v, nsm) for v in part.PV]
+
+        if part.name not in QUERY_FORMS:
+            node.update({
+                "calls": calls,
+                "rows": rows,
+                "time_ms": round(1000 * spent, 3),
+                "self_ms": round(1000 * (spent - child), 3),
+            })
+
+        children = [self._node(part[k]) for k in ("p", "p1", "p2")
+                    if k in part and isinstance(part[k], CompValue)]
+        if children:
+            node["children"] = children
+        return node
+
+
+def _text(expr, nsm):
+    """Short, readable SPARQL-like text for terms and filter expressions."""
+    if isinstance(expr, CompValue):
+        if expr.name.startswith("Builtin_"):
+            args = [expr[k] for k in ("arg", "arg1", "arg2", "arg3") if k in expr]
+            return f"{expr.name[len('Builtin_'):]}({', '.join(_text(a, nsm) for a in args)})"
+        if expr.name == "RelationalExpression":
+            return f"{_text(expr.expr, nsm)} {expr.op} {_text(expr.other, nsm)}"
+        if expr.name in ("ConditionalAndExpression", "ConditionalOrExpression"):
+            op = " && " if expr.name == "ConditionalAndExpression" else " || "
+            return "(" + op.join(_text(e, nsm) for e in [expr.expr] + list(expr.other or [])) + ")"
+        return expr.name
+    if isinstance(expr, (list, tuple)):
+        return ", ".join(_text(e, nsm) for e in expr)
+    if isinstance(expr, Node):
+        return expr.n3(nsm)
+    return str(expr)
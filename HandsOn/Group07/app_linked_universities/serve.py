@@ -0,0 +1,127 @@
+"""
+serve.py
+Multi-process server for the Linked Universities Data Explorer backend.
+
+app.run() serves every request from one process, so CPU-bound SPARQL
+queries queue up behind the GIL. This script:
+
+  1) loads the graph ONCE in the parent, into the read-only CompactStore
+     (optionally memory-mapped from a snapshot directory),
+  2) warms up the SPARQL parser and freezes the loaded objects out of
+     the garbage collector,
+  3) forks N workers that share the graph copy-on-write and accept
+     connections from a single listening socket.
+
+Unix only (uses os.fork).
+
+Run:
+    python serve.py --workers 4 --port 5000
+    python serve.py --workers 8 --snapshot snapshot   # reuse/write an mmap snapshot
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the LUDE API with N forked workers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--snapshot", default=None,
+                        help="directory for the memory-mapped graph snapshot")
+    return parser.parse_args()
+
+
+def load_app(snapshot):
+    """Import app.py with the compact store selected, then prepare it for forking."""
+    os.environ["LUDE_STORE"] = "compact"
+    if snapshot:
+        os.environ["LUDE_SNAPSHOT"] = snapshot
+    # Requests are already spread over the workers; do not fork again per query
+    os.environ.setdefault("LUDE_SHARD_PROCESSES", "1")
+
+    import app as lude
+
+    # The SPARQL grammar is built lazily on first use; do it here (on the
+    # SELECT path the endpoints use) so every worker inherits it instead
+    # of rebuilding it.
+    warmup = lude.execute_query(lude.PREFIXES + "SELECT ?s WHERE { ?s ?p ?o } LIMIT 1")
+    if "error" in warmup:
+        raise SystemExit(f"Warm-up query failed: {warmup['error']}")
+
+    # Move everything allocated so far to the permanent generation:
+    # the collector will no longer write to these objects in the workers.
+    gc.freeze()
+    return lude.app
+
+
+def run_worker(flask_app, sock):
+    from werkzeug.serving import make_server
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    host, port = sock.getsockname()[:2]
+    server = make_server(host, port, flask_app, fd=sock.fileno())
+    server.serve_forever()
+
+
+def spawn(flask_app, sock):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_worker(flask_app, sock)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def main():
+    args = parse_args()
+    flask_app = load_app(args.snapshot)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+
+    workers = {spawn(flask_app, sock) for _ in range(args.workers)}
+    print(f"LUDE API on http://{args.host}:{args.port} with {len(workers)} workers "
+          f"(parent pid {os.getpid()})", flush=True)
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # Supervise: restart workers that die until we are asked to stop
+    while workers:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        workers.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited, restarting", file=sys.stderr, flush=True)
+            workers.add(spawn(flask_app, sock))
+
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#############################################################
+# Linked Universities Data Explorer — Region shards
+# One named graph per autonomous community
+#############################################################
+#
+# The merged dataset is split into one named graph per autonomous
+# community (AC). Each shard holds everything that belongs to that
+# AC: the AC itself, its provinces and municipalities, the
+# universities located there (with their addresses and faculties)
+# and the degrees they offer.
+#
+# Small shared vocabularies (academic levels, knowledge areas, ...)
+# are copied into every shard, so each shard is a self-contained
+# graph and the app's queries run on it unchanged. Degrees with no
+# offering university go to an extra "unassigned" shard.
+#
+# Region-scoped queries only touch the matching shards; whole-country
+# queries fan out to every shard and the partial results are merged.
+# The shards are queried in parallel processes when start_pool() was
+# called at start-up (before the server creates any thread), otherwise
+# one after the other in the calling process.
+#############################################################
+
+import multiprocessing
+import os
+
+from rdflib import Graph, Namespace, RDF, RDFS, URIRef
+
+from compact_store import CompactStore
+
+
+LUDE = Namespace("http://spanishuniversities.data.es/lude/ontology#")
+GRAPH_NS = "http://spanishuniversities.data.es/lude/graph/"
+UNASSIGNED = URIRef(GRAPH_NS + "unassigned")
+
+# Dataset inherited by the fan-out worker processes (set before forking)
+_FORKED = None
+
+
+def _query_shard(runner, iri, sparql):
+    """Run in a forked worker: query one inherited shard."""
+    return runner(sparql, _FORKED.graphs[iri])
+
+
+def _shard_processes():
+    if not hasattr(os, "fork"):
+        return 1
+    return int(os.environ.get("LUDE_SHARD_PROCESSES", os.cpu_count() or 1))
+
+
+class ShardedDataset:
+    """
+    Named graphs keyed by graph IRI, plus a shard map from
+    AC label (lowercase) to graph IRI.
+    """
+
+    def __init__(self, graphs, shard_map):
+        self.graphs = graphs
+        self.shard_map = shard_map
+        self.processes = _shard_processes()
+        self._pool = None
+
+    @property
+    def parallel(self):
+        """True when fan-outs run in the worker pool."""
+        return self._pool is not None
+
+    #########################################################
+    # Building
+    #########################################################
+
+    @classmethod
+    def from_graph(cls, g, compact=False):
+        """Split a merged LUDE graph into per-AC named graphs."""
+        owner = {}       # subject -> set of graph IRIs
+        shard_map = {}
+
+        def assign(node, iris):
+            if iris:
+                owner.setdefault(node, set()).update(iris)
+
+        # Geography: AC <- province <- municipality <- address <- university
+        for ac in g.subjects(RDF.type, LUDE.AutonomousCommunity):
+            iri = URIRef(GRAPH_NS + str(ac).rstrip("/").rsplit("/", 1)[-1])
+            assign(ac, {iri})
+            for label in g.objects(ac, RDFS.label):
+                shard_map[str(label).lower()] = iri
+        for prov, ac in g.subject_objects(LUDE.partOfAutonomousCommunity):
+            assign(prov, owner.get(ac))
+        for mun, prov in g.subject_objects(LUDE.partOfProvince):
+            assign(mun, owner.get(prov))
+        for addr, mun in g.subject_objects(LUDE.locatedInMunicipality):
+            assign(addr, owner.get(mun))
+        for uni, addr in g.subject_objects(LUDE.hasAddress):
+            assign(uni, owner.get(addr))
+
+        # Degrees follow the universities that offer them
+        for uni, degree in g.subject_objects(LUDE.offers):
+            assign(degree, owner.get(uni))
+        for degree in g.subjects(RDF.type, LUDE.Degree):
+            if degree not in owner:
+                assign(degree, {UNASSIGNED})
+
+        # Faculties follow their universities and degrees
+        for uni, fac in g.subject_objects(LUDE.hasFaculty):
+            assign(fac, owner.get(uni))
+        for degree, fac in g.subject_objects(LUDE.deliveredAt):
+            assign(fac, owner.get(degree))
+
+        iris = set(shard_map.values()) | {UNASSIGNED}
+        graphs = {iri: Graph(identifier=iri) for iri in iris}
+        for triple in g:
+            for iri in owner.get(triple[0], iris):   # unowned -> shared by all
+                graphs[iri].add(triple)
+
+        for iri, graph in graphs.items():
+            for prefix, ns in g.namespaces():
+                graph.bind(prefix, ns)
+            if compact:
+                graphs[iri] = Graph(store=CompactStore.from_graph(graph),
+                                    identifier=iri, bind_namespaces="none")
+        return cls(graphs, shard_map)
+
+    #########################################################
+    # Routing
+    #########################################################
+
+    def shards_for(self, ac=""):
+        """
+        Graph IRIs whose AC label contains `ac` (same matching as the
+        FILTER(CONTAINS(LCASE(?acLabel), ...)) in the queries).
+        Empty `ac` selects every shard.
+        """
+        if not ac:
+            return sorted(self.graphs)
+        ac = ac.lower()
+        return sorted({iri for label, iri in self.shard_map.items() if ac in label})
+
+    def start_pool(self):
+        """
+        Fork the fan-out worker processes. Call once at start-up, while
+        the process is still single-threaded: forking later, from a
+        request thread, can deadlock on locks held by other threads.
+        Does nothing with fewer than two processes (or without fork).
+        """
+        global _FORKED
+        if self._pool is None and self.processes > 1:
+            _FORKED = self
+            # multiprocessing.Pool forks all its workers right here
+            self._pool = multiprocessing.get_context("fork").Pool(self.processes)
+        return self.parallel
+
+    def query(self, sparql, iris, runner, key=None, order_by=None):
+        """
+        Run `sparql` on each shard in `iris` with runner(sparql, graph)
+        (app.execute_query) and merge the {"results", "count"} dicts.
+        Rows sharing the same `key` value (e.g. a degree offered in two
+        ACs) are kept once, and rows are re-sorted on `order_by` to keep
+        the query's ORDER BY.
+        """
+        iris = list(iris)
+        if self._pool is not None and len(iris) > 1:
+            parts = self._pool.starmap(_query_shard, [(runner, iri, sparql) for iri in iris])
+        else:
+            parts = [runner(sparql, self.graphs[iri]) for iri in iris]
+
+        results, seen, profiles = [], set(), []
+        for iri, part in zip(iris, parts):
+            if "error" in part:
+                return part
+            if "profile" in part:
+                profiles.append({"graph": str(iri), **part["profile"]})
+            for row in part["results"]:
+                if key:
+                    if row.get(key) in seen:
+                        continue
+                    seen.add(row.get(key))
+                results.append(row)
+        if order_by:
+            results.sort(key=lambda row: row.get(order_by) or "")
+        data = {"results": results, "count": len(results), "shards": len(iris)}
+        if profiles:
+            data["profile"] = profiles
+        return data
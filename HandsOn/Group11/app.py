@@ -1,11 +1,19 @@
-from SPARQLWrapper import SPARQLWrapper, JSON
 import pandas as pd
 import streamlit as st
-import osmnx as ox
 import folium
 from streamlit_folium import st_folium
 from datetime import datetime
-import math
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SparqlTools"))
+from sparql_client import get_client
+
+from road_network import RoadNetwork
+from stop_index import StopIndex
+from journey import JourneyPlanner
+from line_index import LineIndex
+from timetable import Timetable, format_gtfs_time, parse_gtfs_time
 
 # ==============================
 # --- CONFIG ---
@@ -19,13 +27,11 @@ GRAPHDB_URL = "url of the graphdb repository"
 # ==============================
 @st.cache_resource
 def get_madrid_data():
-    G = ox.graph_from_place("Madrid, Spain", network_type="drive")
-    nodes_gdf = ox.graph_to_gdfs(G, edges=False)
-    center_point = nodes_gdf.unary_union.centroid
-    map_center = [center_point.y, center_point.x]
-    edges_gdf = ox.graph_to_gdfs(G, nodes=True, edges=False)
-    edges_gdf["geometry"] = edges_gdf["geometry"].simplify(tolerance=0.0005)
-    return edges_gdf, map_center
+    # Local snapshot written by `python road_network.py`; the edges are only read when used
+    network = RoadNetwork()
+    if not network.available:
+        st.warning("No road network snapshot found. Run `python road_network.py` once to create it.")
+    return network, network.map_center
 
 @st.cache_resource
 
@@ -44,12 +50,9 @@ def get_all_stops():
               geo:long ?lon .
     }
     """
-    sparql = SPARQLWrapper(GRAPHDB_URL)
-    sparql.setQuery(query)
-    sparql.setReturnFormat(JSON)
     stops = []
     try:
-        results = sparql.query().convert()
+        results = get_client(GRAPHDB_URL).query(query)
         for r in results["results"]["bindings"]:
             stops.append({
                 "stopId": r["stopId"]["value"],
@@ -61,24 +64,43 @@ def get_all_stops():
         st.error(f"Error querying GraphDB: {e}")
     return pd.DataFrame(stops)
 
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371.0  # km
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    a = math.sin(dphi/2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
-#Calculate de nearest stops with the haversine function
+@st.cache_resource
+def get_stop_index():
+    return StopIndex(get_all_stops())
+
+#Calculate de nearest stops with the grid index (vectorized haversine over the nearby cells only)
 def find_nearby_stops(lat, lon, radius_km=1.0):
-    all_stops = st.session_state.all_stops.copy()
-    all_stops["distance_km"] = all_stops.apply(lambda row: haversine(lat, lon, row["lat"], row["lon"]), axis=1)
-    nearby = all_stops[all_stops["distance_km"] <= radius_km].sort_values("distance_km")
-    return nearby
+    return st.session_state.stop_index.within(lat, lon, radius_km)
+
+@st.cache_resource
+def get_timetable():
+    # Built with `python timetable.py`; None when it is missing
+    return Timetable.load()
 
-#2 Query, get arrival times of a specific stop
-def query_arrival_times(stop_id, time_str):
+@st.cache_resource
+def get_journey_planner():
+    # Built with `python journey.py`; None when it is missing
+    return JourneyPlanner.load()
+
+#Date picker limited to the days the service calendar covers: an old feed
+#masks every service on later dates, so today is clamped into its range
+def service_date_input(calendar, key=None):
+    today = datetime.now().date()
+    if calendar is None:
+        return st.date_input("Date", value=today, key=key)
+    first, last = calendar.date_range()
+    value = min(max(today, first), last)
+    if value != today:
+        st.warning(f"The GTFS feed only covers {first} to {last}; showing {value} instead of today.")
+    return st.date_input("Date", value=value, min_value=first, max_value=last, key=key,
+                         help=f"Days covered by the GTFS feed: {first} to {last}")
+
+#2 Query, get arrival times of a specific stop (only services running on `day` when the index is available)
+def query_arrival_times(stop_id, time_str, day=None):
+    timetable = get_timetable()
+    if timetable is not None and timetable.has_stop(stop_id):
+        return timetable.next_departures(stop_id, time_str, n=10, day=day)
+    # No timetable index: ask GraphDB (the service calendar is not applied)
     query_template = f"""
     PREFIX ont: <http://crtm-urban-buses.org/opendata/handsOn/group11/ontology#>
     PREFIX schema: <http://schema.org/>
@@ -101,11 +123,8 @@ def query_arrival_times(stop_id, time_str):
     ORDER BY ?arrivalTime
     LIMIT 10
     """
-    sparql = SPARQLWrapper(GRAPHDB_URL)
-    sparql.setQuery(query_template)
-    sparql.setReturnFormat(JSON)
     try:
-        results = sparql.query().convert()
+        results = get_client(GRAPHDB_URL).query(query_template)
         return pd.DataFrame([
             {
                 "Line": r["lineName"]["value"],
@@ -118,8 +137,75 @@ def query_arrival_times(stop_id, time_str):
         st.error(f"Error querying GraphDB: {e}")
         return pd.DataFrame()
 
+#2b Next arrivals of several stops at once, within window_minutes of time_str: from the timetable index
+# (services running on `day`) where it knows the stop, else one VALUES query for all the other stops
+def query_next_arrivals(stop_ids, time_str, day=None, per_stop=3, window_minutes=60):
+    # GTFS times go past 24:00, so the end of the window does too
+    end = int(parse_gtfs_time([time_str])[0]) + window_minutes * 60
+    end_str = format_gtfs_time(end)
+    arrivals = {}
+    timetable = get_timetable()
+    if timetable is not None:
+        arrivals = {
+            stop_id: timetable.next_departures(stop_id, time_str, n=per_stop, day=day, until=end)
+            for stop_id in stop_ids if timetable.has_stop(stop_id)
+        }
+    remaining = [stop_id for stop_id in stop_ids if stop_id not in arrivals]
+    if not remaining:
+        return arrivals
+    query_template = f"""
+    PREFIX ont: <http://crtm-urban-buses.org/opendata/handsOn/group11/ontology#>
+    SELECT DISTINCT ?stopId ?lineName ?destination ?arrivalTime ?departureTime
+    WHERE {{
+        {{values}}
+        ?stop a ont:Stop ;
+              ont:stopId ?stopId .
+        ?stopTime a ont:StopTime ;
+                  ont:refersToStop ?stop ;
+                  ont:arrivalTime ?arrivalTime ;
+                  ont:departureTime ?departureTime ;
+                  ont:belongsToTrip ?trip .
+        ?trip a ont:Trip ;
+              ont:tripHeadsign ?destination ;
+              ont:belongsToRoute ?route .
+        ?route a ont:BusRoute ;
+               ont:routeShortName ?lineName .
+        FILTER(?arrivalTime > "{time_str}" && ?arrivalTime <= "{end_str}")
+    }}
+    ORDER BY ?stopId ?arrivalTime
+    """
+    try:
+        grouped = get_client(GRAPHDB_URL).batch(query_template, "stopId", remaining)
+    except Exception as e:
+        st.error(f"Error querying GraphDB: {e}")
+        return arrivals
+    return arrivals | {
+        stop_id: pd.DataFrame([
+            {
+                "Line": r["lineName"],
+                "Destination": r["destination"],
+                "Arrival": r["arrivalTime"],
+                "Departure": r["departureTime"]
+            } for r in rows[:per_stop]
+        ])
+        for stop_id, rows in grouped.items()
+    }
+
 #3 Given a line bus and direction, get route
+@st.cache_resource
+def get_line_index():
+    # Built with `python line_index.py`; None when it is missing
+    return LineIndex.load()
+
+def get_route_shape(line_id, direction="0"):
+    line_index = get_line_index()
+    return line_index.shape(line_id, direction) if line_index is not None else []
+
 def get_stops_by_direction(line_id, direction="0"):
+    line_index = get_line_index()
+    if line_index is not None and line_index.has_line(line_id, direction):
+        return line_index.stops(line_id, direction)
+    # No line index: ask GraphDB
     query_template = f"""
     PREFIX ont: <http://crtm-urban-buses.org/opendata/handsOn/group11/ontology#>
     PREFIX geo: <http://www.w3.org/2003/01/geo/wgs84_pos#>
@@ -145,11 +231,8 @@ def get_stops_by_direction(line_id, direction="0"):
     ORDER BY ASC(xsd:integer(?seq))
     LIMIT 100
     """
-    sparql = SPARQLWrapper(GRAPHDB_URL)
-    sparql.setQuery(query_template)
-    sparql.setReturnFormat(JSON)
     try:
-        results = sparql.query().convert()
+        results = get_client(GRAPHDB_URL).query(query_template)
         return [
             {
                 "Sequence": int(r["seq"]["value"]),
@@ -168,11 +251,13 @@ def get_stops_by_direction(line_id, direction="0"):
     # ==============================
 # --- SESSION STATE ---
 # ==============================
-if "edges_gdf" not in st.session_state:
-    st.session_state.edges_gdf, st.session_state.map_center = get_madrid_data()
+if "road_network" not in st.session_state:
+    st.session_state.road_network, st.session_state.map_center = get_madrid_data()
 if "all_stops" not in st.session_state:
     st.session_state.all_stops = get_all_stops()
-edges_gdf = st.session_state.edges_gdf
+if "stop_index" not in st.session_state:
+    st.session_state.stop_index = get_stop_index()
+road_network = st.session_state.road_network
 map_center = st.session_state.map_center
 
 # ==============================
@@ -181,7 +266,7 @@ map_center = st.session_state.map_center
 st.sidebar.title("Navigation Menu")
 app_mode = st.sidebar.radio(
     "Choose a tool:",
-    ("Find Nearby Stops", "Check Arrival Times", "Get Stop Coordinates by Line")
+    ("Find Nearby Stops", "Check Arrival Times", "Get Stop Coordinates by Line", "Plan a Journey")
 )
 
 # ==============================
@@ -230,9 +315,7 @@ if app_mode == "Find Nearby Stops":
         if st.button("✅ Confirm and search nearby stops") or st.session_state.nearby_results_map is not None:
             # Only compute if not already done
             if st.session_state.nearby_results_df.empty:
-                all_stops = st.session_state.all_stops.copy()
-                all_stops["distance_km"] = all_stops.apply(lambda row: haversine(lat, lon, row["lat"], row["lon"]), axis=1)
-                nearby_df = all_stops[all_stops["distance_km"] <= 1.0].sort_values("distance_km")
+                nearby_df = find_nearby_stops(lat, lon, 1.0)
                 st.session_state.nearby_results_df = nearby_df
 
                 if not nearby_df.empty:
@@ -257,6 +340,16 @@ if app_mode == "Find Nearby Stops":
             if not st.session_state.nearby_results_df.empty:
                 st.dataframe(st.session_state.nearby_results_df)
                 st_folium(st.session_state.nearby_results_map, width=1200, height=600, key="nearby_map_results")
+                if st.checkbox("Show next arrivals at these stops"):
+                    nearby_ids = st.session_state.nearby_results_df["stopId"].tolist()
+                    now = datetime.now()
+                    next_arrivals = query_next_arrivals(nearby_ids, now.strftime("%H:%M:%S"), day=now.date())
+                    # Nearest stops first, whichever source answered them
+                    for stop_id in nearby_ids:
+                        arrivals = next_arrivals.get(stop_id)
+                        if arrivals is not None and not arrivals.empty:
+                            st.write(f"**{stop_id}**")
+                            st.dataframe(arrivals)
             else:
                 st.info("No stops found within 1 km.")
 
@@ -265,14 +358,17 @@ if app_mode == "Find Nearby Stops":
 # ==============================
 elif app_mode == "Check Arrival Times":
     st.title("⏱️ Check Arrival Times")
-    col1, col2 = st.columns(2)
+    col1, col2, col3 = st.columns(3)
     with col1:
         stop_id_input = st.text_input("Stop ID")
     with col2:
+        timetable = get_timetable()
+        date_input = service_date_input(timetable.calendar if timetable is not None else None)
+    with col3:
         time_input = st.time_input("Show arrivals after")
 
     if st.button("Check Times") and stop_id_input:
-        arrivals_df = query_arrival_times(stop_id_input, time_input.strftime("%H:%M:%S"))
+        arrivals_df = query_arrival_times(stop_id_input, time_input.strftime("%H:%M:%S"), date_input)
         if not arrivals_df.empty:
             st.dataframe(arrivals_df)
         else:
@@ -318,7 +414,9 @@ elif app_mode == "Get Stop Coordinates by Line":
                     popup=f"{stop['Stop_Name']} ({stop['Stop_ID']}) Seq:{stop['Sequence']}"
                 ).add_to(m_route)
 
-            coords = [(s['Latitude'], s['Longitude']) for s in stops_list]
+            # Draw the real route shape when it is known, otherwise join the stops
+            coords = get_route_shape(line_input, direction_input) or \
+                [(s['Latitude'], s['Longitude']) for s in stops_list]
             folium.PolyLine(coords, color="red", weight=3, opacity=0.8).add_to(m_route)
 
             st.session_state.route_map_list.append(m_route)
@@ -331,4 +429,38 @@ elif app_mode == "Get Stop Coordinates by Line":
             width=1200,
             height=600,
             key=f"route_map_{len(st.session_state.route_map_list)}"
-        )
\ No newline at end of file
+        )
+
+# ==============================
+# --- PAGE 4: PLAN A JOURNEY ---
+# ==============================
+elif app_mode == "Plan a Journey":
+    st.title("🧭 Plan a Journey")
+    planner = get_journey_planner()
+    if planner is None:
+        st.info("The journey planner needs the connections table. Run `python journey.py --gtfs data/gtfs` once.")
+    else:
+        col1, col2 = st.columns(2)
+        with col1:
+            origin_input = st.text_input("From stop ID")
+            date_input = service_date_input(planner.calendar, key="journey_date")
+        with col2:
+            destination_input = st.text_input("To stop ID")
+            time_input = st.time_input("Leave after", key="journey_time")
+        arrive_by_enabled = st.checkbox("Arrive by")
+        arrive_by_input = st.time_input("Arrive by", key="journey_arrive_by") if arrive_by_enabled else None
+
+        if st.button("Plan") and origin_input and destination_input:
+            missing = [s for s in (origin_input, destination_input) if s not in planner.stop_pos]
+            if missing:
+                st.error(f"Unknown stop ID: {', '.join(missing)}")
+            else:
+                journeys = planner.plan(
+                    origin_input, destination_input, time_input.strftime("%H:%M:%S"), day=date_input,
+                    arrive_by=arrive_by_input.strftime("%H:%M:%S") if arrive_by_input else None
+                )
+                if not journeys:
+                    st.info("No journey found.")
+                for i, journey in enumerate(journeys, start=1):
+                    st.subheader(f"Option {i}: arrive {journey['arrival']} with {journey['buses']} bus(es)")
+                    st.dataframe(pd.DataFrame(journey["legs"]))
\ No newline at end of file
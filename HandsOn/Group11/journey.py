@@ -0,0 +1,290 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from stop_index import StopIndex
+from timetable import DATA_DIR, GTFS_DIR, ServiceCalendar, format_gtfs_time, parse_gtfs_time
+
+# ==============================
+# --- JOURNEY PLANNER ---
+# ==============================
+# Connection Scan Algorithm (CSA) over the GTFS timetable.
+# A connection is one bus hop between two consecutive stops of a trip.
+# All connections of the feed are kept in flat int32 arrays sorted by
+# departure time:
+#   dep_stop, arr_stop, dep_time, arr_time, trip
+# A query scans them once from the requested departure time. It keeps,
+# for every number of trips k (1..max_trips), the earliest arrival at
+# every stop, so the answer is the Pareto set of journeys: the fastest
+# one, and every journey with fewer changes that is still worth taking.
+#
+# Walking transfers between stops closer than WALK_RADIUS_KM come from
+# the stop grid index and are stored as footpath arrays (CSR layout).
+#
+# Build it with: python journey.py --gtfs data/gtfs
+
+CONNECTIONS_DIR = os.path.join(DATA_DIR, "connections")
+
+WALK_RADIUS_KM = 0.4
+WALK_SPEED_KMH = 4.5
+MAX_TRIPS = 4               # at most 3 changes
+MAX_DURATION = 3 * 3600     # connections departing later than this are not scanned
+CHUNK = 4096
+
+ARRAYS = ("dep_stop", "arr_stop", "dep_time", "arr_time", "trip",
+          "trip_route", "trip_service", "foot_offsets", "foot_targets", "foot_seconds",
+          "stop_lat", "stop_lon")
+INF = np.iinfo(np.int32).max
+
+
+class JourneyPlanner:
+    """Connections table, footpaths and the CSA query."""
+
+    def __init__(self, arrays, stop_ids, stop_names, trip_headsigns, route_names, calendar=None):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.stop_ids = list(stop_ids)
+        self.stop_pos = {stop_id: i for i, stop_id in enumerate(self.stop_ids)}
+        self.stop_names = list(stop_names)
+        self.trip_headsigns = list(trip_headsigns)
+        self.route_names = list(route_names)
+        self.calendar = calendar
+
+    def __len__(self):
+        return len(self.dep_time)
+
+    # ==============================
+    # --- BUILD / SAVE / LOAD ---
+    # ==============================
+    @classmethod
+    def from_gtfs(cls, gtfs_dir=GTFS_DIR):
+        stops = pd.read_csv(os.path.join(gtfs_dir, "stops.txt"), dtype=str,
+                            usecols=["stop_id", "stop_name", "stop_lat", "stop_lon"])
+        routes = pd.read_csv(os.path.join(gtfs_dir, "routes.txt"), dtype=str,
+                             usecols=["route_id", "route_short_name"])
+        trips = pd.read_csv(os.path.join(gtfs_dir, "trips.txt"), dtype=str,
+                            usecols=["route_id", "service_id", "trip_id", "trip_headsign"])
+        stop_times = pd.read_csv(os.path.join(gtfs_dir, "stop_times.txt"), dtype=str,
+                                 usecols=["trip_id", "arrival_time", "departure_time",
+                                          "stop_id", "stop_sequence"])
+
+        trip_route, route_ids = pd.factorize(trips["route_id"])
+        trip_service, service_ids = pd.factorize(trips["service_id"])
+        route_names = (routes.drop_duplicates("route_id").set_index("route_id")["route_short_name"]
+                       .reindex(route_ids).fillna("").tolist())
+
+        trip = pd.Index(trips["trip_id"]).get_indexer(stop_times["trip_id"])
+        stop = pd.Index(stops["stop_id"]).get_indexer(stop_times["stop_id"])
+        seq = pd.to_numeric(stop_times["stop_sequence"], errors="coerce").fillna(-1).to_numpy(np.int64)
+        arr = parse_gtfs_time(stop_times["arrival_time"])
+        dep = parse_gtfs_time(stop_times["departure_time"])
+        keep = (trip >= 0) & (stop >= 0) & (arr >= 0) & (dep >= 0)
+        trip, stop, seq, arr, dep = trip[keep], stop[keep], seq[keep], arr[keep], dep[keep]
+
+        # Consecutive stop times of the same trip form a connection
+        order = np.lexsort((seq, trip))
+        trip, stop, arr, dep = trip[order], stop[order], arr[order], dep[order]
+        hop = np.flatnonzero(trip[:-1] == trip[1:])
+        connections = {
+            "dep_stop": stop[hop].astype(np.int32),
+            "arr_stop": stop[hop + 1].astype(np.int32),
+            "dep_time": dep[hop].astype(np.int32),
+            "arr_time": arr[hop + 1].astype(np.int32),
+            "trip": trip[hop].astype(np.int32),
+        }
+        by_time = np.lexsort((connections["arr_time"], connections["dep_time"]))
+        arrays = {name: values[by_time] for name, values in connections.items()}
+
+        stop_lat = stops["stop_lat"].astype(float).to_numpy()
+        stop_lon = stops["stop_lon"].astype(float).to_numpy()
+        arrays.update(cls._footpaths(stop_lat, stop_lon))
+        arrays.update({
+            "trip_route": trip_route.astype(np.int32),
+            "trip_service": trip_service.astype(np.int32),
+            "stop_lat": stop_lat.astype(np.float32),
+            "stop_lon": stop_lon.astype(np.float32),
+        })
+        calendar = ServiceCalendar.from_gtfs(gtfs_dir, service_ids)
+        return cls(arrays, stops["stop_id"], stops["stop_name"].fillna(""),
+                   trips["trip_headsign"].fillna(""), route_names, calendar)
+
+    @staticmethod
+    def _footpaths(stop_lat, stop_lon):
+        """Walking transfers between stops within WALK_RADIUS_KM, as CSR arrays."""
+        index = StopIndex(pd.DataFrame({"lat": stop_lat, "lon": stop_lon}))
+        targets, seconds, offsets = [], [], [0]
+        for i, (lat, lon) in enumerate(zip(stop_lat, stop_lon)):
+            positions, dist = index.query_radius(lat, lon, WALK_RADIUS_KM)
+            other = positions != i
+            targets.append(positions[other])
+            seconds.append(np.ceil(dist[other] / WALK_SPEED_KMH * 3600))
+            offsets.append(offsets[-1] + int(other.sum()))
+        return {
+            "foot_offsets": np.asarray(offsets, dtype=np.int64),
+            "foot_targets": np.concatenate(targets).astype(np.int32) if targets else np.empty(0, np.int32),
+            "foot_seconds": np.concatenate(seconds).astype(np.int32) if seconds else np.empty(0, np.int32),
+        }
+
+    def save(self, path=CONNECTIONS_DIR):
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        strings = {"stop_ids": self.stop_ids, "stop_names": self.stop_names,
+                   "trip_headsigns": self.trip_headsigns, "route_names": self.route_names}
+        if self.calendar is not None:
+            np.save(os.path.join(path, "calendar.npy"), self.calendar.active)
+            strings["calendar_first_day"] = str(self.calendar.first_day)
+        with open(os.path.join(path, "strings.json"), "w", encoding="utf-8") as f:
+            json.dump(strings, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path=CONNECTIONS_DIR):
+        """Load a saved connections table (memory-mapped), or None if it was never built."""
+        if not os.path.exists(os.path.join(path, "strings.json")):
+            return None
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in ARRAYS}
+        with open(os.path.join(path, "strings.json"), encoding="utf-8") as f:
+            strings = json.load(f)
+        calendar = None
+        if "calendar_first_day" in strings:
+            calendar = ServiceCalendar(strings["calendar_first_day"],
+                                       np.load(os.path.join(path, "calendar.npy"), mmap_mode="r"))
+        return cls(arrays, strings["stop_ids"], strings["stop_names"],
+                   strings["trip_headsigns"], strings["route_names"], calendar)
+
+    # ==============================
+    # --- QUERY ---
+    # ==============================
+    def plan(self, origin, destination, depart_at, day=None, arrive_by=None, max_trips=MAX_TRIPS):
+        """
+        Pareto-optimal journeys (earliest arrival vs. number of buses) from
+        stop `origin` to stop `destination`, leaving after `depart_at`
+        (seconds or 'HH:MM:SS'). With `day` only the services running that
+        date are used; with `arrive_by` journeys arriving later are dropped.
+        """
+        depart_at, arrive_by = _seconds(depart_at), _seconds(arrive_by)
+        source, target = self.stop_pos[origin], self.stop_pos[destination]
+        n_stops = len(self.stop_ids)
+        K = max_trips
+
+        # tau[k][s]: earliest arrival at s with exactly k buses; best[s]: over all k
+        tau = [[INF] * n_stops for _ in range(K + 1)]
+        best = [INF] * n_stops
+        parent = [dict() for _ in range(K + 1)]
+        trip_k = {}                 # trip -> (fewest buses it was boarded with, boarding connection)
+
+        def reach(k, stop, time, how):
+            if time < tau[k][stop]:
+                tau[k][stop] = time
+                parent[k][stop] = how
+                if time < best[stop]:
+                    best[stop] = time
+                return True
+            return False
+
+        reach(0, source, depart_at, None)
+        self._walk(0, source, depart_at, reach)
+
+        active = None
+        if day is not None and self.calendar is not None:
+            active = self.calendar.services_on(day)[self.trip_service]
+
+        end_time = depart_at + MAX_DURATION if arrive_by is None else arrive_by
+        start = int(np.searchsorted(self.dep_time, depart_at, side="left"))
+        stop_scan = int(np.searchsorted(self.dep_time, end_time, side="right"))
+        walk_only = tau[0][target]
+        done = False
+        for chunk in range(start, stop_scan, CHUNK):
+            end = min(chunk + CHUNK, stop_scan)
+            index = np.arange(chunk, end)
+            if active is not None:
+                index = index[active[self.trip[chunk:end]]]
+            for c, u, v, td, ta, t in zip(index.tolist(), self.dep_stop[index].tolist(),
+                                          self.arr_stop[index].tolist(), self.dep_time[index].tolist(),
+                                          self.arr_time[index].tolist(), self.trip[index].tolist()):
+                # Later connections can only give journeys dominated by the
+                # direct (or walking) one found so far
+                if td >= tau[1][target] or td >= walk_only:
+                    done = True
+                    break
+                boarded = trip_k.get(t)
+                if boarded is None and best[u] > td:
+                    continue
+                k = boarded[0] if boarded else K + 1
+                # Board with fewer buses if the stop was reached in time
+                for j in range(k - 1):
+                    if tau[j][u] <= td:
+                        k = j + 1
+                        trip_k[t] = (k, c)
+                        break
+                if k > K:
+                    continue
+                if reach(k, v, ta, ("bus", trip_k[t][1], c)):
+                    self._walk(k, v, ta, reach)
+            if done:
+                break
+
+        return self._journeys(source, target, tau, parent, arrive_by)
+
+    def _walk(self, k, stop, time, reach):
+        lo, hi = int(self.foot_offsets[stop]), int(self.foot_offsets[stop + 1])
+        for other, seconds in zip(self.foot_targets[lo:hi].tolist(), self.foot_seconds[lo:hi].tolist()):
+            reach(k, other, time + seconds, ("walk", stop, seconds))
+
+    def _journeys(self, source, target, tau, parent, arrive_by):
+        journeys, fastest = [], INF
+        for k in range(len(tau)):
+            arrival = tau[k][target]
+            if arrival >= fastest or (arrive_by is not None and arrival > arrive_by):
+                continue
+            fastest = arrival
+            journeys.append(self._legs(k, target, parent, arrival))
+        return journeys
+
+    def _legs(self, k, stop, parent, arrival):
+        legs = []
+        while parent[k].get(stop) is not None:
+            how = parent[k][stop]
+            if how[0] == "walk":
+                _, previous, seconds = how
+                legs.append({"mode": "walk", "from": self.stop_ids[previous], "to": self.stop_ids[stop],
+                             "minutes": round(seconds / 60, 1)})
+                stop = previous
+            else:
+                _, first, last = how
+                trip = int(self.trip[first])
+                legs.append({
+                    "mode": "bus",
+                    "line": self.route_names[int(self.trip_route[trip])],
+                    "headsign": self.trip_headsigns[trip],
+                    "from": self.stop_ids[int(self.dep_stop[first])],
+                    "to": self.stop_ids[int(self.arr_stop[last])],
+                    "departure": format_gtfs_time(self.dep_time[first]),
+                    "arrival": format_gtfs_time(self.arr_time[last]),
+                })
+                stop = int(self.dep_stop[first])
+                k -= 1
+        legs.reverse()
+        return {"arrival": format_gtfs_time(arrival), "buses": sum(1 for l in legs if l["mode"] == "bus"),
+                "legs": legs}
+
+
+def _seconds(value):
+    if value is None or isinstance(value, (int, np.integer)):
+        return value
+    h, m, s = (int(x) for x in value.split(":"))
+    return h * 3600 + m * 60 + s
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the connections table used by the journey planner")
+    parser.add_argument("--gtfs", default=GTFS_DIR,
+                        help="GTFS directory (Group11 data/gtfs or Group06 data/raw)")
+    parser.add_argument("--output", default=CONNECTIONS_DIR)
+    args = parser.parse_args()
+    planner = JourneyPlanner.from_gtfs(args.gtfs)
+    planner.save(args.output)
+    print(f"Saved {len(planner)} connections and {len(planner.foot_targets)} footpaths to {args.output}")
@@ -0,0 +1,162 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from timetable import DATA_DIR, GTFS_DIR
+
+# ==============================
+# --- LINE / DIRECTION INDEX ---
+# ==============================
+# Ordered stops and shape of every (line, direction), precomputed from the
+# GTFS files. Each line/direction uses its most frequent stop pattern (the
+# sequence of stops most of its trips follow) and the shape of a trip with
+# that pattern. Everything is stored in flat arrays:
+#   stop_offsets[i]:stop_offsets[i + 1]    stops of line/direction i, in order
+#   shape_offsets[i]:shape_offsets[i + 1]  shape points of line/direction i
+#
+# Build it with: python line_index.py --gtfs data/gtfs
+
+LINES_DIR = os.path.join(DATA_DIR, "lines")
+
+ARRAYS = ("stop_offsets", "stop_codes", "stop_sequences", "shape_offsets", "shape_lat", "shape_lon",
+          "stop_lat", "stop_lon")
+
+
+class LineIndex:
+    """(routeShortName, directionId) -> ordered stops and shape polyline."""
+
+    def __init__(self, keys, arrays, stop_ids, stop_names):
+        self.keys = [tuple(key) for key in keys]
+        self.key_pos = {key: i for i, key in enumerate(self.keys)}
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.stop_ids = list(stop_ids)
+        self.stop_names = list(stop_names)
+
+    def __len__(self):
+        return len(self.keys)
+
+    # ==============================
+    # --- BUILD / SAVE / LOAD ---
+    # ==============================
+    @classmethod
+    def from_gtfs(cls, gtfs_dir=GTFS_DIR):
+        stops = pd.read_csv(os.path.join(gtfs_dir, "stops.txt"), dtype=str,
+                            usecols=["stop_id", "stop_name", "stop_lat", "stop_lon"])
+        routes = pd.read_csv(os.path.join(gtfs_dir, "routes.txt"), dtype=str,
+                             usecols=["route_id", "route_short_name"])
+        trips = pd.read_csv(os.path.join(gtfs_dir, "trips.txt"), dtype=str)
+        stop_times = pd.read_csv(os.path.join(gtfs_dir, "stop_times.txt"), dtype=str,
+                                 usecols=["trip_id", "stop_id", "stop_sequence"])
+        shapes_file = os.path.join(gtfs_dir, "shapes.txt")
+        shapes = pd.read_csv(shapes_file, dtype=str) if os.path.exists(shapes_file) else None
+
+        stop_times["stop"] = pd.Index(stops["stop_id"]).get_indexer(stop_times["stop_id"])
+        stop_times["seq"] = pd.to_numeric(stop_times["stop_sequence"], errors="coerce")
+        stop_times = stop_times[stop_times["stop"] >= 0].dropna(subset=["seq"])
+        stop_times = stop_times.sort_values(["trip_id", "seq"], kind="stable")
+        patterns = stop_times.groupby("trip_id", sort=False).agg(
+            stops=("stop", tuple), seqs=("seq", tuple))
+
+        trips = trips.merge(routes, on="route_id", how="left")
+        trips["direction_id"] = trips.get("direction_id", pd.Series("0", index=trips.index)).fillna("0")
+        trips = trips.join(patterns, on="trip_id", how="inner")
+
+        if shapes is not None:
+            shapes["seq"] = pd.to_numeric(shapes["shape_pt_sequence"], errors="coerce")
+            shapes = shapes.sort_values(["shape_id", "seq"], kind="stable")
+            shape_points = {shape_id: group for shape_id, group in shapes.groupby("shape_id", sort=False)}
+        else:
+            shape_points = {}
+
+        keys, stop_codes, stop_seqs, stop_offsets = [], [], [], [0]
+        shape_lat, shape_lon, shape_offsets = [], [], [0]
+        for (line, direction), group in trips.groupby(["route_short_name", "direction_id"], sort=True):
+            # Most frequent stop pattern of the line/direction, and a trip following it
+            pattern = group["stops"].value_counts().index[0]
+            trip = group[group["stops"] == pattern].iloc[0]
+            keys.append((line, direction))
+            stop_codes.extend(pattern)
+            stop_seqs.extend(int(s) for s in trip["seqs"])
+            stop_offsets.append(len(stop_codes))
+
+            points = shape_points.get(trip.get("shape_id"))
+            if points is not None:
+                shape_lat.extend(points["shape_pt_lat"].astype(float))
+                shape_lon.extend(points["shape_pt_lon"].astype(float))
+            shape_offsets.append(len(shape_lat))
+
+        arrays = {
+            "stop_offsets": np.asarray(stop_offsets, dtype=np.int64),
+            "stop_codes": np.asarray(stop_codes, dtype=np.int32),
+            "stop_sequences": np.asarray(stop_seqs, dtype=np.int32),
+            "shape_offsets": np.asarray(shape_offsets, dtype=np.int64),
+            "shape_lat": np.asarray(shape_lat, dtype=np.float32),
+            "shape_lon": np.asarray(shape_lon, dtype=np.float32),
+            "stop_lat": stops["stop_lat"].astype(float).to_numpy(dtype=np.float64),
+            "stop_lon": stops["stop_lon"].astype(float).to_numpy(dtype=np.float64),
+        }
+        return cls(keys, arrays, stops["stop_id"], stops["stop_name"].fillna(""))
+
+    def save(self, path=LINES_DIR):
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(path, "strings.json"), "w", encoding="utf-8") as f:
+            json.dump({"keys": self.keys, "stop_ids": self.stop_ids, "stop_names": self.stop_names},
+                      f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path=LINES_DIR):
+        """Load a saved index (memory-mapped), or None if it was never built."""
+        if not os.path.exists(os.path.join(path, "strings.json")):
+            return None
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in ARRAYS}
+        with open(os.path.join(path, "strings.json"), encoding="utf-8") as f:
+            strings = json.load(f)
+        return cls(strings["keys"], arrays, strings["stop_ids"], strings["stop_names"])
+
+    # ==============================
+    # --- QUERIES ---
+    # ==============================
+    def has_line(self, line, direction="0"):
+        return (str(line), str(direction)) in self.key_pos
+
+    def stops(self, line, direction="0"):
+        """Ordered stops in the format returned by get_stops_by_direction."""
+        pos = self.key_pos.get((str(line), str(direction)))
+        if pos is None:
+            return []
+        lo, hi = int(self.stop_offsets[pos]), int(self.stop_offsets[pos + 1])
+        return [
+            {
+                "Sequence": int(seq),
+                "Stop_ID": self.stop_ids[code],
+                "Stop_Name": self.stop_names[code],
+                "Latitude": float(self.stop_lat[code]),
+                "Longitude": float(self.stop_lon[code]),
+                "Direction": str(direction)
+            }
+            for code, seq in zip(self.stop_codes[lo:hi].tolist(), self.stop_sequences[lo:hi].tolist())
+        ]
+
+    def shape(self, line, direction="0"):
+        """Shape polyline as [(lat, lon), ...] (empty when the feed has no shape)."""
+        pos = self.key_pos.get((str(line), str(direction)))
+        if pos is None:
+            return []
+        lo, hi = int(self.shape_offsets[pos]), int(self.shape_offsets[pos + 1])
+        return list(zip(self.shape_lat[lo:hi].tolist(), self.shape_lon[lo:hi].tolist()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the ordered stops and shape of every line/direction")
+    parser.add_argument("--gtfs", default=GTFS_DIR)
+    parser.add_argument("--output", default=LINES_DIR)
+    args = parser.parse_args()
+    index = LineIndex.from_gtfs(args.gtfs)
+    index.save(args.output)
+    print(f"Saved {len(index)} line/directions to {args.output}")
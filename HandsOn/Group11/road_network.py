@@ -0,0 +1,97 @@
+import argparse
+import json
+import os
+from datetime import datetime
+
+# ==============================
+# --- ROAD NETWORK SNAPSHOT ---
+# ==============================
+# The app used to download and build the whole Madrid drive network with
+# osmnx on every cold start. The network is now downloaded once by this
+# script (python road_network.py) and saved locally:
+#   data/network/edges.parquet  edges with pre-simplified geometries (GeoParquet)
+#   data/network/meta.json      map center, place, counts and creation date
+# The app reads meta.json at startup (no network access) and only loads the
+# edges from Parquet the first time they are used.
+
+NETWORK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "network")
+EDGES_FILE = "edges.parquet"
+META_FILE = "meta.json"
+
+DEFAULT_PLACE = "Madrid, Spain"
+DEFAULT_CENTER = [40.4168, -3.7038]     # Puerta del Sol, used when there is no snapshot
+SIMPLIFY_TOLERANCE = 0.0005
+EDGE_COLUMNS = ["u", "v", "name", "highway", "length", "geometry"]
+
+
+class RoadNetwork:
+    """Local road network snapshot; the edges are loaded on first access."""
+
+    def __init__(self, path=NETWORK_DIR):
+        self.path = path
+        self.meta = {}
+        meta_file = os.path.join(path, META_FILE)
+        if os.path.exists(meta_file):
+            with open(meta_file, encoding="utf-8") as f:
+                self.meta = json.load(f)
+        self._edges = None
+
+    @property
+    def available(self):
+        return bool(self.meta) and os.path.exists(os.path.join(self.path, EDGES_FILE))
+
+    @property
+    def map_center(self):
+        return self.meta.get("map_center", DEFAULT_CENTER)
+
+    @property
+    def edges(self):
+        """GeoDataFrame of the drive network edges (None without a snapshot)."""
+        if self._edges is None and self.available:
+            import geopandas as gpd
+            self._edges = gpd.read_parquet(os.path.join(self.path, EDGES_FILE))
+        return self._edges
+
+
+def refresh_network(place=DEFAULT_PLACE, path=NETWORK_DIR):
+    """Download the drive network of `place` with osmnx and write the snapshot."""
+    import osmnx as ox
+
+    G = ox.graph_from_place(place, network_type="drive")
+    nodes_gdf, edges_gdf = ox.graph_to_gdfs(G)
+    center_point = nodes_gdf.unary_union.centroid
+
+    edges_gdf = edges_gdf.reset_index()
+    edges_gdf = edges_gdf[[c for c in EDGE_COLUMNS if c in edges_gdf.columns]].copy()
+    # osmnx stores several names/road types of merged edges as lists
+    for column in ("name", "highway"):
+        if column in edges_gdf.columns:
+            edges_gdf[column] = edges_gdf[column].map(
+                lambda v: ";".join(map(str, v)) if isinstance(v, list) else v
+            ).astype("category")
+    if "length" in edges_gdf.columns:
+        edges_gdf["length"] = edges_gdf["length"].astype("float32")
+    edges_gdf["geometry"] = edges_gdf["geometry"].simplify(tolerance=SIMPLIFY_TOLERANCE)
+
+    os.makedirs(path, exist_ok=True)
+    edges_gdf.to_parquet(os.path.join(path, EDGES_FILE), index=False)
+    meta = {
+        "place": place,
+        "map_center": [center_point.y, center_point.x],
+        "nodes": len(nodes_gdf),
+        "edges": len(edges_gdf),
+        "simplify_tolerance": SIMPLIFY_TOLERANCE,
+        "created": datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(os.path.join(path, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False)
+    return meta
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download the road network once and save it for the app")
+    parser.add_argument("--place", default=DEFAULT_PLACE)
+    parser.add_argument("--output", default=NETWORK_DIR, help="snapshot directory")
+    args = parser.parse_args()
+    meta = refresh_network(args.place, args.output)
+    print(f"Saved {meta['edges']} edges of {meta['place']} to {args.output} (center {meta['map_center']})")
@@ -0,0 +1,123 @@
+import math
+
+import numpy as np
+
+# ==============================
+# --- STOP SPATIAL INDEX ---
+# ==============================
+# Stops are bucketed in a regular lat/lon grid (CELL_DEG degrees per cell).
+# The stops are sorted by cell key, so the stops of one grid row between two
+# columns are a contiguous slice found with np.searchsorted. A query only
+# computes distances (vectorized haversine) for the stops of the cells that
+# intersect its bounding box.
+
+EARTH_RADIUS_KM = 6371.0
+CELL_DEG = 0.01          # ~1.1 km in latitude, ~0.85 km in longitude in Madrid
+
+
+def haversine_km(lat, lon, lats_rad, lons_rad):
+    """Distance in km from one point (degrees) to arrays of points (radians)."""
+    phi = math.radians(lat)
+    lam = math.radians(lon)
+    a = (np.sin((lats_rad - phi) / 2) ** 2
+         + math.cos(phi) * np.cos(lats_rad) * np.sin((lons_rad - lam) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class StopIndex:
+    """Radius and k-nearest stop lookups over a stops DataFrame (stopId, name, lat, lon)."""
+
+    def __init__(self, stops, cell_deg=CELL_DEG):
+        self.cell_deg = cell_deg
+        self.stops = stops.reset_index(drop=True)
+        if self.stops.empty:
+            self.keys = np.empty(0, dtype=np.int64)
+            self.order = np.empty(0, dtype=np.int64)
+            self.lat_rad = self.lon_rad = np.empty(0)
+            self.row0 = self.col0 = self.height = 0
+            self.width = 1
+            return
+
+        lat = self.stops["lat"].to_numpy(dtype=np.float64)
+        lon = self.stops["lon"].to_numpy(dtype=np.float64)
+        rows = np.floor(lat / cell_deg).astype(np.int64)
+        cols = np.floor(lon / cell_deg).astype(np.int64)
+        self.row0, self.col0 = rows.min(), cols.min()
+        self.height = int(rows.max() - self.row0) + 1
+        self.width = int(cols.max() - self.col0) + 1
+
+        keys = (rows - self.row0) * self.width + (cols - self.col0)
+        self.order = np.argsort(keys, kind="stable")
+        self.keys = keys[self.order]
+        # Coordinates in grid order, so candidate slices are contiguous
+        self.lat_rad = np.radians(lat[self.order])
+        self.lon_rad = np.radians(lon[self.order])
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _candidates(self, lat, lon, radius_km):
+        """Positions (in grid order) of the stops in the cells around the point."""
+        dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+        dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+
+        r_lo = max(math.floor((lat - dlat) / self.cell_deg) - self.row0, 0)
+        r_hi = min(math.floor((lat + dlat) / self.cell_deg) - self.row0, self.height - 1)
+        c_lo = max(math.floor((lon - dlon) / self.cell_deg) - self.col0, 0)
+        c_hi = min(math.floor((lon + dlon) / self.cell_deg) - self.col0, self.width - 1)
+        if r_lo > r_hi or c_lo > c_hi:
+            return np.empty(0, dtype=np.int64)
+
+        rows = np.arange(r_lo, r_hi + 1, dtype=np.int64) * self.width
+        starts = np.searchsorted(self.keys, rows + c_lo, side="left")
+        ends = np.searchsorted(self.keys, rows + c_hi, side="right")
+        lengths = ends - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        # Concatenate the ranges [start, end) without a Python loop
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return offsets + np.arange(total, dtype=np.int64)
+
+    def _result(self, positions, distances):
+        nearby = self.stops.iloc[self.order[positions]].copy()
+        nearby["distance_km"] = distances
+        return nearby
+
+    def query_radius(self, lat, lon, radius_km=1.0):
+        """(row positions in `stops`, distances in km) within radius_km, nearest first."""
+        candidates = self._candidates(lat, lon, radius_km)
+        dist = haversine_km(lat, lon, self.lat_rad[candidates], self.lon_rad[candidates])
+        keep = dist <= radius_km
+        candidates, dist = candidates[keep], dist[keep]
+        ranking = np.argsort(dist, kind="stable")
+        return self.order[candidates[ranking]], dist[ranking]
+
+    def within(self, lat, lon, radius_km=1.0):
+        """Stops within radius_km of (lat, lon), nearest first."""
+        positions, dist = self.query_radius(lat, lon, radius_km)
+        nearby = self.stops.iloc[positions].copy()
+        nearby["distance_km"] = dist
+        return nearby
+
+    def nearest(self, lat, lon, k=10, max_radius_km=None):
+        """The k stops nearest to (lat, lon), optionally no further than max_radius_km."""
+        k = min(k, len(self))
+        radius = self.cell_deg * 111.0
+        while True:
+            if max_radius_km is not None:
+                radius = min(radius, max_radius_km)
+            candidates = self._candidates(lat, lon, radius)
+            dist = haversine_km(lat, lon, self.lat_rad[candidates], self.lon_rad[candidates])
+            # Every stop within `radius` is a candidate, so once k of them are
+            # inside the circle the k nearest candidates are the k nearest overall
+            if (dist <= radius).sum() >= k or len(candidates) == len(self) \
+                    or radius == max_radius_km:
+                break
+            radius *= 2
+
+        if max_radius_km is not None:
+            keep = dist <= max_radius_km
+            candidates, dist = candidates[keep], dist[keep]
+        top = np.argsort(dist, kind="stable")[:k]
+        return self._result(candidates[top], dist[top])
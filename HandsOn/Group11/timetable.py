@@ -0,0 +1,279 @@
+import argparse
+import json
+import os
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+# ==============================
+# --- TIMETABLE INDEX ---
+# ==============================
+# Departures per stop, built once from the GTFS files (stop_times, trips,
+# routes) and saved as NumPy arrays:
+#   offsets[s]:offsets[s + 1]  entries of stop s, sorted by departure time
+#   departures / arrivals      int32 seconds since midnight (> 24h kept as is)
+#   trips / routes / services  int32 trip, route and service of each entry
+# The next departures of a stop are a binary search in its slice, so
+# "Check Times" no longer needs a SPARQL query.
+#
+# calendar.txt / calendar_dates.txt are expanded into a bitmap of active
+# services per date (ServiceCalendar). A dated query masks the entries of
+# services that do not run with one vectorized lookup per window.
+#
+# Build it with: python timetable.py --gtfs data/gtfs
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+GTFS_DIR = os.path.join(DATA_DIR, "gtfs")
+TIMETABLE_DIR = os.path.join(DATA_DIR, "timetable")
+
+ARRAYS = ("offsets", "departures", "arrivals", "trips", "routes", "services")
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+DAY = 24 * 3600
+COLUMNS = ["Line", "Destination", "Arrival", "Departure"]
+
+
+def parse_gtfs_time(values):
+    """'HH:MM:SS' strings to int32 seconds since midnight, -1 when missing."""
+    parts = pd.Series(values, dtype="string").str.strip().str.split(":", expand=True)
+    if parts.shape[1] < 3:
+        return np.full(len(parts), -1, dtype=np.int32)
+    hms = parts.iloc[:, :3].apply(pd.to_numeric, errors="coerce")
+    seconds = hms[0] * 3600 + hms[1] * 60 + hms[2]
+    return seconds.fillna(-1).to_numpy(dtype=np.int32)
+
+
+def format_gtfs_time(seconds):
+    """Seconds since midnight to 'HH:MM:SS' (hours can go past 24)."""
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def parse_gtfs_date(values):
+    """'YYYYMMDD' strings to datetime64[D]."""
+    return pd.to_datetime(pd.Series(values, dtype="string"), format="%Y%m%d").to_numpy().astype("datetime64[D]")
+
+
+class ServiceCalendar:
+    """active[d, s]: whether service s runs on day first_day + d."""
+
+    def __init__(self, first_day, active):
+        self.first_day = np.datetime64(first_day, "D")
+        self.active = active
+        self._none = np.zeros(active.shape[1], dtype=bool)
+
+    @classmethod
+    def from_gtfs(cls, gtfs_dir, service_ids):
+        """Expand calendar.txt and calendar_dates.txt for the given service ids (None if both are missing)."""
+        services = pd.Index(service_ids)
+        paths = [os.path.join(gtfs_dir, name) for name in ("calendar.txt", "calendar_dates.txt")]
+        calendar = pd.read_csv(paths[0], dtype=str) if os.path.exists(paths[0]) else None
+        exceptions = pd.read_csv(paths[1], dtype=str) if os.path.exists(paths[1]) else None
+        if calendar is None and exceptions is None:
+            return None
+
+        bounds = []
+        if calendar is not None:
+            starts, ends = parse_gtfs_date(calendar["start_date"]), parse_gtfs_date(calendar["end_date"])
+            bounds += [starts.min(), ends.max()]
+        if exceptions is not None:
+            exception_days = parse_gtfs_date(exceptions["date"])
+            bounds += [exception_days.min(), exception_days.max()]
+        first, last = min(bounds), max(bounds)
+        days = np.arange(first, last + np.timedelta64(1, "D"))
+        active = np.zeros((len(days), len(services)), dtype=bool)
+
+        if calendar is not None:
+            codes = services.get_indexer(calendar["service_id"])
+            known = codes >= 0
+            weekday = (days.astype(np.int64) + 3) % 7          # 1970-01-01 was a Thursday
+            flags = calendar[list(WEEKDAYS)].astype(np.int8).to_numpy(dtype=bool)
+            runs = ((days[:, None] >= starts[None, :]) & (days[:, None] <= ends[None, :])
+                    & flags[:, weekday].T)
+            active[:, codes[known]] |= runs[:, known]
+
+        if exceptions is not None:
+            codes = services.get_indexer(exceptions["service_id"])
+            offsets = (exception_days - first).astype(np.int64)
+            kind = exceptions["exception_type"].str.strip().to_numpy()
+            added = (codes >= 0) & (kind == "1")
+            removed = (codes >= 0) & (kind == "2")
+            active[offsets[added], codes[added]] = True
+            active[offsets[removed], codes[removed]] = False
+        return cls(first, active)
+
+    @property
+    def last_day(self):
+        return self.first_day + np.timedelta64(len(self.active) - 1, "D")
+
+    def date_range(self):
+        """(first, last) datetime.date the calendar covers."""
+        return self.first_day.astype(object), self.last_day.astype(object)
+
+    def covers(self, day):
+        return self.first_day <= np.datetime64(day, "D") <= self.last_day
+
+    def services_on(self, day):
+        """Boolean mask over services for a date (all False outside the calendar)."""
+        offset = int((np.datetime64(day, "D") - self.first_day).astype(np.int64))
+        if 0 <= offset < len(self.active):
+            return self.active[offset]
+        return self._none
+
+
+class Timetable:
+    """Sorted departures per stop with parallel trip/route arrays."""
+
+    def __init__(self, stop_ids, arrays, trip_headsigns, route_names, calendar=None):
+        self.stop_ids = list(stop_ids)
+        self.stop_pos = {stop_id: i for i, stop_id in enumerate(self.stop_ids)}
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.trip_headsigns = np.asarray(trip_headsigns, dtype=object)
+        self.route_names = np.asarray(route_names, dtype=object)
+        self.calendar = calendar
+
+    def __len__(self):
+        return len(self.departures)
+
+    # ==============================
+    # --- BUILD / SAVE / LOAD ---
+    # ==============================
+    @classmethod
+    def from_gtfs(cls, gtfs_dir=GTFS_DIR):
+        routes = pd.read_csv(os.path.join(gtfs_dir, "routes.txt"), dtype=str,
+                             usecols=["route_id", "route_short_name"])
+        trips = pd.read_csv(os.path.join(gtfs_dir, "trips.txt"), dtype=str,
+                            usecols=["route_id", "service_id", "trip_id", "trip_headsign"])
+        stop_times = pd.read_csv(os.path.join(gtfs_dir, "stop_times.txt"), dtype=str,
+                                 usecols=["trip_id", "arrival_time", "departure_time", "stop_id"])
+
+        trip_ids = pd.Index(trips["trip_id"])
+        trip_route, route_ids = pd.factorize(trips["route_id"])
+        trip_service, service_ids = pd.factorize(trips["service_id"])
+        route_names = (routes.drop_duplicates("route_id").set_index("route_id")["route_short_name"]
+                       .reindex(route_ids).fillna("").tolist())
+
+        entry_trip = trip_ids.get_indexer(stop_times["trip_id"])
+        departures = parse_gtfs_time(stop_times["departure_time"])
+        arrivals = parse_gtfs_time(stop_times["arrival_time"])
+        keep = (entry_trip >= 0) & (departures >= 0)
+
+        stop_codes, stop_ids = pd.factorize(stop_times["stop_id"][keep])
+        entry_trip, departures, arrivals = entry_trip[keep], departures[keep], arrivals[keep]
+
+        order = np.lexsort((departures, stop_codes))
+        stop_codes = stop_codes[order]
+        entry_trip = entry_trip[order].astype(np.int32)
+        arrays = {
+            "offsets": np.searchsorted(stop_codes, np.arange(len(stop_ids) + 1)).astype(np.int64),
+            "departures": departures[order],
+            "arrivals": arrivals[order],
+            "trips": entry_trip,
+            "routes": trip_route[entry_trip].astype(np.int32),
+            "services": trip_service[entry_trip].astype(np.int32),
+        }
+        calendar = ServiceCalendar.from_gtfs(gtfs_dir, service_ids)
+        return cls(stop_ids, arrays, trips["trip_headsign"].fillna("").tolist(), route_names, calendar)
+
+    def save(self, path=TIMETABLE_DIR):
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        strings = {"stop_ids": self.stop_ids,
+                   "trip_headsigns": self.trip_headsigns.tolist(),
+                   "route_names": self.route_names.tolist()}
+        if self.calendar is not None:
+            np.save(os.path.join(path, "calendar.npy"), self.calendar.active)
+            strings["calendar_first_day"] = str(self.calendar.first_day)
+        with open(os.path.join(path, "strings.json"), "w", encoding="utf-8") as f:
+            json.dump(strings, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path=TIMETABLE_DIR):
+        """Load a saved index (memory-mapped), or None if it was never built."""
+        if not os.path.exists(os.path.join(path, "strings.json")):
+            return None
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in ARRAYS}
+        with open(os.path.join(path, "strings.json"), encoding="utf-8") as f:
+            strings = json.load(f)
+        calendar = None
+        if "calendar_first_day" in strings:
+            calendar = ServiceCalendar(strings["calendar_first_day"],
+                                       np.load(os.path.join(path, "calendar.npy"), mmap_mode="r"))
+        return cls(strings["stop_ids"], arrays, strings["trip_headsigns"], strings["route_names"], calendar)
+
+    # ==============================
+    # --- QUERIES ---
+    # ==============================
+    def has_stop(self, stop_id):
+        return stop_id in self.stop_pos
+
+    def _scan(self, pos, after, n, active=None, shift=0):
+        """
+        Up to n distinct (seconds - shift, row) departures of stop `pos`
+        strictly after `after`, skipping services masked out by `active`.
+        """
+        lo, hi = int(self.offsets[pos]), int(self.offsets[pos + 1])
+        start = lo + int(np.searchsorted(self.departures[lo:hi], after, side="right"))
+
+        found, seen = [], set()
+        # Trips of different services often share line, headsign and time;
+        # they are shown once, like the SELECT DISTINCT of the SPARQL query
+        while start < hi and len(found) < n:
+            end = min(start + 4 * n, hi)
+            window = np.arange(start, end)
+            if active is not None:
+                window = window[active[self.services[start:end]]]
+            for i in window:
+                dep = int(self.departures[i]) - shift
+                row = (self.route_names[self.routes[i]], self.trip_headsigns[self.trips[i]],
+                       format_gtfs_time(int(self.arrivals[i]) - shift), format_gtfs_time(dep))
+                if row not in seen:
+                    seen.add(row)
+                    found.append((dep, row))
+                    if len(found) == n:
+                        break
+            start = end
+        return found
+
+    def next_departures(self, stop_id, after, n=10, day=None, until=None):
+        """
+        The next n departures from stop_id strictly after `after`
+        ('HH:MM:SS' or seconds), as the Line/Destination/Arrival/Departure
+        table shown by the app. With `until` (seconds) later departures
+        are dropped.
+
+        With a `day` (datetime.date) only the services running that day
+        are kept, plus the trips of the previous day's services that run
+        past midnight (GTFS times >= 24:00), shown with their clock time.
+        """
+        if isinstance(after, str):
+            h, m, sec = (int(x) for x in after.split(":"))
+            after = h * 3600 + m * 60 + sec
+        pos = self.stop_pos.get(stop_id)
+        if pos is None:
+            return pd.DataFrame(columns=COLUMNS)
+        if until is None:
+            until = np.inf
+        if day is None or self.calendar is None:
+            return pd.DataFrame([row for dep, row in self._scan(pos, after, n) if dep <= until], columns=COLUMNS)
+
+        today = self._scan(pos, after, n, self.calendar.services_on(day))
+        overnight = self._scan(pos, after + DAY, n, self.calendar.services_on(day - timedelta(days=1)), shift=DAY)
+        rows, seen = [], set()
+        for dep, row in sorted(today + overnight, key=lambda item: item[0]):
+            if dep <= until and row not in seen:
+                seen.add(row)
+                rows.append(row)
+        return pd.DataFrame(rows[:n], columns=COLUMNS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the timetable index from GTFS files")
+    parser.add_argument("--gtfs", default=GTFS_DIR, help="directory with stop_times.txt, trips.txt, routes.txt, calendar(_dates).txt")
+    parser.add_argument("--output", default=TIMETABLE_DIR)
+    args = parser.parse_args()
+    timetable = Timetable.from_gtfs(args.gtfs)
+    timetable.save(args.output)
+    print(f"Saved {len(timetable)} departures of {len(timetable.stop_ids)} stops to {args.output}")
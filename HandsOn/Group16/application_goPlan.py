@@ -1,120 +1,141 @@
+import os
+import sys
 import streamlit as st
-from SPARQLWrapper import SPARQLWrapper, JSON
 import pandas as pd
-import folium
 from streamlit_folium import st_folium
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SparqlTools"))
+from sparql_client import get_client
+from facets import FACETS, dataset_version, load_facets
+from normalize import MULTI_VALUED, NS, SCHEMA, concept_iri
+from event_index import EventIntervalIndex
+from event_map import aggregate_places, geojson_bytes, place_map, to_geojson
 
 
 
 
-# Initialize the SPARQL wrapper
+
+# Shared SPARQL client: keep-alive connection pool, gzip, retries and timeouts
 endpoint_url = "http://localhost:7200/repositories/handsOn5"
-sparql = SPARQLWrapper(endpoint_url)
-sparql.setReturnFormat(JSON)
+sparql = get_client(endpoint_url)
 
 def execute_sparql_query(query):
     """Execute a SPARQL query and return results."""
-    sparql.setQuery(query)
     try:
-        results = sparql.query().convert()
+        results = sparql.query(query)
         return results
     except Exception as e:
         st.error(f"An error occurred while querying: {e}")
         return None
 
-def extract_distinct_values(results, value_key):
-    """Extract distinct values from query results."""
-    values = set()
-    for result in results["results"]["bindings"]:
-        value = result[value_key]["value"].strip()
-        if ',' in value:
-            values.update(ac.strip() for ac in value.split(","))
-        else:
-            values.add(value)
-    return sorted(values)
-
-# Query to get accessibility options
-access_query = """
-PREFIX schema: <http://schema.org/>
-PREFIX ns: <http://goPlan.linkeddata.es/>
-PREFIX rr: <http://www.w3.org/ns/r2rml#>
-PREFIX xsd:<http://www.w3.org/2001/XMLSchema#>
-PREFIX rml: <http://semweb.mmlab.be/ns/rml#>
-PREFIX ql:  <http://semweb.mmlab.be/ns/ql#>
-PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-PREFIX vocab: <http://example.org#>
-PREFIX owl: <http://www.w3.org/2002/07/owl#> 
-
-SELECT DISTINCT ?access WHERE {
-  ?place a schema:Place ;
-         ns:accessibilityLevel ?access .
-}
-ORDER BY ?access
-"""
-access_results = execute_sparql_query(access_query)
-available_access = extract_distinct_values(access_results, 'access') if access_results else []
-
-# Query to get audience options
-audience_query = """
-PREFIX schema: <http://schema.org/>
-PREFIX ns: <http://goPlan.linkeddata.es/>
-PREFIX rr: <http://www.w3.org/ns/r2rml#>
-PREFIX xsd:<http://www.w3.org/2001/XMLSchema#>
-PREFIX rml: <http://semweb.mmlab.be/ns/rml#>
-PREFIX ql:  <http://semweb.mmlab.be/ns/ql#>
-PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-PREFIX vocab: <http://example.org#>
-PREFIX owl: <http://www.w3.org/2002/07/owl#> 
-
-SELECT DISTINCT ?audience WHERE {
-  ?event a schema:Event ;
-         schema:audience ?audience .
-}
-ORDER BY ?audience
-"""
-audience_results = execute_sparql_query(audience_query)
-available_audiences = extract_distinct_values(audience_results, 'audience') if audience_results else []
-
-# Query to get district options
-district_query = """
-PREFIX schema: <http://schema.org/>
-PREFIX ns: <http://goPlan.linkeddata.es/>
-
-SELECT DISTINCT ?district WHERE {
-  ?place a schema:Place ;
-         ns:district ?district .
-}
-ORDER BY ?district
-"""
-district_results = execute_sparql_query(district_query)
-available_districts = extract_distinct_values(district_results, 'district') if district_results else []
-
-# Query to get neighborhood options
-neighborhood_query = """
-PREFIX schema: <http://schema.org/>
-PREFIX ns: <http://goPlan.linkeddata.es/>
-
-SELECT DISTINCT ?neighborhood WHERE {
-  ?place a schema:Place ;
-         ns:neighborhood ?neighborhood .
-}
-ORDER BY ?neighborhood
-"""
-neighborhood_results = execute_sparql_query(neighborhood_query)
-available_neighborhoods = extract_distinct_values(neighborhood_results, 'neighborhood') if neighborhood_results else []
+# Facet dictionary (values + event counts of the four filters), computed in one
+# query and cached per dataset version instead of four queries per rerun
+@st.cache_data(ttl=60, show_spinner=False)
+def get_dataset_version():
+    return dataset_version(sparql)
+
+@st.cache_data(show_spinner=False)
+def get_facets(version):
+    return load_facets(sparql)
+
+@st.cache_data(show_spinner=False)
+def get_has_vocabulary(version):
+    """Whether the repository holds the normalized triples (normalize.py)."""
+    link_property = MULTI_VALUED[SCHEMA.audience][0]
+    return bool(sparql.query(f"ASK {{ ?event <{link_property}> ?audience }}").get("boolean"))
+
+# Interval index over the event dates: the events of a date window are found
+# before the query, which then only joins places for them
+@st.cache_resource(show_spinner=False)
+def get_event_index(version):
+    return EventIntervalIndex.from_sparql(sparql)
+
+try:
+    version = get_dataset_version()
+    facets = get_facets(version)
+    has_vocabulary = get_has_vocabulary(version)
+    event_index = get_event_index(version)
+except Exception as e:
+    st.error(f"An error occurred while querying: {e}")
+    facets = {name: {} for name in FACETS}
+    has_vocabulary = False
+    event_index = None
+
+available_audiences = list(facets["audience"])
+available_access = list(facets["access"])
+available_districts = list(facets["district"])
+available_neighborhoods = list(facets["neighborhood"])
+
+def facet_label(name):
+    """Sidebar label "value (number of events)" for a facet."""
+    return lambda value: f"{value} ({facets[name].get(value, 0)})"
 
 
 with st.sidebar:
 # Date range selection
   start_date = st.date_input("Start date", value=pd.to_datetime("2023-01-01"))
   end_date = st.date_input("End date", value=pd.to_datetime("2025-12-31"))
+  date_mode = st.radio("Events", ["Starting between the dates", "Running between the dates"])
   is_free_check = st.checkbox("Free", value=False)
-  selected_audiences = st.multiselect("Select Audiences", options=available_audiences)
-  selected_access = st.multiselect("Select Accessibility", options=available_access)
-  selected_districts = st.multiselect("Select Districts", options=available_districts)
-  selected_neighborhoods = st.multiselect("Select Neighborhoods", options=available_neighborhoods)
+  selected_audiences = st.multiselect("Select Audiences", options=available_audiences,
+                                      format_func=facet_label("audience"))
+  selected_access = st.multiselect("Select Accessibility", options=available_access,
+                                   format_func=facet_label("access"))
+  selected_districts = st.multiselect("Select Districts", options=available_districts,
+                                      format_func=facet_label("district"))
+  selected_neighborhoods = st.multiselect("Select Neighborhoods", options=available_neighborhoods,
+                                          format_func=facet_label("neighborhood"))
+
+
+def sparql_string(value):
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def build_filters():
+    """Filter clauses for the sidebar selections (only for the selected filters)."""
+    clauses = []
+    if is_free_check:
+        clauses.append('FILTER (lcase(str(?isFree)) = "gratuito") .')
+    if has_vocabulary:
+        # Normalized data: equality joins on the controlled-vocabulary IRIs
+        if selected_audiences:
+            values = " ".join(f"<{concept_iri(NS.audience, a)}>" for a in selected_audiences)
+            clauses.append(f"FILTER EXISTS {{ VALUES ?aud {{ {values} }} ?event ns:hasAudience ?aud . }}")
+        if selected_access:
+            clauses.append("FILTER (bound(?place)) .")
+        for a in selected_access:
+            clauses.append(f"FILTER EXISTS {{ ?place ns:hasAccessibility <{concept_iri(NS.accessibility, a)}> . }}")
+    else:
+        # Comma-joined literals (repository loaded without normalize.py)
+        if selected_audiences:
+            clauses.append("FILTER (" + " || ".join(
+                f"contains(lcase(str(?audience)), {sparql_string(a.lower())})" for a in selected_audiences) + ") .")
+        if selected_access:
+            clauses.append("FILTER (" + " && ".join(
+                f"contains(lcase(str(?access)), {sparql_string(a.lower())})" for a in selected_access) + ") .")
+    if selected_districts or selected_neighborhoods:
+        conditions = []
+        if selected_districts:
+            conditions.append(f"?district IN ({', '.join(sparql_string(d) for d in selected_districts)})")
+        if selected_neighborhoods:
+            conditions.append(f"?neighborhood IN ({', '.join(sparql_string(n) for n in selected_neighborhoods)})")
+        clauses.append("FILTER (" + " || ".join(conditions) + ") .")
+    return "\n  ".join(clauses)
+
+# Date window: events starting in it, or running at some point during it
+overlap = date_mode == "Running between the dates"
+if overlap:
+    date_filter = (f'FILTER (?startDate <= "{end_date.isoformat()}"^^xsd:date &&\n'
+                   f'          ?endDate >= "{start_date.isoformat()}"^^xsd:date)')
+else:
+    date_filter = (f'FILTER (?startDate >= "{start_date.isoformat()}"^^xsd:date &&\n'
+                   f'          ?startDate <= "{end_date.isoformat()}"^^xsd:date)')
 
+if event_index is not None:
+    window_events = (event_index.overlapping if overlap else event_index.starting_in)(start_date, end_date)
+    event_values = "VALUES ?event { " + " ".join(f"<{e}>" for e in window_events) + " }"
+else:
+    window_events = None
+    event_values = ""
 
 # Define the SPARQL query with date filters
 base_query = f"""
@@ -132,6 +153,9 @@ SELECT ?event ?eventName ?startDate ?endDate ?audience ?isFree
        ?place ?placeName ?latitude ?longitude
        ?access ?district ?neighborhood ?eventUrl ?placeUrl
 WHERE {{
+  # Eventos de la ventana de fechas (índice de intervalos)
+  {event_values}
+
   # Evento y sus datos básicos
   ?event a schema:Event ;
          ns:eventName ?eventName ;
@@ -155,29 +179,16 @@ WHERE {{
   }}
 
     # Filtro de fechas: tu dataset usa xsd:date (no dateTime)
-  FILTER (?startDate >= "{start_date.isoformat()}"^^xsd:date &&
-          ?startDate <= "{end_date.isoformat()}"^^xsd:date)
+  {date_filter}
 
   # Filtros dinámicos (se incluyen sólo si el usuario selecciona algo)
-  {"FILTER (lcase(str(?isFree)) = \"gratuito\") ." if is_free_check else ""}
-
-  {("FILTER (" + " || ".join([f'contains(lcase(str(?audience)), \"{a.lower()}\")' for a in selected_audiences]) + ") .")
-    if selected_audiences else ""}
-
-  {("FILTER (" + " && ".join([f'contains(lcase(str(?access)), \"{a.lower()}\")' for a in selected_access]) + ") .")
-    if selected_access else ""}
-
-  {("FILTER (" + " || ".join(
-       [f'contains(lcase(str(?district)), \"{d.lower()}\")' for d in selected_districts] +
-       [f'contains(lcase(str(?neighborhood)), \"{n.lower()}\")' for n in selected_neighborhoods]
-     ) + ") .")
-    if (selected_districts or selected_neighborhoods) else ""}
+  {build_filters()}
 }}
 ORDER BY ?startDate
 """
 
 # Ejecutar la query y procesar resultados
-event_results = execute_sparql_query(base_query)
+event_results = execute_sparql_query(base_query) if window_events is None or window_events else None
 
 data = []
 if event_results and event_results.get("results", {}).get("bindings"):
@@ -206,54 +217,16 @@ if event_results and event_results.get("results", {}).get("bindings"):
 if data:
     df = pd.DataFrame(data)
 
-    # Agrupar por coordenadas (evita múltiples pins en el mismo sitio)
-    grouped_df = df.groupby(['Latitude', 'Longitude'], dropna=True).agg({
-        'Event Name': lambda x: list(dict.fromkeys(x)),   # únicos manteniendo orden
-        'Start Date': lambda x: list(dict.fromkeys(x)),
-        'Audience':   lambda x: list(dict.fromkeys(x)),
-        'Event URL':  lambda x: list(dict.fromkeys(x)),
-        'Place':      'first',
-        'Place Url':  'first',
-        'Access':     'first',
-        'District':   'first',
-        'Neighborhood':'first'
-    }).reset_index()
-
-    m = folium.Map(location=[40.4168, -3.7038], zoom_start=12)
-
-    for _, row in grouped_df.iterrows():
-        popup_html = "<b>Events:</b>"
-        for name, start, aud, url in zip(
-            row['Event Name'],
-            row['Start Date'],
-            row['Audience'],
-            row['Event URL']
-        ):
-            popup_html += f"""
-            <div class="box" style="border:1px solid #000; border-radius:2px; padding:5px 3px; margin:5px auto;">
-              <a href="{url or '#'}" target="_blank">{name}</a><br>
-              <b>Start Date:</b> {start}<br>
-              <b>Audience:</b> {aud}
-            </div>
-            """
-
-        # Info del lugar
-        popup_html += f"""
-            <b>Place: </b>{row['Place'] or '—'}<br>
-            <b>Access:</b> {row['Access'] or '—'}<br>
-            <b>District:</b> {row['District'] or '—'}<br>
-            <b>Neighborhood:</b> {row['Neighborhood'] or '—'}<br>
-        """
-        if row['Place Url']:
-            popup_html += f'<a href="{row["Place Url"]}" target="_blank">More info</a>'
-
-        folium.Marker(
-            location=[row['Latitude'], row['Longitude']],
-            popup=folium.Popup(popup_html, max_width=320)
-        ).add_to(m)
+    # Agrupar por coordenadas (evita múltiples pins en el mismo sitio): un
+    # marcador por lugar, agrupados en clusters; el popup se genera al hacer clic
+    places, place_events, offsets = aggregate_places(df)
+    collection = to_geojson(places, place_events, offsets)
+    m = place_map(collection)
 
     st.write("### Map of Events")
-    st_folium(m, width=1300, height=800)
+    st_folium(m, width=1300, height=800, returned_objects=[])
+    st.download_button("Download places (GeoJSON)", geojson_bytes(collection),
+                       file_name="goplan_events.geojson", mime="application/geo+json")
 
     st.write("### Table")
     # Convierte fechas a datetime para ordenar
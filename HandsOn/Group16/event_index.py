@@ -0,0 +1,88 @@
+"""
+Interval index over the event dates (schema:startDate / schema:endDate).
+
+Built once per dataset version from a single query, it answers which
+events start in a date window, or run at some point during it, in
+logarithmic time. The application passes the matching events to the
+events query as a VALUES block, so places are only joined for them.
+
+Every (startDate, endDate) pair of an event is an interval; the intervals
+are kept in arrays sorted by start:
+  starting in [a, b]:  a <= start <= b             two binary searches
+  overlapping [a, b]:  start <= b and end >= a     the candidates have
+                       start in [a - longest, b]   (longest interval), so
+                       only those ends are checked
+"""
+import numpy as np
+
+DATES_QUERY = """
+PREFIX schema: <http://schema.org/>
+
+SELECT ?event ?startDate ?endDate WHERE {
+  ?event a schema:Event ;
+         schema:startDate ?startDate ;
+         schema:endDate ?endDate .
+}
+"""
+
+
+def to_day(value):
+    """xsd:date (or datetime.date) -> datetime64[D]; NaT if unparseable."""
+    try:
+        return np.datetime64(str(value)[:10], "D")
+    except ValueError:
+        return np.datetime64("NaT")
+
+
+class EventIntervalIndex:
+    """Event date intervals in arrays sorted by start date."""
+
+    def __init__(self, events, event_pos, starts, ends):
+        self.events = list(events)
+        order = np.argsort(starts, kind="stable")
+        self.event_pos = np.asarray(event_pos, dtype=np.int32)[order]
+        self.starts = np.asarray(starts, dtype="datetime64[D]")[order]
+        self.ends = np.asarray(ends, dtype="datetime64[D]")[order]
+        self.longest = (self.ends - self.starts).max() if len(self.starts) else np.timedelta64(0, "D")
+
+    def __len__(self):
+        return len(self.starts)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """From {event, startDate, endDate} rows; pairs with end < start are dropped."""
+        events, event_pos, starts, ends = [], [], [], []
+        positions = {}
+        for row in rows:
+            start, end = to_day(row["startDate"]), to_day(row["endDate"])
+            if np.isnat(start) or np.isnat(end) or end < start:
+                continue
+            pos = positions.get(row["event"])
+            if pos is None:
+                pos = positions[row["event"]] = len(events)
+                events.append(row["event"])
+            event_pos.append(pos)
+            starts.append(start)
+            ends.append(end)
+        return cls(events, event_pos, starts, ends)
+
+    @classmethod
+    def from_sparql(cls, client):
+        return cls.from_rows(client.select(DATES_QUERY))
+
+    def _events(self, positions):
+        return [self.events[i] for i in np.unique(positions)]
+
+    def starting_in(self, start, end):
+        """Events with a start date in [start, end]."""
+        lo = np.searchsorted(self.starts, to_day(start), side="left")
+        hi = np.searchsorted(self.starts, to_day(end), side="right")
+        return self._events(self.event_pos[lo:hi])
+
+    def overlapping(self, start, end):
+        """Events running at some point in [start, end]."""
+        start, end = to_day(start), to_day(end)
+        lo = np.searchsorted(self.starts, start - self.longest, side="left")
+        hi = np.searchsorted(self.starts, end, side="right")
+        hits = self.ends[lo:hi] >= start
+        return self._events(self.event_pos[lo:hi][hits])
@@ -0,0 +1,115 @@
+"""
+Event map for goPlan: events aggregated per place, clustered markers.
+
+aggregate_places() groups the event rows by coordinates with array
+operations (one sort, no per-group lambdas): every place gets its
+details and the slice [offsets[i], offsets[i + 1]) of a flat event table.
+to_geojson() turns that into a compact FeatureCollection (one Point per
+place, the events of the place as [name, start, audience, url] lists).
+
+place_map() draws the features with Leaflet.markercluster
+(FastMarkerCluster): markers are created in the browser from the compact
+rows, nearby places are clustered per zoom level, and the popup HTML of a
+place is only rendered when its marker is clicked.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+PLACE_COLUMNS = ["Place", "Place Url", "Access", "District", "Neighborhood"]
+EVENT_COLUMNS = ["Event Name", "Start Date", "Audience", "Event URL"]
+MADRID = [40.4168, -3.7038]
+
+# Builds the marker of a [lat, lon, properties] row; the popup is a function,
+# so Leaflet renders its HTML on click only
+POPUP_CALLBACK = """
+function (row) {
+    function esc(v) {
+        return String(v == null ? "—" : v).replace(/[&<>"]/g, function (c) {
+            return {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;"}[c];
+        });
+    }
+    var p = row[2];
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    marker.bindPopup(function () {
+        var html = "<b>Events:</b>";
+        p.events.forEach(function (e) {
+            html += '<div class="box" style="border:1px solid #000; border-radius:2px; padding:5px 3px; margin:5px auto;">'
+                 + '<a href="' + esc(e[3] || "#") + '" target="_blank">' + esc(e[0]) + '</a><br>'
+                 + '<b>Start Date:</b> ' + esc(e[1]) + '<br>'
+                 + '<b>Audience:</b> ' + esc(e[2]) + '</div>';
+        });
+        html += "<b>Place: </b>" + esc(p.place) + "<br>"
+              + "<b>Access:</b> " + esc(p.access) + "<br>"
+              + "<b>District:</b> " + esc(p.district) + "<br>"
+              + "<b>Neighborhood:</b> " + esc(p.neighborhood) + "<br>";
+        if (p.url) {
+            html += '<a href="' + esc(p.url) + '" target="_blank">More info</a>';
+        }
+        return html;
+    }, {maxWidth: 320});
+    return marker;
+}
+"""
+
+
+def aggregate_places(df):
+    """
+    Group event rows by coordinates.
+
+    Returns (places, events, offsets): one row per place (Latitude,
+    Longitude, PLACE_COLUMNS of its first event, Events), the distinct
+    events of all places sorted by place, and the CSR offsets of each
+    place's events in that table.
+    """
+    located = df.dropna(subset=["Latitude", "Longitude"])
+    codes = located.groupby(["Latitude", "Longitude"], sort=True).ngroup().to_numpy()
+    order = np.argsort(codes, kind="stable")
+    located, codes = located.iloc[order], codes[order]
+
+    first = np.r_[True, codes[1:] != codes[:-1]] if len(codes) else np.zeros(0, dtype=bool)
+    places = located.loc[first, ["Latitude", "Longitude"] + PLACE_COLUMNS].reset_index(drop=True)
+
+    # Distinct events per place, in query order
+    events = located[EVENT_COLUMNS].assign(place=codes)
+    events = events[~events.duplicated()]
+    offsets = np.r_[0, np.cumsum(np.bincount(events["place"].to_numpy(), minlength=len(places)))]
+    places["Events"] = np.diff(offsets)
+    return places, events[EVENT_COLUMNS].reset_index(drop=True), offsets
+
+
+def to_geojson(places, events, offsets):
+    """Compact FeatureCollection (dict) with the events of each place."""
+    rows = events.astype(object).where(events.notna(), None).to_numpy().tolist()
+    props = places[PLACE_COLUMNS].astype(object).where(places[PLACE_COLUMNS].notna(), None).to_numpy().tolist()
+    lats = places["Latitude"].round(6).tolist()
+    lons = places["Longitude"].round(6).tolist()
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [lon, lat]},
+            "properties": {
+                "place": place, "url": url, "access": access, "district": district,
+                "neighborhood": neighborhood, "events": rows[offsets[i]:offsets[i + 1]],
+            },
+        }
+        for i, (lat, lon, (place, url, access, district, neighborhood)) in enumerate(zip(lats, lons, props))
+    ]
+    return {"type": "FeatureCollection", "features": features}
+
+
+def geojson_bytes(collection):
+    return json.dumps(collection, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def place_map(collection, location=MADRID, zoom_start=12):
+    """Folium map with one clustered marker per place (popups built on click)."""
+    import folium
+    from folium.plugins import FastMarkerCluster
+
+    m = folium.Map(location=location, zoom_start=zoom_start)
+    data = [[f["geometry"]["coordinates"][1], f["geometry"]["coordinates"][0], f["properties"]]
+            for f in collection["features"]]
+    FastMarkerCluster(data, callback=POPUP_CALLBACK).add_to(m)
+    return m
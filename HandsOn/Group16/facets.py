@@ -0,0 +1,62 @@
+"""
+Facet dictionary for the goPlan sidebar filters.
+
+A single SPARQL query returns every event with its audience and the
+accessibility level, district and neighborhood of its place. The four value
+sets and their event counts are computed from those rows in one pass.
+Comma-joined literals ("Niños, Jóvenes") are split into separate values,
+as extract_distinct_values did.
+
+The application caches the dictionary per dataset version (the triple count
+of the repository), so Streamlit reruns only run the events query.
+"""
+from collections import defaultdict
+
+# Sidebar filter -> variable of FACET_QUERY
+FACETS = ("audience", "access", "district", "neighborhood")
+
+FACET_QUERY = """
+PREFIX schema: <http://schema.org/>
+PREFIX ns: <http://goPlan.linkeddata.es/>
+
+SELECT ?event ?audience ?access ?district ?neighborhood WHERE {
+  ?event a schema:Event .
+  OPTIONAL { ?event schema:audience ?audience . }
+  OPTIONAL {
+    ?event ns:hasPlace ?place .
+    ?place a schema:Place .
+    OPTIONAL { ?place ns:accessibilityLevel ?access . }
+    OPTIONAL { ?place ns:district ?district . }
+    OPTIONAL { ?place ns:neighborhood ?neighborhood . }
+  }
+}
+"""
+
+VERSION_QUERY = "SELECT (COUNT(*) AS ?triples) WHERE { ?s ?p ?o }"
+
+
+def split_values(value):
+    """Individual values of a (possibly comma-joined) literal."""
+    return [v.strip() for v in str(value).split(",") if v.strip()]
+
+
+def compute_facets(rows):
+    """{facet: {value: number of events}} from FACET_QUERY rows, values sorted."""
+    events = {name: defaultdict(set) for name in FACETS}
+    for row in rows:
+        for name in FACETS:
+            if name in row:
+                for value in split_values(row[name]):
+                    events[name][value].add(row["event"])
+    return {name: {value: len(events[name][value]) for value in sorted(events[name])}
+            for name in FACETS}
+
+
+def dataset_version(client):
+    """Cheap token that changes when the repository is reloaded."""
+    rows = client.select(VERSION_QUERY)
+    return rows[0]["triples"] if rows else ""
+
+
+def load_facets(client):
+    return compute_facets(client.select(FACET_QUERY))
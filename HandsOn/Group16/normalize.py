@@ -0,0 +1,80 @@
+"""
+Ingest-time normalization of the comma-joined goPlan literals.
+
+schema:audience ("Niños, Familias") and ns:accessibilityLevel ("1,5,6")
+are generated as single comma-separated literals, so the application had
+to filter them with contains(lcase(str(?x))) on every row. This stage
+explodes them into one triple per value, linked to controlled-vocabulary
+IRIs (skos:Concept with the original label):
+
+  ?event ns:hasAudience <http://goPlan.linkeddata.es/audience/ninos>
+  ?place ns:hasAccessibility <http://goPlan.linkeddata.es/accessibility/5>
+
+so the event filters become equality joins / VALUES blocks. The original
+literals are kept for display.
+
+Run after the RML mapping, then load the output into the repository
+(it is a build artifact, generated from rdf/output.ttl and not committed):
+    python normalize.py rdf/output.ttl rdf/output-normalized.ttl
+"""
+import argparse
+import re
+import unicodedata
+from urllib.parse import quote
+
+from rdflib import Graph, Literal, Namespace, URIRef
+from rdflib.namespace import RDF, SKOS
+
+from facets import split_values
+
+NS = Namespace("http://goPlan.linkeddata.es/")
+SCHEMA = Namespace("http://schema.org/")
+
+# literal property -> (new object property, vocabulary scheme IRI)
+MULTI_VALUED = {
+    SCHEMA.audience: (NS.hasAudience, NS.audience),
+    NS.accessibilityLevel: (NS.hasAccessibility, NS.accessibility),
+}
+
+
+def slug(value):
+    """Case- and accent-insensitive IRI segment: "Niños" -> "ninos"."""
+    text = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode("ascii")
+    return quote(re.sub(r"\s+", "-", text.strip().lower()), safe="-")
+
+
+def concept_iri(scheme, value):
+    return URIRef(f"{scheme}/{slug(value)}")
+
+
+def normalize(graph):
+    """Add the exploded triples and vocabulary concepts to graph; returns the number of links."""
+    links = 0
+    for literal_property, (link_property, scheme) in MULTI_VALUED.items():
+        graph.add((scheme, RDF.type, SKOS.ConceptScheme))
+        for subject, value in list(graph.subject_objects(literal_property)):
+            for part in split_values(value):
+                concept = concept_iri(scheme, part)
+                if (concept, RDF.type, SKOS.Concept) not in graph:
+                    graph.add((concept, RDF.type, SKOS.Concept))
+                    graph.add((concept, SKOS.prefLabel, Literal(part)))
+                    graph.add((concept, SKOS.inScheme, scheme))
+                graph.add((subject, link_property, concept))
+                links += 1
+    return links
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Explode comma-joined audience/accessibility literals")
+    parser.add_argument("input", nargs="?", default="rdf/output.ttl")
+    parser.add_argument("output", nargs="?", default="rdf/output-normalized.ttl")
+    args = parser.parse_args()
+
+    g = Graph()
+    g.parse(args.input, format="turtle")
+    g.bind("ns", NS)
+    g.bind("schema", SCHEMA)
+    g.bind("skos", SKOS)
+    links = normalize(g)
+    g.serialize(args.output, format="turtle")
+    print(f"Added {links} links; wrote {len(g)} triples to {args.output}")
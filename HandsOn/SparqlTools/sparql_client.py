@@ -0,0 +1,109 @@
+"""
+sparql_client.py
+Pooled SPARQL 1.1 Protocol client shared by the group applications.
+
+SPARQLWrapper opens a new HTTP connection for every query. This client
+keeps one requests.Session per endpoint, so all queries of an app reuse
+keep-alive connections from a pool. Responses are gzip-compressed,
+transient errors (connection resets, 502/503/504) are retried with
+backoff and every request has a connect/read timeout.
+
+batch() turns N lookups of the same query with a different key into
+one query with a VALUES block, and splits the rows back per key.
+
+Usage (from a group directory):
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "SparqlTools"))
+    from sparql_client import get_client
+
+    client = get_client("http://localhost:7200/repositories/handsOn5")
+    rows = client.select("SELECT ?s WHERE { ?s ?p ?o } LIMIT 10")
+    by_stop = client.batch(query_with_values_placeholder, "stopId", ["par_8_09568", "par_8_09571"])
+"""
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+SPARQL_JSON = "application/sparql-results+json"
+DEFAULT_TIMEOUT = (3.05, 60)        # (connect, read) seconds
+DEFAULT_RETRIES = 3
+DEFAULT_POOL_SIZE = 10
+DEFAULT_BATCH_SIZE = 200            # keys per VALUES block
+
+
+class SparqlError(Exception):
+    """The endpoint answered with an error (bad query, missing repository, ...)."""
+
+
+def sparql_literal(value):
+    """Plain string literal, escaped for inclusion in a query."""
+    escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n").replace("\r", "\\r")
+    return f'"{escaped}"'
+
+
+def sparql_iri(value):
+    return f"<{value}>"
+
+
+class SparqlClient:
+    """Keep-alive, retrying client for one SPARQL endpoint."""
+
+    def __init__(self, endpoint, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 pool_size=DEFAULT_POOL_SIZE):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=0.3, status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset({"GET", "POST"}), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Accept": SPARQL_JSON, "Accept-Encoding": "gzip, deflate"})
+
+    def query(self, sparql):
+        """Run a query and return the SPARQL JSON results (dict)."""
+        resp = self.session.post(self.endpoint, data={"query": sparql}, timeout=self.timeout)
+        if resp.status_code >= 400:
+            raise SparqlError(f"{resp.status_code} from {self.endpoint}: {resp.text[:500]}")
+        return resp.json()
+
+    def select(self, sparql):
+        """Run a SELECT query and return one {variable: value} dict per row."""
+        results = self.query(sparql)
+        return [{var: binding[var]["value"] for var in binding}
+                for binding in results["results"]["bindings"]]
+
+    def batch(self, template, var, keys, term=sparql_literal, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Run `template` once per batch of keys instead of once per key.
+
+        The template must contain a {values} placeholder where the VALUES
+        block binding ?var goes, and must select ?var. Returns
+        {key: [rows]} with a (possibly empty) list for every key.
+        """
+        keys = list(dict.fromkeys(str(k) for k in keys))
+        grouped = {key: [] for key in keys}
+        for start in range(0, len(keys), batch_size):
+            chunk = keys[start:start + batch_size]
+            values = f"VALUES ?{var} {{ {' '.join(term(k) for k in chunk)} }}"
+            for row in self.select(template.replace("{values}", values)):
+                if row.get(var) in grouped:
+                    grouped[row[var]].append(row)
+        return grouped
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_client(endpoint, **kwargs):
+    """Shared client (and connection pool) for an endpoint."""
+    with _lock:
+        if endpoint not in _clients:
+            _clients[endpoint] = SparqlClient(endpoint, **kwargs)
+        return _clients[endpoint]
@@ -0,0 +1,337 @@
+"""
+sparql_server.py
+Embedded SPARQL 1.1 Protocol endpoint standing in for GraphDB.
+
+The group applications expect a GraphDB server with their repository
+loaded (Group16 "handsOn5", Group09 "urban-sensors", ...). This server
+serves the RDF files of HandsOn/*/rdf instead:
+
+  GET  /repositories                       list of repositories
+  GET  /repositories/<name>?query=...      SPARQL query (URL-encoded)
+  POST /repositories/<name>                form field query=... or an
+                                           application/sparql-query body
+
+Every group directory with .ttl/.nt/.n3/.rdf files becomes a repository
+named after it (Group07, Group16, ...), plus the repository names the
+apps already use (ALIASES). More can be added with --repo NAME=PATH.
+
+Repositories are loaded on first use into the read-only CompactStore
+(Group07, flat NumPy arrays), so reads need no locking and many
+requests are served at once by a threaded server. Only query parsing,
+which is not thread-safe in RDFlib, is serialized. Results are cached
+in memory (LRU) per repository, query and format.
+
+Run:
+    python sparql_server.py --port 7200
+    python sparql_server.py --port 7200 --repo handsOn5=../Group16/rdf/output.ttl --preload
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from rdflib import Graph
+from rdflib.plugins.sparql import prepareQuery
+from rdflib.util import guess_format
+
+HANDSON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(HANDSON_DIR, "Group07", "app_linked_universities"))
+from compact_store import CompactStore  # noqa: E402
+
+
+RDF_EXTENSIONS = (".ttl", ".nt", ".n3", ".rdf", ".owl", ".nq", ".trig")
+
+# Repository names used by the applications -> group directory
+ALIASES = {
+    "handsOn5": "Group16",
+    "urban-sensors": "Group09",
+    "Test_Bike": "Group05",
+}
+
+RESULT_TYPES = {
+    "json": "application/sparql-results+json",
+    "xml": "application/sparql-results+xml",
+    "csv": "text/csv",
+}
+GRAPH_TYPES = {
+    "turtle": "text/turtle",
+    "nt": "application/n-triples",
+    "xml": "application/rdf+xml",
+}
+
+
+#############################################################
+# Repositories
+#############################################################
+
+def rdf_files(path):
+    """RDF files of a file or directory path (sorted)."""
+    if os.path.isfile(path):
+        return [path]
+    if not os.path.isdir(path):
+        return []
+    return sorted(os.path.join(path, name) for name in os.listdir(path)
+                  if name.lower().endswith(RDF_EXTENSIONS))
+
+
+class RepositoryLoadError(Exception):
+    """A data file of a repository could not be parsed."""
+
+
+class MalformedQuery(Exception):
+    """The query text could not be parsed."""
+
+
+class Repository:
+    """RDF files loaded lazily into a CompactStore-backed graph."""
+
+    def __init__(self, name, files):
+        self.name = name
+        self.files = files
+        self.graph = None
+        self.error = None
+        self.load_seconds = None
+        self._lock = threading.Lock()
+
+    def get_graph(self):
+        """The loaded graph; raises RepositoryLoadError (remembered, so a
+        broken file is not parsed again on every request)."""
+        with self._lock:
+            if self.error is not None:
+                raise self.error
+            if self.graph is None:
+                start = time.perf_counter()
+                g = Graph()
+                for path in self.files:
+                    try:
+                        g.parse(path, format=guess_format(path) or "turtle")
+                    except Exception as e:
+                        self.error = RepositoryLoadError(f"Cannot load {self.name} from {path}: {e}")
+                        print(self.error, flush=True)
+                        raise self.error
+                self.graph = Graph(store=CompactStore.from_graph(g), bind_namespaces="none")
+                self.load_seconds = time.perf_counter() - start
+                print(f"Loaded {self.name}: {len(self.graph)} triples from {len(self.files)} "
+                      f"file(s) in {self.load_seconds:.1f}s", flush=True)
+            return self.graph
+
+
+def discover_repositories(extra=()):
+    """Group directories with RDF files, the app aliases and NAME=PATH entries."""
+    repos = {}
+    for group in sorted(os.listdir(HANDSON_DIR)):
+        files = rdf_files(os.path.join(HANDSON_DIR, group, "rdf"))
+        if group.startswith("Group") and files:
+            repos[group] = Repository(group, files)
+    for alias, group in ALIASES.items():
+        if group in repos:
+            repos[alias] = repos[group]
+    for entry in extra:
+        name, _, path = entry.partition("=")
+        files = [f for p in path.split(",") for f in rdf_files(p)]
+        if not files:
+            raise SystemExit(f"No RDF files for repository {name}: {path}")
+        repos[name] = Repository(name, files)
+    return repos
+
+
+#############################################################
+# Query execution and cache
+#############################################################
+
+class ResultCache:
+    """Thread-safe LRU of serialized results."""
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.size <= 0:
+            return
+        with self._lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+_parse_lock = threading.Lock()
+
+
+def negotiate(accept, graph_result):
+    """(rdflib format, content type) for the Accept header."""
+    accept = accept or ""
+    types = GRAPH_TYPES if graph_result else RESULT_TYPES
+    for fmt, content_type in types.items():
+        if content_type in accept:
+            return fmt, content_type
+    fmt = "turtle" if graph_result else "json"
+    return fmt, types[fmt]
+
+
+def run_query(repo, sparql, accept):
+    """Evaluate a query on a repository; returns (content type, body bytes)."""
+    # The pyparsing grammar is shared module state: parse one query at a time
+    with _parse_lock:
+        try:
+            prepared = prepareQuery(sparql)
+        except Exception as e:
+            raise MalformedQuery(str(e)) from e
+    graph = repo.get_graph()
+    result = graph.query(prepared)
+    fmt, content_type = negotiate(accept, result.type in ("CONSTRUCT", "DESCRIBE"))
+    if content_type.startswith("text/"):
+        content_type += "; charset=utf-8"
+    return content_type, result.serialize(format=fmt, encoding="utf-8")
+
+
+#############################################################
+# HTTP
+#############################################################
+
+def make_handler(repos, cache):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"       # keep-alive
+        server_version = "HandsOnSPARQL/1.0"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def send_body(self, status, content_type, body):
+            if "gzip" in self.headers.get("Accept-Encoding", "") and len(body) > 1024:
+                body = gzip.compress(body, compresslevel=5)
+                encoding = "gzip"
+            else:
+                encoding = None
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Access-Control-Allow-Origin", "*")
+            if encoding:
+                self.send_header("Content-Encoding", encoding)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_error_text(self, status, message):
+            self.send_body(status, "text/plain; charset=utf-8", message.encode("utf-8"))
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = [p for p in url.path.split("/") if p]
+            if parts == ["repositories"]:
+                return self.list_repositories()
+            query = parse_qs(url.query).get("query", [None])[0]
+            self.handle_query(parts, query)
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            parts = [p for p in url.path.split("/") if p]
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length).decode("utf-8")
+            content_type = self.headers.get("Content-Type", "")
+            if content_type.startswith("application/sparql-query"):
+                query = body
+            else:
+                query = parse_qs(body).get("query", [None])[0]
+            self.handle_query(parts, query)
+
+        def do_OPTIONS(self):
+            self.send_response(204)
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
+            self.send_header("Access-Control-Allow-Headers", "Content-Type, Accept")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def list_repositories(self):
+            bindings = [
+                {"id": {"type": "literal", "value": name},
+                 "uri": {"type": "uri", "value": f"http://{self.headers.get('Host', 'localhost')}/repositories/{name}"},
+                 "title": {"type": "literal", "value": f"{len(repo.files)} file(s) from {repo.name}"},
+                 "readable": {"type": "literal", "value": "true"},
+                 "writable": {"type": "literal", "value": "false"}}
+                for name, repo in sorted(repos.items())
+            ]
+            data = {"head": {"vars": ["uri", "id", "title", "readable", "writable"]},
+                    "results": {"bindings": bindings}}
+            self.send_body(200, RESULT_TYPES["json"], json.dumps(data, indent=2).encode("utf-8"))
+
+        def handle_query(self, parts, query):
+            if len(parts) != 2 or parts[0] != "repositories":
+                return self.send_error_text(404, "Use /repositories/<name>")
+            repo = repos.get(parts[1])
+            if repo is None:
+                return self.send_error_text(404, f"Unknown repository: {parts[1]}")
+            if not query:
+                return self.send_error_text(400, "Missing query")
+
+            accept = self.headers.get("Accept", "")
+            key = (repo.name, query, accept)
+            cached = cache.get(key)
+            if cached is None:
+                try:
+                    cached = run_query(repo, query, accept)
+                except MalformedQuery as e:
+                    return self.send_error_text(400, f"MALFORMED QUERY: {e}")
+                except RepositoryLoadError as e:
+                    return self.send_error_text(503, str(e))
+                except Exception as e:
+                    return self.send_error_text(500, f"Query evaluation failed: {e}")
+                cache.put(key, cached)
+            self.send_body(200, *cached)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve HandsOn/*/rdf over the SPARQL 1.1 Protocol")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7200)
+    parser.add_argument("--repo", action="append", default=[],
+                        help="extra repository NAME=PATH (file or directory, comma-separated)")
+    parser.add_argument("--cache", type=int, default=512, help="cached results (0 disables the cache)")
+    parser.add_argument("--preload", action="store_true", help="load every repository at start-up")
+    args = parser.parse_args()
+
+    repos = discover_repositories(args.repo)
+    if args.preload:
+        for repo in set(repos.values()):
+            try:
+                repo.get_graph()
+            except RepositoryLoadError:
+                pass  # reported; its queries answer 503
+    # The grammar is built lazily on the first parse; build it before serving
+    prepareQuery("ASK { ?s ?p ?o }")
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(repos, ResultCache(args.cache)))
+    server.daemon_threads = True
+    print(f"SPARQL endpoint on http://{args.host}:{args.port}/repositories/<name> "
+          f"({', '.join(sorted(repos))})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main()